@@ -9,3 +9,4 @@ python manage.py create_gerencia
 python manage.py init_inventario
 
 
+python manage.py generar_derivados_imagenes  # Derivados de las imágenes subidas antes (omite las que ya los tienen)
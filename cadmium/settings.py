@@ -50,6 +50,7 @@ except ImportError:
     pass  # Cloudinary no instalado, se usará almacenamiento local
 
 MIDDLEWARE = [
+    'core.middleware.MetricasMiddleware',  # Primero para medir el request completo; solo activo con METRICAS_ACTIVAS=True
     'django.middleware.security.SecurityMiddleware',
     # Temporalmente deshabilitado para diagnosticar error 500
     # 'core.admin_security.AdminSecurityMiddleware',  # Protección del admin (fuerza bruta, rate limiting)
@@ -69,7 +70,8 @@ MIDDLEWARE = [
 if not DEBUG:
     try:
         import whitenoise
-        MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+        # Justo después de SecurityMiddleware
+        MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1, 'whitenoise.middleware.WhiteNoiseMiddleware')
     except ImportError:
         pass  # WhiteNoise no instalado, se usará otro método en producción
 
@@ -227,24 +229,73 @@ if not DEBUG:
     SECURE_CONTENT_TYPE_NOSNIFF = True
     X_FRAME_OPTIONS = 'DENY'
 
-# Configuración de caché para middleware de seguridad
-# En producción, usa Redis o Memcached. En desarrollo, usa caché en memoria
-if not DEBUG:
-    # En producción, se puede configurar Redis o Memcached
-    CACHES = {
-        'default': {
-            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-            'LOCATION': 'admin-security-cache',
-        }
-    }
-else:
-    # En desarrollo, usar caché en memoria
-    CACHES = {
-        'default': {
-            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-            'LOCATION': 'admin-security-cache',
-        }
+# Proxies de confianza delante de la aplicación (Render pone uno). core.limites.obtener_ip_cliente
+# toma la IP del cliente de X-Forwarded-For contando NUM_PROXIES entradas desde la derecha;
+# las entradas anteriores las escribe el cliente. Con 0 se usa REMOTE_ADDR.
+NUM_PROXIES = int(os.environ.get('NUM_PROXIES', '0' if DEBUG else '1'))
+
+# Caché compartido entre procesos (con varios workers de gunicorn, LocMemCache quedaría separado por proceso)
+# CACHE_BACKEND: 'redis' (usa REDIS_URL, requiere el paquete redis), 'db', 'file' o 'locmem'.
+# Por defecto: Redis si hay REDIS_URL; si no, LocMemCache (solo en desarrollo).
+# En producción (DEBUG=False) se exige Redis: los límites de requests y de login (core.limites)
+# necesitan un incr() atómico, y las páginas en caché (portada, contactos, catálogo) se
+# sirven sin consultas; con DatabaseCache incr() es leer + escribir y cada acierto es una
+# consulta SQL. 'db' y 'file' quedan para desarrollo (createcachetable crea la tabla de 'db').
+REDIS_URL = os.environ.get('REDIS_URL', '')
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or ('redis' if REDIS_URL else 'locmem')
+
+_BACKENDS_CACHE = {
+    'redis': ('django.core.cache.backends.redis.RedisCache', REDIS_URL),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'cadmium_cache'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.environ.get('CACHE_DIR', str(BASE_DIR / 'cache'))),
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'cadmium'),
+}
+if CACHE_BACKEND not in _BACKENDS_CACHE:
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured(f'CACHE_BACKEND debe ser uno de: {", ".join(_BACKENDS_CACHE)}')
+if not DEBUG and CACHE_BACKEND != 'redis':
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured(f'En producción el caché debe ser Redis (definir REDIS_URL); CACHE_BACKEND={CACHE_BACKEND} solo se permite con DEBUG=True')
+if CACHE_BACKEND == 'redis':
+    from django.core.exceptions import ImproperlyConfigured
+    if not REDIS_URL:
+        raise ImproperlyConfigured('CACHE_BACKEND=redis requiere REDIS_URL')
+    try:
+        import redis  # noqa: F401
+    except ImportError:
+        raise ImproperlyConfigured('CACHE_BACKEND=redis requiere el paquete redis (pip install -r requirements.txt)')
+
+# Un alias por subsistema sobre el mismo almacenamiento; el prefijo separa sus claves
+# ('default': uso general, 'inventario': catálogo y pronóstico, 'seguridad': bloqueos y límites de requests;
+# los módulos usan los de core/cache.py)
+CACHE_KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX', 'cadmium')
+_backend_cache, _ubicacion_cache = _BACKENDS_CACHE[CACHE_BACKEND]
+CACHES = {}
+for _alias in ['default', 'inventario', 'seguridad']:
+    CACHES[_alias] = {
+        'BACKEND': _backend_cache,
+        'LOCATION': _ubicacion_cache,
+        'KEY_PREFIX': f'{CACHE_KEY_PREFIX}:{_alias}',
     }
+    if CACHE_BACKEND != 'redis':
+        # Con el máximo por defecto (300) se descartarían claves de los límites por IP
+        CACHES[_alias]['OPTIONS'] = {'MAX_ENTRIES': 10000}
+
+# Auditoría: los registros se guardan en segundo plano y por lotes (core.auditoria_buffer)
+# Desactivar con AUDITORIA_ASINCRONA=False para volver a la escritura sincrónica
+AUDITORIA_ASINCRONA = os.environ.get('AUDITORIA_ASINCRONA', 'True') == 'True'
+AUDITORIA_BATCH_SIZE = int(os.environ.get('AUDITORIA_BATCH_SIZE', '50'))  # Registros por inserción
+AUDITORIA_FLUSH_INTERVAL = float(os.environ.get('AUDITORIA_FLUSH_INTERVAL', '2'))  # Segundos máximos en cola
+AUDITORIA_BUFFER_MAX = int(os.environ.get('AUDITORIA_BUFFER_MAX', '1000'))  # Sobre este límite se escribe sincrónicamente
+
+# Tareas en segundo plano (core.tareas): subida al storage y procesamiento de imágenes, etc.
+# Las ejecuta 'python manage.py run_worker'; con TAREAS_ASINCRONAS=False se ejecutan en el
+# mismo proceso del request al confirmarse la transacción (desarrollo sin worker)
+TAREAS_ASINCRONAS = os.environ.get('TAREAS_ASINCRONAS', 'True') == 'True'
+
+# Métricas de rendimiento por vista (core.middleware.MetricasMiddleware, ver /panel/metricas/)
+METRICAS_ACTIVAS = os.environ.get('METRICAS_ACTIVAS', 'False') == 'True'
+METRICAS_MUESTRAS_POR_RUTA = int(os.environ.get('METRICAS_MUESTRAS_POR_RUTA', '500'))  # Tamaño del buffer circular
 
 # Configuración de logging para seguridad
 LOGGING = {
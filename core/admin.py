@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import Usuario, Inventario, Asistencia, Pedido, DetallePedido, Auditoria
+from .models import Usuario, Inventario, Asistencia, Pedido, DetallePedido, Auditoria, ArchivoAuditoria, SolicitudRestablecimiento, MovimientoStock, SaldoStock, Tarea
+from .busqueda import buscar_auditoria
 
 
 @admin.register(Usuario)
@@ -18,7 +19,8 @@ class InventarioAdmin(admin.ModelAdmin):
     list_display = ['nombre', 'categoria', 'cantidad', 'precio_unitario', 'fecha_actualizacion']
     list_filter = ['categoria', 'fecha_creacion']
     search_fields = ['nombre', 'descripcion', 'categoria']
-    readonly_fields = ['fecha_creacion', 'fecha_actualizacion']
+    # La cantidad se cambia desde la aplicación para que quede registrada en MovimientoStock
+    readonly_fields = ['cantidad', 'fecha_creacion', 'fecha_actualizacion']
 
 
 @admin.register(Asistencia)
@@ -36,11 +38,13 @@ class DetallePedidoInline(admin.TabularInline):
 
 @admin.register(Pedido)
 class PedidoAdmin(admin.ModelAdmin):
-    list_display = ['codigo', 'fecha_creacion', 'usuario_creacion']
+    list_display = ['codigo', 'fecha_creacion', 'usuario_creacion', 'num_items', 'total']
     list_filter = ['fecha_creacion']
     search_fields = ['codigo', 'observaciones']
-    readonly_fields = ['fecha_creacion']
+    # total y num_items se mantienen automáticamente desde los detalles
+    readonly_fields = ['fecha_creacion', 'total', 'num_items']
     inlines = [DetallePedidoInline]
+    list_select_related = ['usuario_creacion']
 
 
 @admin.register(Auditoria)
@@ -52,6 +56,12 @@ class AuditoriaAdmin(admin.ModelAdmin):
     date_hierarchy = 'fecha_hora'
     ordering = ['-fecha_hora']
     
+    def get_search_results(self, request, queryset, search_term):
+        # Usar el índice de texto completo y ordenar por relevancia
+        if not search_term:
+            return queryset, False
+        return buscar_auditoria(queryset, search_term).order_by('-rango', '-fecha_hora'), False
+    
     def has_add_permission(self, request):
         # No permitir agregar registros manualmente
         return False
@@ -65,5 +75,69 @@ class AuditoriaAdmin(admin.ModelAdmin):
         return request.user.is_superuser
 
 
+@admin.register(ArchivoAuditoria)
+class ArchivoAuditoriaAdmin(admin.ModelAdmin):
+    list_display = ['mes', 'cantidad', 'fecha_actualizacion']
+    exclude = ['contenido']
+    readonly_fields = ['mes', 'cantidad', 'fecha_creacion', 'fecha_actualizacion']
+    ordering = ['-mes']
+    
+    def has_add_permission(self, request):
+        # Los archivos se generan con el comando archivar_auditoria
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
+@admin.register(SolicitudRestablecimiento)
+class SolicitudRestablecimientoAdmin(admin.ModelAdmin):
+    list_display = ['usuario', 'fecha_solicitud', 'fecha_atencion', 'atendida_por']
+    list_filter = ['fecha_atencion', 'fecha_solicitud']
+    search_fields = ['usuario__username', 'usuario__nombre', 'usuario__apellido']
+    list_select_related = ['usuario', 'atendida_por']
+    readonly_fields = ['fecha_solicitud']
+
+
+@admin.register(MovimientoStock)
+class MovimientoStockAdmin(admin.ModelAdmin):
+    list_display = ['producto', 'delta', 'motivo', 'usuario', 'fecha']
+    list_filter = ['motivo', 'fecha', 'producto__categoria']
+    search_fields = ['producto__nombre', 'usuario__username']
+    list_select_related = ['producto', 'usuario']
+    date_hierarchy = 'fecha'
+    
+    def has_add_permission(self, request):
+        # Los movimientos se registran al cambiar el stock; el libro solo crece
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SaldoStock)
+class SaldoStockAdmin(admin.ModelAdmin):
+    list_display = ['producto', 'fecha', 'cantidad']
+    list_filter = ['fecha', 'producto__categoria']
+    search_fields = ['producto__nombre']
+    list_select_related = ['producto']
+    
+    def has_add_permission(self, request):
+        # Los saldos se generan con el comando generar_saldos_stock
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tipo', 'estado', 'intentos', 'fecha_creacion', 'fecha_fin']
+    list_filter = ['estado', 'tipo']
+    search_fields = ['tipo', 'error']
+    date_hierarchy = 'fecha_creacion'
+    # Las tareas las crea la aplicación y las actualiza el worker (python manage.py run_worker)
+    readonly_fields = ['tipo', 'parametros', 'intentos', 'error', 'fecha_creacion', 'fecha_inicio', 'fecha_fin']
+    
+    def has_add_permission(self, request):
+        return False
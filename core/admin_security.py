@@ -1,10 +1,8 @@
 """
 Middleware y utilidades para mejorar la seguridad del Django Admin
 """
-import time
 import logging
 import os
-from django.core.cache import cache
 from django.http import HttpResponseForbidden, HttpResponse
 from django.utils.deprecation import MiddlewareMixin
 from django.contrib.auth import logout
@@ -13,6 +11,9 @@ from django.shortcuts import redirect
 from django.urls import resolve, reverse
 from django.utils import timezone
 
+from .cache import cache_seguridad as cache
+from .limites import obtener_ip_cliente
+
 logger = logging.getLogger('django.security')
 
 
@@ -43,10 +44,15 @@ class AdminSecurityMiddleware(MiddlewareMixin):
     LOCKOUT_TIME = 900  # Tiempo de bloqueo en segundos (15 minutos)
     RATE_LIMIT_REQUESTS = 60  # Máximo de requests por ventana de tiempo
     RATE_LIMIT_WINDOW = 60  # Ventana de tiempo en segundos (1 minuto)
+    RATE_LIMIT_ALGORITHM = 'ventana_deslizante'  # Ver core.limites.ALGORITMOS
     
     def __init__(self, get_response):
         self.get_response = get_response
         super().__init__(get_response)
+        from .limites import crear_limitador
+        self.limitador = crear_limitador(
+            self.RATE_LIMIT_ALGORITHM, self.RATE_LIMIT_REQUESTS, self.RATE_LIMIT_WINDOW, prefijo='admin'
+        )
     
     def process_request(self, request):
         """Procesa cada request antes de que llegue a la vista"""
@@ -129,13 +135,8 @@ class AdminSecurityMiddleware(MiddlewareMixin):
         return response
     
     def get_client_ip(self, request):
-        """Obtiene la IP real del cliente"""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+        """Obtiene la IP real del cliente (ver core.limites.obtener_ip_cliente)"""
+        return obtener_ip_cliente(request)
     
     def is_ip_blocked(self, ip_address):
         """Verifica si una IP está bloqueada"""
@@ -179,23 +180,8 @@ class AdminSecurityMiddleware(MiddlewareMixin):
             cache.set(attempt_key, attempts, self.LOCKOUT_TIME)
     
     def check_rate_limit(self, ip_address):
-        """Verifica el rate limit para una IP"""
-        rate_key = f'admin_rate_limit_{ip_address}'
-        requests = cache.get(rate_key, [])
-        
-        # Limpiar requests antiguos (fuera de la ventana de tiempo)
-        now = time.time()
-        requests = [req_time for req_time in requests if now - req_time < self.RATE_LIMIT_WINDOW]
-        
-        # Si se excede el límite, denegar
-        if len(requests) >= self.RATE_LIMIT_REQUESTS:
-            return False
-        
-        # Agregar el request actual
-        requests.append(now)
-        cache.set(rate_key, requests, self.RATE_LIMIT_WINDOW)
-        
-        return True
+        """Verifica el rate limit para una IP (estado de tamaño fijo en el caché, ver core.limites)"""
+        return self.limitador.permitir(ip_address)
 
 
 class AdminAccessLoggingMiddleware(MiddlewareMixin):
@@ -252,11 +238,6 @@ class AdminAccessLoggingMiddleware(MiddlewareMixin):
         return None
     
     def get_client_ip(self, request):
-        """Obtiene la IP real del cliente"""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+        """Obtiene la IP real del cliente (ver core.limites.obtener_ip_cliente)"""
+        return obtener_ip_cliente(request)
 
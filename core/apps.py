@@ -5,21 +5,7 @@ class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    def ready(self):
+        # Registrar las señales que invalidan el catálogo, la portada, los contactos y las páginas
+        # condicionales en caché, y las que generan los derivados de las imágenes subidas
+        from . import catalogo, condicional, contactos, imagenes, portada  # noqa: F401
@@ -0,0 +1,153 @@
+"""
+Archivado mensual de los registros de auditoría.
+
+Los registros antiguos se mueven desde Auditoria a ArchivoAuditoria (un registro por mes,
+con el contenido en JSON Lines comprimido con gzip). La tabla Auditoria queda pequeña y
+los meses archivados se pueden consultar en modo solo lectura desde el visor de auditoría.
+"""
+import gzip
+import json
+from datetime import date, datetime, time
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Auditoria, ArchivoAuditoria, Usuario
+
+CAMPOS_ARCHIVADOS = ['id', 'usuario_id', 'accion', 'modulo', 'descripcion', 'detalles', 'objeto_afectado']
+
+
+def restar_meses(fecha, meses):
+    """Retorna el primer día del mes que está 'meses' meses antes de fecha"""
+    indice = fecha.year * 12 + (fecha.month - 1) - meses
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def inicio_mes_siguiente(mes):
+    """Retorna el primer día del mes siguiente a mes"""
+    return restar_meses(mes, -1)
+
+
+def _inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def serializar_registro(registro, nombre_usuario=None):
+    """Convierte un registro de auditoría en un diccionario serializable a JSON"""
+    datos = {campo: getattr(registro, campo) for campo in CAMPOS_ARCHIVADOS}
+    datos['fecha_hora'] = registro.fecha_hora.isoformat()
+    # Se guarda el nombre por si el usuario se elimina después de archivar
+    datos['usuario_nombre'] = nombre_usuario
+    return datos
+
+
+def _comprimir(lineas):
+    return gzip.compress('\n'.join(lineas).encode('utf-8'))
+
+
+def _descomprimir(contenido):
+    texto = gzip.decompress(bytes(contenido)).decode('utf-8')
+    return [json.loads(linea) for linea in texto.splitlines() if linea]
+
+
+def archivar_mes(mes, tamano_lote=1000):
+    """
+    Mueve los registros de auditoría de un mes a su ArchivoAuditoria.
+
+    Si el mes ya tenía un archivo, los registros nuevos se agregan a él.
+    Todo ocurre en una transacción: si algo falla, los registros quedan en Auditoria.
+
+    Returns:
+        Cantidad de registros archivados
+    """
+    desde = _inicio_del_dia(mes)
+    hasta = _inicio_del_dia(inicio_mes_siguiente(mes))
+    registros = Auditoria.objects.filter(fecha_hora__gte=desde, fecha_hora__lt=hasta).select_related('usuario').order_by('fecha_hora', 'id')
+
+    with transaction.atomic():
+        lineas = []
+        ids = []
+        for registro in registros.iterator(chunk_size=tamano_lote):
+            nombre = registro.usuario.get_nombre_completo() if registro.usuario else None
+            lineas.append(json.dumps(serializar_registro(registro, nombre), ensure_ascii=False))
+            ids.append(registro.id)
+
+        if not ids:
+            return 0
+
+        archivo = ArchivoAuditoria.objects.select_for_update().filter(mes=mes).first()
+        if archivo:
+            existentes = [json.dumps(datos, ensure_ascii=False) for datos in _descomprimir(archivo.contenido)]
+            lineas = existentes + lineas
+        else:
+            archivo = ArchivoAuditoria(mes=mes)
+
+        archivo.contenido = _comprimir(lineas)
+        archivo.cantidad = len(lineas)
+        archivo.save()
+
+        for inicio in range(0, len(ids), tamano_lote):
+            Auditoria.objects.filter(id__in=ids[inicio:inicio + tamano_lote]).delete()
+
+    return len(ids)
+
+
+def meses_por_archivar(meses_a_conservar):
+    """Lista los meses (primer día) con registros más antiguos que el período a conservar"""
+    limite = restar_meses(timezone.localdate(), meses_a_conservar)
+    # datetimes() trunca en la zona horaria local, igual que los rangos de archivar_mes()
+    fechas = Auditoria.objects.filter(fecha_hora__lt=_inicio_del_dia(limite)).datetimes('fecha_hora', 'month')
+    return [fecha.date() for fecha in fechas]
+
+
+def leer_archivo(archivo):
+    """
+    Reconstruye los registros de un ArchivoAuditoria como instancias de Auditoria (no guardadas),
+    ordenados del más reciente al más antiguo, para mostrarlos con las mismas plantillas.
+    """
+    filas = _descomprimir(archivo.contenido)
+    usuarios = Usuario.objects.only('id', 'username', 'nombre', 'apellido').in_bulk(
+        {fila['usuario_id'] for fila in filas if fila.get('usuario_id')}
+    )
+
+    registros = []
+    for fila in filas:
+        registro = Auditoria(**{campo: fila.get(campo) for campo in CAMPOS_ARCHIVADOS})
+        registro.fecha_hora = datetime.fromisoformat(fila['fecha_hora'])
+        usuario = usuarios.get(fila.get('usuario_id'))
+        if usuario is None and fila.get('usuario_nombre'):
+            # Usuario eliminado: mostrar el nombre guardado al archivar
+            usuario = Usuario(username=fila['usuario_nombre'])
+        registro.usuario = usuario
+        registros.append(registro)
+
+    registros.sort(key=lambda r: (r.fecha_hora, r.id), reverse=True)
+    return registros
+
+
+def filtrar_registros_archivados(registros, filtros):
+    """Aplica en memoria los mismos filtros del visor de auditoría a registros archivados"""
+    texto = (filtros.get('search_query') or '').lower()
+    fecha_desde = filtros.get('fecha_desde')
+    fecha_hasta = filtros.get('fecha_hasta')
+
+    resultado = []
+    for registro in registros:
+        if filtros.get('modulo_filter') and registro.modulo != filtros['modulo_filter']:
+            continue
+        if filtros.get('accion_filter') and registro.accion != filtros['accion_filter']:
+            continue
+        if filtros.get('usuario_filter') and str(registro.usuario_id) != filtros['usuario_filter']:
+            continue
+        fecha = timezone.localtime(registro.fecha_hora).date().isoformat()
+        if fecha_desde and fecha < fecha_desde:
+            continue
+        if fecha_hasta and fecha > fecha_hasta:
+            continue
+        if texto:
+            nombre = registro.usuario.get_nombre_completo() if registro.usuario else ''
+            contenido = f"{registro.descripcion} {registro.objeto_afectado or ''} {nombre}".lower()
+            if texto not in contenido:
+                continue
+        resultado.append(registro)
+    return resultado
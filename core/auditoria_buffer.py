@@ -0,0 +1,123 @@
+"""
+Escritura diferida y por lotes de los registros de auditoría.
+
+registrar_auditoria() no inserta el registro dentro del request: lo deja en una
+cola en memoria y un hilo en segundo plano lo guarda con bulk_create cuando se
+acumula un lote (AUDITORIA_BATCH_SIZE) o cuando pasa el intervalo máximo
+(AUDITORIA_FLUSH_INTERVAL). La cola se vacía también al cerrar el proceso.
+Si la cola está llena, el registro se guarda de forma sincrónica como antes.
+"""
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class EscritorAuditoria:
+    """Cola en memoria con un hilo que guarda los registros de auditoría por lotes"""
+
+    def __init__(self, tamano_lote=50, intervalo=2.0, capacidad=1000):
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self.cola = queue.Queue(maxsize=capacidad)
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._lote_listo = threading.Event()
+
+    def encolar(self, registro):
+        """
+        Agrega un registro (instancia de Auditoria sin guardar) a la cola.
+
+        Returns:
+            True si quedó en la cola, False si la cola está llena
+        """
+        self._iniciar_hilo()
+        try:
+            self.cola.put_nowait(registro)
+        except queue.Full:
+            return False
+        if self.cola.qsize() >= self.tamano_lote:
+            self._lote_listo.set()
+        return True
+
+    def flush(self):
+        """Guarda inmediatamente todos los registros pendientes de la cola"""
+        while True:
+            lote = self._tomar_lote()
+            if not lote:
+                return
+            self._guardar(lote)
+
+    def _iniciar_hilo(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._ejecutar, name='auditoria-writer', daemon=True)
+                self._hilo.start()
+
+    def _ejecutar(self):
+        while True:
+            # Esperar a que haya un lote completo o a que venza el intervalo
+            self._lote_listo.wait(self.intervalo)
+            self._lote_listo.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Error al guardar registros de auditoría en segundo plano')
+
+    def _tomar_lote(self):
+        lote = []
+        while len(lote) < self.tamano_lote:
+            try:
+                lote.append(self.cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _guardar(self, lote):
+        from .models import Auditoria
+
+        close_old_connections()
+        try:
+            Auditoria.objects.bulk_create(lote)
+            return
+        except DatabaseError:
+            logger.warning('Falló la inserción por lotes de %s registros de auditoría, guardando uno por uno', len(lote))
+
+        # Guardar individualmente para no perder el lote completo por un registro inválido
+        for registro in lote:
+            registro.pk = None
+            try:
+                registro.save()
+            except IntegrityError:
+                # El usuario pudo haber sido eliminado mientras el registro estaba en la cola
+                registro.pk = None
+                registro.usuario = None
+                try:
+                    registro.save()
+                except DatabaseError:
+                    logger.exception('No se pudo guardar el registro de auditoría: %s', registro.descripcion)
+            except DatabaseError:
+                logger.exception('No se pudo guardar el registro de auditoría: %s', registro.descripcion)
+
+
+escritor_auditoria = EscritorAuditoria(
+    tamano_lote=getattr(settings, 'AUDITORIA_BATCH_SIZE', 50),
+    intervalo=getattr(settings, 'AUDITORIA_FLUSH_INTERVAL', 2.0),
+    capacidad=getattr(settings, 'AUDITORIA_BUFFER_MAX', 1000),
+)
+
+
+@atexit.register
+def _flush_al_salir():
+    """Guarda los registros pendientes cuando el proceso termina (ej. reinicio de gunicorn)"""
+    try:
+        escritor_auditoria.flush()
+    except Exception:
+        logger.exception('Error al guardar registros de auditoría pendientes al salir')
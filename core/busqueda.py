@@ -0,0 +1,107 @@
+"""
+Búsqueda de texto completo sobre los registros de auditoría.
+
+Usa el índice creado en la migración 0023_auditoria_busqueda:
+- PostgreSQL: columna tsvector 'busqueda' con índice GIN (ranking con ts_rank).
+- SQLite: tabla FTS5 'core_auditoria_fts' (ranking con bm25).
+Si el motor no tiene índice, se usa icontains como antes.
+
+Los nombres de usuario no forman parte del índice: la tabla de usuarios es pequeña,
+así que se resuelven primero los ids coincidentes y se filtra por usuario_id (indexado)
+en lugar de hacer JOIN contra toda la auditoría.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Usuario
+
+_PALABRA = re.compile(r'\w+', re.UNICODE)
+
+_fts_disponible = None
+
+
+def _terminos(texto):
+    """Separa el texto de búsqueda en palabras, descartando caracteres especiales"""
+    return _PALABRA.findall(texto or '')
+
+
+def indice_disponible():
+    """Indica si la base de datos actual tiene el índice de texto completo de auditoría"""
+    global _fts_disponible
+    if _fts_disponible is None:
+        tablas = connection.introspection.table_names()
+        if connection.vendor == 'sqlite':
+            _fts_disponible = 'core_auditoria_fts' in tablas
+        elif connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                columnas = connection.introspection.get_table_description(cursor, 'core_auditoria')
+            _fts_disponible = any(columna.name == 'busqueda' for columna in columnas)
+        else:
+            _fts_disponible = False
+    return _fts_disponible
+
+
+def _filtro_usuarios(texto):
+    """Q que coincide con los registros de usuarios cuyo nombre, apellido o username contiene el texto"""
+    usuarios = Usuario.objects.filter(
+        Q(username__icontains=texto) |
+        Q(nombre__icontains=texto) |
+        Q(apellido__icontains=texto)
+    ).values('pk')
+    return Q(usuario_id__in=usuarios)
+
+
+def buscar_auditoria(registros, texto):
+    """
+    Filtra un queryset de Auditoria por texto y lo anota con 'rango' (mayor = más relevante).
+
+    Args:
+        registros: QuerySet de Auditoria
+        texto: Texto ingresado por el usuario
+
+    Returns:
+        QuerySet filtrado y anotado con 'rango' (sin ordenar por rango)
+    """
+    terminos = _terminos(texto)
+    if not terminos:
+        return registros.annotate(rango=Value(0.0, output_field=FloatField()))
+
+    if not indice_disponible():
+        return registros.filter(
+            Q(descripcion__icontains=texto) |
+            Q(objeto_afectado__icontains=texto) |
+            _filtro_usuarios(texto)
+        ).annotate(rango=Value(0.0, output_field=FloatField()))
+
+    if connection.vendor == 'postgresql':
+        # Cada palabra como prefijo: "stock cafe" -> stock:* & cafe:*
+        consulta = ' & '.join(f'{termino}:*' for termino in terminos)
+        coincide = RawSQL(
+            "core_auditoria.busqueda @@ to_tsquery('spanish', %s)",
+            (consulta,),
+            output_field=BooleanField(),
+        )
+        rango = RawSQL(
+            "ts_rank(core_auditoria.busqueda, to_tsquery('spanish', %s))",
+            (consulta,),
+            output_field=FloatField(),
+        )
+    else:
+        consulta = ' '.join(f'"{termino}"*' for termino in terminos)
+        coincide = RawSQL(
+            "core_auditoria.id IN (SELECT rowid FROM core_auditoria_fts WHERE core_auditoria_fts MATCH %s)",
+            (consulta,),
+            output_field=BooleanField(),
+        )
+        # bm25 retorna valores negativos (más negativo = más relevante)
+        rango = RawSQL(
+            "coalesce((SELECT -bm25(core_auditoria_fts) FROM core_auditoria_fts "
+            "WHERE core_auditoria_fts MATCH %s AND rowid = core_auditoria.id), 0)",
+            (consulta,),
+            output_field=FloatField(),
+        )
+
+    return registros.filter(Q(coincide) | _filtro_usuarios(texto)).annotate(rango=rango)
@@ -0,0 +1,57 @@
+"""
+Cachés de cada subsistema (alias de CACHES en settings).
+
+Los módulos importan aquí el caché de su subsistema en lugar de crear el suyo:
+
+    from .cache import cache_inventario as cache
+
+Cada uno es un ConnectionProxy: en cada uso resuelve la conexión del hilo actual.
+
+ClaveVersionada es la versión de un contenido en caché (catálogo, portada, contactos...).
+"""
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.connection import ConnectionProxy
+
+# Contenido público: portada, contactos, GET condicional y derivados de imágenes
+# (es el alias 'default', el mismo que usa la etiqueta {% cache %} de las plantillas)
+cache_contenido = ConnectionProxy(caches, 'default')
+# Catálogo de productos y pronóstico de consumo
+cache_inventario = ConnectionProxy(caches, 'inventario')
+# Bloqueos de IP, límites de requests e intentos de login
+cache_seguridad = ConnectionProxy(caches, 'seguridad')
+
+
+class ClaveVersionada:
+    """
+    Número de versión de un contenido guardado en el caché.
+
+    El contenido se guarda bajo claves que incluyen version(); invalidar() incrementa la
+    versión al confirmarse la transacción en curso, así las entradas de versiones
+    anteriores dejan de leerse y simplemente vencen.
+    """
+
+    def __init__(self, alias, clave):
+        self.cache = ConnectionProxy(caches, alias)
+        self.clave = clave
+
+    def version(self):
+        """Versión vigente"""
+        version = self.cache.get(self.clave)
+        if version is None:
+            # Partir de la hora actual evita reutilizar contenido antiguo si el caché perdió la versión
+            self.cache.add(self.clave, time.time_ns(), None)
+            version = self.cache.get(self.clave)
+        return version
+
+    def _incrementar(self):
+        try:
+            self.cache.incr(self.clave)
+        except ValueError:
+            self.cache.set(self.clave, time.time_ns(), None)
+
+    def invalidar(self):
+        """Marca el contenido en caché como desactualizado cuando se confirme la transacción en curso"""
+        transaction.on_commit(self._incrementar)
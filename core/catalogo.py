@@ -0,0 +1,92 @@
+"""
+Catálogo de productos agrupado por categoría para inventario, productos, cambiar stock y el carrito.
+
+Los productos se leen en una sola consulta (solo las columnas que usan las plantillas)
+y se agrupan en Python según Inventario.CATEGORIA_CHOICES, así una categoría nueva
+aparece en todas las páginas sin cambiar las vistas.
+
+El catálogo ya serializado (con la URL de cada imagen resuelta) se guarda en el caché
+bajo una clave versionada. Cualquier cambio de un producto incrementa la versión al
+confirmarse la transacción: post_save/post_delete de Inventario, y llamadas explícitas
+a invalidar_catalogo() donde el stock se cambia con update()/bulk_update(), que no
+envían señales. Las entradas de versiones anteriores simplemente vencen.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import ClaveVersionada, cache_inventario as cache
+from .models import Inventario
+
+CAMPOS_CATALOGO = ['id', 'nombre', 'categoria', 'cantidad', 'precio_unitario', 'imagen']
+_version = ClaveVersionada('inventario', 'catalogo:version')
+DURACION_CACHE = 24 * 60 * 60
+
+
+def invalidar_catalogo():
+    """Marca el catálogo en caché como desactualizado cuando se confirme la transacción en curso"""
+    _version.invalidar()
+
+
+@receiver(post_save, sender=Inventario)
+@receiver(post_delete, sender=Inventario)
+def _invalidar_al_cambiar_producto(sender, **kwargs):
+    invalidar_catalogo()
+
+
+def serializar_producto(producto):
+    """Datos de un producto para las plantillas del catálogo (la URL de la imagen queda resuelta)"""
+    return {
+        'id': producto.id,
+        'nombre': producto.nombre,
+        'categoria': producto.categoria,
+        'cantidad': producto.cantidad,
+        'precio_unitario': producto.precio_unitario,
+        'imagen_url': producto.imagen.url if producto.imagen else '',
+    }
+
+
+def agrupar_por_categoria(productos):
+    """
+    Agrupa productos serializados (ya ordenados por nombre) en el orden de CATEGORIA_CHOICES.
+
+    Returns:
+        Lista de diccionarios con 'valor', 'nombre' y 'productos'; las categorías sin
+        productos se incluyen vacías y las que no están en CATEGORIA_CHOICES van al final
+    """
+    categorias = {valor: {'valor': valor, 'nombre': nombre, 'productos': []} for valor, nombre in Inventario.CATEGORIA_CHOICES}
+    for producto in productos:
+        categorias.setdefault(
+            producto['categoria'], {'valor': producto['categoria'], 'nombre': producto['categoria'].capitalize(), 'productos': []}
+        )['productos'].append(producto)
+    return list(categorias.values())
+
+
+def catalogo_por_categoria(request=None):
+    """
+    Catálogo agrupado por categoría (ver agrupar_por_categoria), desde el caché si está vigente.
+
+    Con request, el resultado se guarda además en el request y las llamadas siguientes
+    durante el mismo request no vuelven a consultar el caché.
+    """
+    if request is not None and hasattr(request, '_catalogo_por_categoria'):
+        return request._catalogo_por_categoria
+
+    clave = f'catalogo:{_version.version()}'
+    catalogo = cache.get(clave)
+    if catalogo is None:
+        productos = Inventario.objects.only(*CAMPOS_CATALOGO).order_by('nombre')
+        catalogo = agrupar_por_categoria([serializar_producto(producto) for producto in productos])
+        cache.set(clave, catalogo, DURACION_CACHE)
+
+    if request is not None:
+        request._catalogo_por_categoria = catalogo
+    return catalogo
+
+
+def productos_por_id(request=None):
+    """Productos del catálogo indexados por id"""
+    return {
+        producto['id']: producto
+        for categoria in catalogo_por_categoria(request)
+        for producto in categoria['productos']
+    }
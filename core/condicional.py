@@ -0,0 +1,136 @@
+"""
+GET condicional (ETag / Last-Modified) para las páginas de contenido públicas.
+
+Cada página declara los modelos que muestra. Su versión es, por modelo, el último
+fecha_actualizacion y la cantidad de filas (la cantidad detecta los borrados, que no
+cambian el máximo). Ese agregado se guarda en el caché y se borra al confirmarse
+cualquier post_save/post_delete de los modelos, así que una revalidación no consulta
+la base de datos.
+
+El ETag combina además la fecha de modificación de las plantillas de la página (cambia
+con cada despliegue) y lo que base.html muestra del usuario, porque la misma URL se ve
+distinta según la sesión. Con mensajes pendientes no se responde 304, para que la
+página los muestre.
+
+Las respuestas llevan Cache-Control: private, no-cache: el navegador guarda la página
+pero la revalida en cada visita, y un proxy compartido no la guarda.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache, wraps
+
+from django.contrib import messages
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.template.loader import get_template
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .cache import cache_contenido as cache
+from .models import Contacto, Evento, ImagenCarrusel, ManualInterno, Noticia
+
+DURACION_CACHE = 24 * 60 * 60
+
+# Página -> (modelos que muestra, plantillas con las que se renderiza)
+PAGINAS = {
+    'index': ([ImagenCarrusel, Evento, Noticia], ['core/index.html', 'core/base.html']),
+    'documentacion': ([ManualInterno], ['core/documentacion.html', 'core/base.html']),
+    'contactanos': ([Contacto], ['core/contactanos.html', 'core/base.html']),
+    'equipo': ([], ['core/equipo.html', 'core/base.html']),
+    'creditos': ([], ['core/creditos.html', 'core/base.html']),
+}
+
+
+def _clave(pagina):
+    return f'condicional:{pagina}'
+
+
+@receiver(post_save, sender=ImagenCarrusel)
+@receiver(post_delete, sender=ImagenCarrusel)
+@receiver(post_save, sender=Evento)
+@receiver(post_delete, sender=Evento)
+@receiver(post_save, sender=Noticia)
+@receiver(post_delete, sender=Noticia)
+@receiver(post_save, sender=ManualInterno)
+@receiver(post_delete, sender=ManualInterno)
+@receiver(post_save, sender=Contacto)
+@receiver(post_delete, sender=Contacto)
+def _invalidar_al_cambiar_contenido(sender, **kwargs):
+    """Borra, al confirmarse la transacción, el agregado de las páginas que muestran el modelo"""
+    claves = [_clave(pagina) for pagina, (modelos, _) in PAGINAS.items() if sender in modelos]
+    transaction.on_commit(lambda: cache.delete_many(claves))
+
+
+def _version_contenido(pagina):
+    """(último fecha_actualizacion, cantidades por modelo) de la página, desde el caché si está vigente"""
+    version = cache.get(_clave(pagina))
+    if version is None:
+        ultima = None
+        cantidades = []
+        for modelo in PAGINAS[pagina][0]:
+            agregado = modelo.objects.aggregate(ultima=Max('fecha_actualizacion'), cantidad=Count('id'))
+            cantidades.append(agregado['cantidad'])
+            if agregado['ultima'] is not None and (ultima is None or agregado['ultima'] > ultima):
+                ultima = agregado['ultima']
+        version = (ultima, cantidades)
+        cache.set(_clave(pagina), version, DURACION_CACHE)
+    return version
+
+
+@lru_cache(maxsize=None)
+def _rutas_plantillas(pagina):
+    return [get_template(nombre).origin.name for nombre in PAGINAS[pagina][1]]
+
+
+def _fecha_plantillas(pagina):
+    """Última modificación de las plantillas de la página (cambia con cada despliegue)"""
+    segundos = max(os.path.getmtime(ruta) for ruta in _rutas_plantillas(pagina))
+    return datetime.fromtimestamp(int(segundos), tz=dt_timezone.utc)
+
+
+def _usuario(request):
+    """Lo que base.html muestra del usuario (la misma página se ve distinta según la sesión)"""
+    user = request.user
+    if not user.is_authenticated:
+        return 'anonimo'
+    return f'{user.pk}:{user.nombre or user.username}:{user.es_administrador or user.is_superuser}:{user.es_colaborador}'
+
+
+def _validadores(request, pagina):
+    """(ETag, Last-Modified) de la página para este request; (None, None) si no debe responder 304"""
+    if not hasattr(request, '_validadores_condicionales'):
+        if len(messages.get_messages(request)):
+            request._validadores_condicionales = (None, None)
+        else:
+            ultima, cantidades = _version_contenido(pagina)
+            fecha = _fecha_plantillas(pagina)
+            if ultima is not None and ultima > fecha:
+                fecha = ultima
+            datos = f'{pagina}:{fecha.isoformat()}:{cantidades}:{_usuario(request)}'
+            etag = '"%s"' % hashlib.sha256(datos.encode('utf-8')).hexdigest()[:32]
+            request._validadores_condicionales = (etag, fecha)
+    return request._validadores_condicionales
+
+
+def pagina_condicional(pagina):
+    """
+    Decorador de vista: responde 304 Not Modified si la página no cambió desde la copia
+    que tiene el navegador (ver PAGINAS).
+    """
+    def decorador(vista):
+        vista_condicional = condition(
+            etag_func=lambda request, *args, **kwargs: _validadores(request, pagina)[0],
+            last_modified_func=lambda request, *args, **kwargs: _validadores(request, pagina)[1],
+        )(vista)
+
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            respuesta = vista_condicional(request, *args, **kwargs)
+            if respuesta.has_header('ETag'):
+                patch_cache_control(respuesta, private=True, no_cache=True)
+            return respuesta
+        return envoltura
+    return decorador
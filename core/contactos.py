@@ -0,0 +1,47 @@
+"""
+Lista pública de contactos de gerencia (contactanos_view) en caché.
+
+Los contactos activos se guardan ya serializados (la imagen, por su nombre en el storage)
+bajo una clave versionada; post_save/post_delete de Contacto incrementan la versión
+al confirmarse la transacción, y las vistas que usan update() llaman a
+invalidar_contactos(). Los contactos por defecto los crea la migración
+0028_contactos_por_defecto, así que la página no escribe en la base de datos.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import ClaveVersionada, cache_contenido as cache
+from .models import Contacto
+
+_version = ClaveVersionada('default', 'contactos:version')
+DURACION_CACHE = 24 * 60 * 60
+
+
+def invalidar_contactos():
+    """Marca la lista en caché como desactualizada cuando se confirme la transacción en curso"""
+    _version.invalidar()
+
+
+@receiver(post_save, sender=Contacto)
+@receiver(post_delete, sender=Contacto)
+def _invalidar_al_cambiar_contacto(sender, **kwargs):
+    invalidar_contactos()
+
+
+def contactos_activos():
+    """Contactos activos serializados y ordenados por orden y nombre, desde el caché si está vigente"""
+    clave = f'contactos:{_version.version()}'
+    contactos = cache.get(clave)
+    if contactos is None:
+        contactos = [
+            {
+                'nombre': contacto.nombre,
+                'cargo': contacto.cargo,
+                'email': contacto.email,
+                'telefono': contacto.telefono,
+                'imagen': contacto.imagen.name if contacto.imagen else '',
+            }
+            for contacto in Contacto.objects.filter(activo=True).order_by('orden', 'nombre')
+        ]
+        cache.set(clave, contactos, DURACION_CACHE)
+    return contactos
@@ -4,6 +4,7 @@ from django.contrib.auth.password_validation import validate_password
 from PIL import Image
 import re
 import os
+from datetime import datetime
 from .models import Usuario, Asistencia, RegistroFalla, RegistroLlamada, Inventario, Pedido, ImagenCarrusel, Evento, Noticia, Contacto, ManualInterno
 
 
@@ -61,14 +62,15 @@ def validar_imagen_evento_noticia(imagen):
     if extension not in extensiones_permitidas:
         raise ValidationError(f'Formato no permitido. Use: JPG, JPEG o PNG. Formato actual: {extension}')
     
-    # Validar que sea una imagen válida usando PIL
+    # Leer las dimensiones. forms.ImageField ya abrió y verificó el archivo con PIL y dejó
+    # la imagen en imagen.image; si no está, basta abrirla una vez (Image.open solo lee
+    # el encabezado). La decodificación completa ocurre en segundo plano, al generar los
+    # derivados (core.imagenes).
     try:
-        img = Image.open(imagen)
-        img.verify()
-        
-        # Reiniciar el archivo después de verificar
-        imagen.seek(0)
-        img = Image.open(imagen)
+        img = getattr(imagen, 'image', None)
+        if img is None:
+            img = Image.open(imagen)
+            imagen.seek(0)
         
         # Validar dimensiones (opcional pero recomendado)
         width, height = img.size
@@ -760,10 +762,43 @@ class EditarInventarioForm(forms.ModelForm):
         return cantidad
 
 
+class CampoVersionStock(forms.CharField):
+    """Campo oculto con la versión del stock (fecha_actualizacion en ISO 8601) leída al abrir el formulario"""
+    widget = forms.HiddenInput
+    
+    def __init__(self, **kwargs):
+        kwargs.setdefault('required', False)
+        super().__init__(**kwargs)
+    
+    def to_python(self, value):
+        value = super().to_python(value)
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            raise ValidationError('La versión del stock no es válida. Recarga la página e intenta nuevamente.')
+
+
 class CambiarStockForm(forms.Form):
     """Formulario simple para que colaboradores cambien solo la cantidad de stock"""
+    OPERACION_CHOICES = [
+        ('fijar', 'Fijar cantidad contada'),
+        ('sumar', 'Sumar unidades'),
+        ('restar', 'Restar unidades'),
+    ]
+    
+    operacion = forms.ChoiceField(
+        label='Operación',
+        choices=OPERACION_CHOICES,
+        initial='fijar',
+        widget=forms.RadioSelect(attrs={
+            'class': 'form-check-input'
+        })
+    )
+    version = CampoVersionStock()
     cantidad = forms.IntegerField(
-        label='Nueva Cantidad',
+        label='Cantidad',
         required=True,
         min_value=0,
         widget=forms.NumberInput(attrs={
@@ -779,6 +814,42 @@ class CambiarStockForm(forms.Form):
     )
 
 
+class ConteoStockForm(forms.Form):
+    """Cantidad contada de un producto en el conteo masivo de stock"""
+    producto_id = forms.IntegerField(widget=forms.HiddenInput())
+    version = CampoVersionStock()
+    cantidad = forms.IntegerField(
+        label='Conteo',
+        required=False,
+        min_value=0,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'min': '0',
+            'style': 'text-align: center; max-width: 120px;'
+        }),
+        error_messages={
+            'min_value': 'La cantidad no puede ser negativa'
+        }
+    )
+
+
+class BaseConteoStockFormSet(forms.BaseFormSet):
+    """Formset del conteo masivo: cada producto puede aparecer una sola vez"""
+    
+    def clean(self):
+        if any(self.errors):
+            return
+        vistos = set()
+        for form in self.forms:
+            producto_id = form.cleaned_data.get('producto_id')
+            if producto_id in vistos:
+                raise ValidationError('Un producto aparece más de una vez en el conteo')
+            vistos.add(producto_id)
+
+
+ConteoStockFormSet = forms.formset_factory(ConteoStockForm, formset=BaseConteoStockFormSet, extra=0)
+
+
 class EditarPrecioProductoForm(forms.ModelForm):
     """Formulario para editar solo el precio de un producto"""
     
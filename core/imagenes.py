@@ -0,0 +1,320 @@
+"""
+Derivados de las imágenes subidas (carrusel, eventos, noticias, contactos e inventario).
+
+Una imagen subida no se guarda en el storage dentro del request (con Cloudinary es una
+subida remota): queda en SubidaPendiente, en la base de datos que el proceso web
+comparte con el worker, y el registro conserva la imagen anterior (o ninguna) hasta
+que la tarea 'subir_imagen' (core.tareas, la ejecuta run_worker) la sube y se la
+asigna. Luego la tarea 'procesar_imagen', si el original tiene metadatos EXIF, lo
+reemplaza por una copia sin ellos (que se procesa en otra tarea) y si no, genera con
+Pillow versiones WebP y JPEG de cada ancho de ANCHOS, guardadas junto al original con
+default_storage:
+
+    carousel/foto.png -> carousel/foto_480w.webp, carousel/foto_480w.jpg, ...
+
+Si el original es más angosto que un ancho, ese derivado se guarda con el ancho del
+original (nunca se amplía). El storage puede guardar un derivado con otro nombre (por
+ejemplo, Cloudinary), así que el nombre que retorna save() se registra en DerivadoImagen
+y la etiqueta {% imagen_responsiva %} (core/templatetags) arma el srcset con esos
+registros; mientras una imagen no tenga derivados (por ejemplo, imágenes anteriores a
+este cambio; ver el comando generar_derivados_imagenes) se usa solo el original.
+
+Los derivados se borran (también en una tarea) al reemplazar o quitar la imagen o al
+borrar el registro.
+"""
+import hashlib
+import os
+from io import BytesIO
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps
+
+from .cache import cache_contenido as cache
+from .models import Contacto, DerivadoImagen, Evento, ImagenCarrusel, Inventario, Noticia, SubidaPendiente
+from .tareas import encolar, registrar_tarea
+
+ANCHOS = (480, 960, 1600)
+# Formato -> (extensión, opciones de Image.save)
+FORMATOS = {
+    'WEBP': ('webp', {'quality': 80, 'method': 6}),
+    'JPEG': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+MODELOS_CON_IMAGEN = (ImagenCarrusel, Evento, Noticia, Contacto, Inventario)
+# Modelos que las páginas públicas muestran con {% imagen_responsiva %} (ver _paginas_actualizadas)
+MODELOS_EN_PAGINAS = (ImagenCarrusel, Evento, Noticia, Contacto)
+# Cuánto se recuerdan los derivados de una imagen (o que todavía no tiene)
+DURACION_DISPONIBLES = 7 * 24 * 60 * 60
+DURACION_NO_DISPONIBLES = 5 * 60
+
+
+def nombre_derivado(nombre, ancho, extension):
+    """Nombre que se pide al storage para el derivado de 'nombre' con el ancho y la extensión dados"""
+    base, _ = os.path.splitext(nombre)
+    return f'{base}_{ancho}w.{extension}'
+
+
+def _clave_derivados(nombre):
+    return 'imagenes:derivados:' + hashlib.sha256(nombre.encode('utf-8')).hexdigest()[:32]
+
+
+def derivados(nombre):
+    """
+    Derivados guardados de la imagen 'nombre' (consulta la base de datos a lo más cada pocos minutos).
+
+    Returns:
+        Diccionario extensión -> lista de (nombre en el storage, ancho) ordenada por
+        ancho; vacío si la imagen todavía no tiene derivados
+    """
+    clave = _clave_derivados(nombre)
+    guardados = cache.get(clave)
+    if guardados is None:
+        guardados = {}
+        registros = DerivadoImagen.objects.filter(original=nombre).order_by('ancho').values_list('extension', 'nombre', 'ancho')
+        for extension, derivado, ancho in registros:
+            guardados.setdefault(extension, []).append((derivado, ancho))
+        cache.set(clave, guardados, DURACION_DISPONIBLES if guardados else DURACION_NO_DISPONIBLES)
+    return guardados
+
+
+def precargar_derivados(nombres):
+    """Carga en el caché, con una sola consulta, los derivados de las imágenes que no estén (ej. el carrusel)"""
+    claves = {_clave_derivados(nombre): nombre for nombre in nombres if nombre}
+    faltantes = {claves[clave] for clave in claves.keys() - cache.get_many(claves).keys()}
+    if not faltantes:
+        return
+    guardados = {nombre: {} for nombre in faltantes}
+    registros = DerivadoImagen.objects.filter(original__in=faltantes).order_by('ancho').values_list('original', 'extension', 'nombre', 'ancho')
+    for original, extension, derivado, ancho in registros:
+        guardados[original].setdefault(extension, []).append((derivado, ancho))
+    for nombre, derivados_imagen in guardados.items():
+        cache.set(_clave_derivados(nombre), derivados_imagen, DURACION_DISPONIBLES if derivados_imagen else DURACION_NO_DISPONIBLES)
+
+
+def _paginas_actualizadas(nombre):
+    """
+    Dentro de la transacción que cambia los derivados de 'nombre': al confirmarse, borra
+    los derivados en caché y marca como actualizados los registros que muestran la imagen.
+
+    El save() de cada registro cambia su fecha_actualizacion (y con ella el ETag y el
+    Last-Modified de core.condicional) y envía post_save, que invalida la portada, los
+    contactos y los validadores en caché: sin esto, una página renderizada antes de que
+    existieran los derivados seguiría en caché sin srcset. Inventario queda fuera porque su
+    fecha_actualizacion es la versión del stock (Inventario.version_stock).
+    """
+    # Se registra antes que las invalidaciones de los save() para que corra primero
+    transaction.on_commit(lambda: cache.delete(_clave_derivados(nombre)))
+    for modelo in MODELOS_EN_PAGINAS:
+        for instancia in modelo.objects.filter(imagen=nombre):
+            instancia.save(update_fields=['fecha_actualizacion'])
+
+
+def generar_derivados(nombre):
+    """
+    Genera y guarda los derivados de la imagen 'nombre' del storage (reemplaza los existentes).
+
+    Returns:
+        Cantidad de archivos guardados
+    """
+    with default_storage.open(nombre, 'rb') as archivo:
+        original = Image.open(archivo)
+        original.load()
+    # Respetar la orientación de las fotos de celulares
+    original = ImageOps.exif_transpose(original)
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info or original.mode in ('LA', 'PA') else 'RGB')
+
+    anteriores = set(DerivadoImagen.objects.filter(original=nombre).values_list('nombre', flat=True))
+    registros = []
+    for ancho in ANCHOS:
+        imagen = original
+        if original.width > ancho:
+            imagen = original.resize((ancho, max(1, round(original.height * ancho / original.width))), Image.LANCZOS)
+        for formato, (extension, opciones) in FORMATOS.items():
+            salida = imagen
+            if formato == 'JPEG' and imagen.mode == 'RGBA':
+                # JPEG no tiene transparencia: componer sobre fondo blanco
+                salida = Image.new('RGB', imagen.size, (255, 255, 255))
+                salida.paste(imagen, mask=imagen.getchannel('A'))
+            contenido = BytesIO()
+            salida.save(contenido, formato, **opciones)
+            destino = nombre_derivado(nombre, ancho, extension)
+            # Liberar el nombre pedido para que un storage local no agregue un sufijo; otros
+            # storages pueden cambiarlo igual, por eso se registra el nombre que retorna save()
+            if default_storage.exists(destino):
+                default_storage.delete(destino)
+            guardado = default_storage.save(destino, ContentFile(contenido.getvalue()))
+            registros.append(DerivadoImagen(original=nombre, ancho=ancho, extension=extension, nombre=guardado))
+
+    with transaction.atomic():
+        DerivadoImagen.objects.filter(original=nombre).delete()
+        DerivadoImagen.objects.bulk_create(registros)
+        _paginas_actualizadas(nombre)
+    # Los derivados anteriores que quedaron con otro nombre ya no se usan
+    for anterior in anteriores - {registro.nombre for registro in registros}:
+        if default_storage.exists(anterior):
+            default_storage.delete(anterior)
+    return len(registros)
+
+
+def eliminar_derivados(nombre):
+    """Borra del storage los derivados registrados de la imagen 'nombre'"""
+    with transaction.atomic():
+        guardados = list(DerivadoImagen.objects.filter(original=nombre).values_list('nombre', flat=True))
+        DerivadoImagen.objects.filter(original=nombre).delete()
+        _paginas_actualizadas(nombre)
+    for derivado in guardados:
+        if default_storage.exists(derivado):
+            default_storage.delete(derivado)
+
+
+def _en_uso(nombre):
+    """True si algún registro todavía usa la imagen 'nombre'"""
+    return any(modelo.objects.filter(imagen=nombre).exists() for modelo in MODELOS_CON_IMAGEN)
+
+
+def quitar_exif(nombre):
+    """
+    Guarda una copia del original sin metadatos EXIF (ubicación GPS, cámara...), aplicando
+    antes la orientación que indicaban, apunta los registros a la copia y recién entonces
+    borra el original: si algo falla antes, el original sigue intacto y en uso.
+
+    Returns:
+        Nombre de la copia, o None si el original no tenía EXIF
+    """
+    with default_storage.open(nombre, 'rb') as archivo:
+        original = Image.open(archivo)
+        original.load()
+    if not original.getexif():
+        return None
+    formato = original.format
+    imagen = ImageOps.exif_transpose(original)
+    contenido = BytesIO()
+    if formato == 'JPEG':
+        imagen.save(contenido, 'JPEG', quality=90, optimize=True)
+    else:
+        imagen.save(contenido, formato)
+    # El original todavía existe, así que el storage elige otro nombre para la copia
+    nuevo = default_storage.save(nombre, ContentFile(contenido.getvalue()))
+    try:
+        with transaction.atomic():
+            # save() envía las señales que invalidan las páginas en caché
+            for modelo in MODELOS_CON_IMAGEN:
+                for instancia in modelo.objects.filter(imagen=nombre):
+                    instancia.imagen.name = nuevo
+                    instancia.save(update_fields=['imagen'])
+            # Los derivados se generan en otra tarea, que se encola solo si los registros cambian
+            encolar('procesar_imagen', nombre=nuevo)
+    except Exception:
+        if nuevo != nombre:
+            default_storage.delete(nuevo)
+        raise
+    # Un storage que sobrescribe guarda la copia con el mismo nombre: no hay nada que borrar
+    if nuevo != nombre:
+        default_storage.delete(nombre)
+    return nuevo
+
+
+@registrar_tarea('procesar_imagen')
+def procesar_imagen(nombre):
+    """Tarea: quita los metadatos EXIF del original o, si no tiene, genera sus derivados"""
+    if not _en_uso(nombre):
+        # La imagen se reemplazó o borró antes de procesarla (o un intento anterior ya la
+        # reemplazó por su copia sin EXIF, que tiene su propia tarea)
+        return
+    if not default_storage.exists(nombre):
+        raise FileNotFoundError(f'La imagen {nombre} está en uso pero no existe en el storage')
+    if quitar_exif(nombre) is None:
+        generar_derivados(nombre)
+
+
+registrar_tarea('eliminar_derivados')(eliminar_derivados)
+
+
+@registrar_tarea('subir_imagen')
+def subir_imagen(subida):
+    """Tarea: sube al storage una imagen recibida en un request y la asigna a su registro"""
+    pendiente = SubidaPendiente.objects.filter(id=subida).first()
+    if pendiente is None:
+        # Ya se subió, o el registro se borró o recibió otra imagen antes
+        return
+    instancia = apps.get_model(pendiente.modelo).objects.filter(pk=pendiente.objeto_id).first()
+    if instancia is None:
+        pendiente.delete()
+        return
+    guardado = default_storage.save(pendiente.nombre, ContentFile(bytes(pendiente.contenido)))
+    anterior = instancia.imagen.name if instancia.imagen else ''
+    try:
+        with transaction.atomic():
+            # save() envía las señales que invalidan las páginas en caché
+            instancia.imagen = guardado
+            instancia.save(update_fields=['imagen'])
+            pendiente.delete()
+            if anterior:
+                encolar('eliminar_derivados', nombre=anterior)
+            encolar('procesar_imagen', nombre=guardado)
+    except Exception:
+        default_storage.delete(guardado)
+        raise
+
+
+def _subidas_pendientes(sender, pk):
+    return SubidaPendiente.objects.filter(modelo=sender._meta.label, objeto_id=pk)
+
+
+@receiver(pre_save)
+def _separar_subida(sender, instance, update_fields=None, **kwargs):
+    """
+    Si la imagen se sube o reemplaza, deja el archivo en la instancia para guardarlo en
+    SubidaPendiente (el worker lo sube al storage) y mientras tanto conserva la imagen
+    anterior. Si la imagen se quita, recuerda cuál era para borrar sus derivados.
+    """
+    if sender not in MODELOS_CON_IMAGEN or kwargs.get('raw'):
+        return
+    if update_fields is not None and 'imagen' not in update_fields:
+        return
+    imagen = instance.imagen
+    if imagen and imagen._committed:
+        # El archivo ya estaba en el storage: la imagen no cambió
+        return
+    anterior = None
+    if instance.pk is not None:
+        anterior = sender.objects.filter(pk=instance.pk).values_list('imagen', flat=True).first()
+    if imagen:
+        nombre = instance._meta.get_field('imagen').generate_filename(instance, imagen.name)
+        instance._subida_pendiente = (nombre, b''.join(imagen.file.chunks()))
+        instance.imagen = anterior or None
+    else:
+        instance._imagen_anterior = anterior or ''
+        if instance.pk is not None:
+            # Una subida que todavía no se procesa ya no corresponde
+            _subidas_pendientes(sender, instance.pk).delete()
+
+
+@receiver(post_save)
+def _derivados_al_guardar(sender, instance, **kwargs):
+    if '_subida_pendiente' in instance.__dict__:
+        nombre, contenido = instance.__dict__.pop('_subida_pendiente')
+        # Si había otra subida sin procesar, gana la más reciente
+        _subidas_pendientes(sender, instance.pk).delete()
+        pendiente = SubidaPendiente.objects.create(
+            modelo=sender._meta.label, objeto_id=instance.pk, nombre=nombre, contenido=contenido,
+        )
+        encolar('subir_imagen', subida=pendiente.id)
+    if '_imagen_anterior' in instance.__dict__:
+        anterior = instance.__dict__.pop('_imagen_anterior')
+        if anterior:
+            encolar('eliminar_derivados', nombre=anterior)
+
+
+@receiver(post_delete)
+def _derivados_al_borrar(sender, instance, **kwargs):
+    if sender not in MODELOS_CON_IMAGEN:
+        return
+    _subidas_pendientes(sender, instance.pk).delete()
+    if instance.imagen:
+        encolar('eliminar_derivados', nombre=instance.imagen.name)
@@ -0,0 +1,196 @@
+"""
+Limitadores de requests (rate limiting) sobre el caché compartido 'seguridad'.
+
+Cada algoritmo guarda un estado de tamaño fijo por clave (uno o dos enteros) y lo
+actualiza con cache.incr(), que es atómico en Redis y LocMemCache (por eso settings
+exige Redis en producción; con DatabaseCache o FileBasedCache, solo en desarrollo,
+incr() es leer + escribir y con concurrencia pasarían requests de más).
+
+Uso:
+    limitador = crear_limitador('ventana_deslizante', limite=10, ventana=60, prefijo='restablecimiento_ip')
+    if not limitador.permitir(obtener_ip_cliente(request)):
+        ...  # responder 429
+
+ControlDeIntentos cuenta intentos fallidos (por ejemplo de login) y, pasado un número
+de intentos libres, bloquea la clave con una espera que se duplica en cada fallo.
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+
+from .cache import cache_seguridad as cache
+
+
+def obtener_ip_cliente(request):
+    """
+    Obtiene la IP real del cliente.
+
+    Detrás de NUM_PROXIES proxies de confianza es la entrada de X-Forwarded-For que agregó
+    el más externo, contando desde la derecha: las de la izquierda las puede escribir el
+    cliente, y usarlas permitiría saltarse los límites por IP con un valor distinto en
+    cada request. Sin proxies (o si el encabezado trae menos entradas) se usa REMOTE_ADDR.
+    """
+    proxies = getattr(settings, 'NUM_PROXIES', 0)
+    if proxies > 0:
+        entradas = [entrada.strip() for entrada in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if entrada.strip()]
+        if len(entradas) >= proxies:
+            return entradas[-proxies]
+    return request.META.get('REMOTE_ADDR')
+
+
+def _incrementar(clave, delta=1, inicial=0, timeout=None):
+    """cache.incr() creando la clave con 'inicial' si no existe (o si venció entre medio)"""
+    cache.add(clave, inicial, timeout)
+    try:
+        return cache.incr(clave, delta)
+    except ValueError:
+        cache.set(clave, inicial + delta, timeout)
+        return inicial + delta
+
+
+class Limitador:
+    """
+    Base de los algoritmos: permite 'limite' requests por 'ventana' segundos para cada clave.
+    Las subclases implementan permitir().
+    """
+
+    def __init__(self, limite, ventana, prefijo):
+        self.limite = limite
+        self.ventana = ventana
+        self.prefijo = prefijo
+
+    def clave(self, identificador, *partes):
+        return ':'.join(['limite', self.prefijo, str(identificador), *map(str, partes)])
+
+    def permitir(self, identificador):
+        """Registra un request de identificador y retorna True si está dentro del límite"""
+        raise NotImplementedError
+
+
+class VentanaFija(Limitador):
+    """Contador por ventana alineada al reloj. Simple, pero permite hasta 2x el límite en el borde de dos ventanas."""
+
+    def permitir(self, identificador):
+        ventana_actual = int(time.time() // self.ventana)
+        cantidad = _incrementar(self.clave(identificador, ventana_actual), timeout=self.ventana + 1)
+        return cantidad <= self.limite
+
+
+class VentanaDeslizante(Limitador):
+    """
+    Aproxima una ventana deslizante con dos contadores: el de la ventana actual y el de
+    la anterior, ponderado por la parte de ella que todavía cae dentro de la ventana.
+    """
+
+    def permitir(self, identificador):
+        ahora = time.time()
+        ventana_actual = int(ahora // self.ventana)
+        cantidad = _incrementar(self.clave(identificador, ventana_actual), timeout=2 * self.ventana + 1)
+        anterior = cache.get(self.clave(identificador, ventana_actual - 1), 0)
+        transcurrido = (ahora % self.ventana) / self.ventana
+        return anterior * (1 - transcurrido) + cantidad <= self.limite
+
+
+class CubetaDeTokens(Limitador):
+    """
+    Cubeta de 'limite' tokens que se recarga a limite/ventana tokens por segundo
+    (permite ráfagas de hasta 'limite' requests y luego el ritmo sostenido).
+
+    Se implementa como GCRA: el estado es un solo entero, el instante teórico (en ms)
+    en que la cubeta vuelve a estar llena, y se avanza con incr().
+    """
+
+    def permitir(self, identificador):
+        clave = self.clave(identificador)
+        ahora = int(time.time() * 1000)
+        intervalo = max(1, int(self.ventana * 1000 / self.limite))
+        timeout = self.ventana + 1
+
+        lleno_en = _incrementar(clave, intervalo, inicial=ahora, timeout=timeout)
+        if lleno_en - intervalo < ahora:
+            # La cubeta estaba llena desde antes: contar desde ahora, no desde el pasado
+            lleno_en = _incrementar(clave, ahora - (lleno_en - intervalo), inicial=ahora, timeout=timeout)
+        if lleno_en - ahora <= self.limite * intervalo:
+            cache.touch(clave, timeout)
+            return True
+        # Rechazado: devolver el token para no castigar los reintentos
+        _incrementar(clave, -intervalo, inicial=ahora, timeout=timeout)
+        return False
+
+
+ALGORITMOS = {
+    'ventana_fija': VentanaFija,
+    'ventana_deslizante': VentanaDeslizante,
+    'cubeta_tokens': CubetaDeTokens,
+}
+
+
+def crear_limitador(algoritmo, limite, ventana, prefijo):
+    """
+    Crea un limitador por nombre de algoritmo (ver ALGORITMOS).
+
+    Args:
+        algoritmo: 'ventana_fija', 'ventana_deslizante' o 'cubeta_tokens'
+        limite: Requests permitidos por ventana
+        ventana: Duración de la ventana en segundos
+        prefijo: Nombre del uso (separa las claves de distintos limitadores)
+    """
+    try:
+        clase = ALGORITMOS[algoritmo]
+    except KeyError:
+        raise ValueError(f'Algoritmo de límite desconocido: {algoritmo} (opciones: {", ".join(ALGORITMOS)})')
+    return clase(limite, ventana, prefijo)
+
+
+class ControlDeIntentos:
+    """
+    Intentos fallidos por clave con espera exponencial.
+
+    Los primeros 'intentos_libres' fallos no bloquean; desde ahí, cada fallo bloquea la
+    clave por espera_base * 2^(fallos - intentos_libres - 1) segundos, hasta espera_maxima.
+    Los fallos se olvidan tras 'ventana' segundos sin nuevos fallos.
+    """
+
+    def __init__(self, prefijo, intentos_libres, espera_base, espera_maxima, ventana):
+        self.prefijo = prefijo
+        self.intentos_libres = intentos_libres
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.ventana = ventana
+
+    def _claves(self, identificador):
+        # Se usa un hash para que cualquier texto (usernames con espacios, etc.) sea una clave válida
+        resumen = hashlib.sha256(str(identificador).lower().encode('utf-8')).hexdigest()[:32]
+        base = f'intentos:{self.prefijo}:{resumen}'
+        return f'{base}:fallos', f'{base}:bloqueo'
+
+    def segundos_bloqueo(self, identificador):
+        """Segundos que faltan para que la clave pueda volver a intentar (0 si no está bloqueada)"""
+        _, clave_bloqueo = self._claves(identificador)
+        hasta = cache.get(clave_bloqueo)
+        if hasta is None:
+            return 0
+        return max(0, math.ceil(hasta - time.time()))
+
+    def registrar_fallo(self, identificador):
+        """Suma un fallo y bloquea la clave si corresponde; retorna los segundos de bloqueo (0 si no)"""
+        clave_fallos, clave_bloqueo = self._claves(identificador)
+        fallos = _incrementar(clave_fallos, timeout=self.ventana)
+        cache.touch(clave_fallos, self.ventana)
+        if fallos <= self.intentos_libres:
+            return 0
+        espera = min(self.espera_maxima, self.espera_base * 2 ** min(fallos - self.intentos_libres - 1, 30))
+        cache.set(clave_bloqueo, time.time() + espera, espera)
+        return espera
+
+    def reiniciar(self, identificador):
+        """Olvida los fallos de la clave (por ejemplo, tras un login correcto)"""
+        cache.delete_many(self._claves(identificador))
+
+
+# Login (core.views.login_view): por usuario para frenar ataques a una cuenta, y por IP
+# (con más margen, por las redes compartidas) para frenar el rociado de contraseñas
+intentos_login_usuario = ControlDeIntentos('login_usuario', intentos_libres=5, espera_base=2, espera_maxima=15 * 60, ventana=60 * 60)
+intentos_login_ip = ControlDeIntentos('login_ip', intentos_libres=20, espera_base=2, espera_maxima=15 * 60, ventana=60 * 60)
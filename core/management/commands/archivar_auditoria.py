@@ -0,0 +1,56 @@
+"""
+Comando de Django para archivar los registros de auditoría antiguos por mes
+Ejecutar con: python manage.py archivar_auditoria --meses 6 [--dry-run]
+"""
+from django.core.management.base import BaseCommand, CommandError
+from core.archivo_auditoria import archivar_mes, meses_por_archivar
+from core.models import Auditoria
+
+
+class Command(BaseCommand):
+    help = 'Mueve los registros de auditoría más antiguos que N meses a archivos mensuales comprimidos (JSON Lines + gzip)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--meses',
+            type=int,
+            default=6,
+            help='Cantidad de meses recientes que se mantienen en la tabla de auditoría (por defecto: 6)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo muestra los meses que se archivarían, sin modificar nada',
+        )
+
+    def handle(self, *args, **options):
+        meses = options['meses']
+        if meses < 1:
+            raise CommandError('--meses debe ser al menos 1')
+        
+        pendientes = meses_por_archivar(meses)
+        if not pendientes:
+            self.stdout.write(self.style.SUCCESS('No hay registros de auditoría para archivar.'))
+            return
+        
+        if options['dry_run']:
+            for mes in pendientes:
+                self.stdout.write(f'Se archivaría: {mes.strftime("%m/%Y")}')
+            return
+        
+        total = 0
+        for mes in pendientes:
+            archivados = archivar_mes(mes)
+            total += archivados
+            self.stdout.write(
+                self.style.SUCCESS(f'Archivado: {mes.strftime("%m/%Y")} - {archivados} registros')
+            )
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\nProceso completado:\n'
+                f'   - Meses procesados: {len(pendientes)}\n'
+                f'   - Registros archivados: {total}\n'
+                f'   - Registros en la tabla de auditoría: {Auditoria.objects.count()}'
+            )
+        )
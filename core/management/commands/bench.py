@@ -0,0 +1,276 @@
+"""
+Comando de Django para medir el rendimiento de los flujos principales con datos sintéticos
+Ejecutar con: python manage.py bench [--usuarios N] [--asistencias-por-dia M] [--anios Y] [--salida bench.json]
+
+Crea una base de datos de prueba aparte (como manage.py test), la llena con datos generados,
+recorre los flujos principales (lecturas y escrituras de asistencia y stock) con el cliente de
+pruebas de Django y guarda latencias (p50/p95/p99), throughput y consultas por request en un
+JSON comparable entre commits.
+La base de datos configurada no se modifica.
+"""
+import json
+import random
+import statistics
+import subprocess
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from core.metricas import percentil
+
+PASSWORD_BENCH = 'bench-cadmium'
+
+# Opciones que necesitan al menos un elemento (primer colaborador, productos de los flujos de stock,
+# latencias para calcular la media) y opciones que solo no pueden ser negativas
+OPCIONES_MINIMO_UNO = ['usuarios', 'productos', 'iteraciones']
+OPCIONES_NO_NEGATIVAS = ['asistencias_por_dia', 'anios', 'auditoria', 'pedidos', 'detalles_por_pedido']
+
+
+class Command(BaseCommand):
+    help = 'Genera datos sintéticos en una base de datos de prueba y mide latencia y throughput de los flujos principales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=50, help='Cantidad de colaboradores (por defecto: 50)')
+        parser.add_argument('--asistencias-por-dia', type=int, default=20, help='Asistencias registradas por día (por defecto: 20, máximo: --usuarios)')
+        parser.add_argument('--anios', type=float, default=1, help='Años de historia de asistencias (por defecto: 1)')
+        parser.add_argument('--auditoria', type=int, default=20000, help='Registros de auditoría (por defecto: 20000)')
+        parser.add_argument('--productos', type=int, default=60, help='Productos de inventario (por defecto: 60)')
+        parser.add_argument('--pedidos', type=int, default=300, help='Pedidos (por defecto: 300)')
+        parser.add_argument('--detalles-por-pedido', type=int, default=8, help='Detalles por pedido (por defecto: 8)')
+        parser.add_argument('--iteraciones', type=int, default=30, help='Requests medidos por flujo (por defecto: 30)')
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla del generador aleatorio (por defecto: 42)')
+        parser.add_argument('--salida', default='bench.json', help='Archivo JSON de resultados (por defecto: bench.json)')
+
+    def handle(self, *args, **options):
+        for clave in OPCIONES_MINIMO_UNO:
+            if options[clave] < 1:
+                raise CommandError(f"--{clave.replace('_', '-')} debe ser al menos 1")
+        for clave in OPCIONES_NO_NEGATIVAS:
+            if options[clave] < 0:
+                raise CommandError(f"--{clave.replace('_', '-')} no puede ser negativo")
+        
+        random.seed(options['semilla'])
+        options['asistencias_por_dia'] = min(options['asistencias_por_dia'], options['usuarios'])
+
+        setup_test_environment()
+        configuracion_bd = setup_databases(verbosity=0, interactive=False)
+        try:
+            inicio = time.perf_counter()
+            self._generar_datos(options)
+            self.stdout.write(f'Datos generados en {time.perf_counter() - inicio:.1f} s')
+
+            resultados = self._medir_flujos(options['iteraciones'])
+        finally:
+            # Guardar la auditoría pendiente antes de eliminar la base de datos de prueba
+            from core.auditoria_buffer import escritor_auditoria
+            escritor_auditoria.flush()
+            teardown_databases(configuracion_bd, verbosity=0)
+            teardown_test_environment()
+
+        reporte = {
+            'fecha': timezone.now().isoformat(),
+            'commit': self._commit_actual(),
+            'base_de_datos': connection.vendor,
+            'escala': {
+                clave: options[clave]
+                for clave in ['usuarios', 'asistencias_por_dia', 'anios', 'auditoria', 'productos', 'pedidos', 'detalles_por_pedido', 'iteraciones', 'semilla']
+            },
+            'flujos': resultados,
+        }
+        with open(options['salida'], 'w', encoding='utf-8') as archivo:
+            json.dump(reporte, archivo, indent=2, ensure_ascii=False)
+
+        self.stdout.write('')
+        self.stdout.write(f"{'Flujo':<26}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'consultas':>11}")
+        for nombre, datos in resultados.items():
+            self.stdout.write(
+                f"{nombre:<26}{datos['throughput']:>8.1f}{datos['p50_ms']:>9.1f}{datos['p95_ms']:>9.1f}"
+                f"{datos['p99_ms']:>9.1f}{datos['consultas_promedio']:>11.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS(f'\nResultados guardados en {options["salida"]}'))
+
+    def _generar_datos(self, options):
+        from core.models import Asistencia, Auditoria, DetallePedido, Inventario, Pedido, Usuario
+
+        ahora = timezone.now()
+        hoy = timezone.localdate()
+        password = make_password(PASSWORD_BENCH)
+
+        self.admin = Usuario.objects.create(
+            username='bench_admin', password=password, nombre='Admin', apellido='Bench',
+            _es_administrador=True, es_colaborador=False, cambio_password_requerido=False,
+        )
+        Usuario.objects.bulk_create([
+            Usuario(
+                username=f'bench_colaborador{numero}', password=password, nombre=f'Nombre{numero}',
+                apellido=f'Apellido{numero}', cambio_password_requerido=False,
+            )
+            for numero in range(options['usuarios'])
+        ], batch_size=500)
+        colaboradores = list(Usuario.objects.filter(username__startswith='bench_colaborador').order_by('id'))
+        self.colaborador = colaboradores[0]
+        self.hoy = hoy
+
+        # Asistencias: cada día, un subconjunto distinto de colaboradores (usuario + fecha es único)
+        dias = int(options['anios'] * 365)
+        turnos = ['apertura', 'tarde', 'cierre']
+        lote = []
+        for dia in range(1, dias + 1):
+            fecha = hoy - timedelta(days=dia)
+            for usuario in random.sample(colaboradores, options['asistencias_por_dia']):
+                lote.append(Asistencia(
+                    usuario=usuario, fecha=fecha, turno=random.choice(turnos),
+                    estado=random.choice(['presente', 'presente', 'presente', 'tarde', 'ausente']),
+                ))
+            if len(lote) >= 5000:
+                Asistencia.objects.bulk_create(lote)
+                lote = []
+        Asistencia.objects.bulk_create(lote)
+
+        categorias = [valor for valor, _ in Inventario.CATEGORIA_CHOICES]
+        productos = Inventario.objects.bulk_create([
+            Inventario(
+                nombre=f'Producto {numero}', categoria=categorias[numero % len(categorias)],
+                cantidad=random.randint(0, 100), precio_unitario=Decimal(random.randint(500, 20000)),
+            )
+            for numero in range(options['productos'])
+        ])
+        self.producto = productos[0]
+
+        pedidos = Pedido.objects.bulk_create([
+            Pedido(codigo=f'BENCH-{numero:05d}', fecha_creacion=ahora - timedelta(days=numero % max(dias, 1)), usuario_creacion=self.admin)
+            for numero in range(options['pedidos'])
+        ], batch_size=1000)
+        detalles = []
+        for pedido in pedidos:
+            total = Decimal('0')
+            for producto in random.sample(productos, min(options['detalles_por_pedido'], len(productos))):
+                cantidad = random.randint(1, 10)
+                detalles.append(DetallePedido(pedido=pedido, producto_nombre=producto.nombre, cantidad=cantidad, precio_unitario=producto.precio_unitario))
+                total += cantidad * producto.precio_unitario
+            pedido.total = total
+            pedido.num_items = min(options['detalles_por_pedido'], len(productos))
+        DetallePedido.objects.bulk_create(detalles, batch_size=2000)
+        Pedido.objects.bulk_update(pedidos, ['total', 'num_items'], batch_size=1000)
+
+        segundos_historia = max(dias, 1) * 86400
+        acciones = [('inventario_stock_change', 'inventario'), ('login', 'sesion'), ('asistencia_create', 'asistencia'), ('pedido_create', 'productos')]
+        lote = []
+        for numero in range(options['auditoria']):
+            accion, modulo = acciones[numero % len(acciones)]
+            producto = productos[numero % len(productos)]
+            lote.append(Auditoria(
+                usuario=colaboradores[numero % len(colaboradores)], accion=accion, modulo=modulo,
+                descripcion=f'Registro {numero} sobre {producto.nombre}', objeto_afectado=producto.nombre,
+                detalles={'cantidad_anterior': numero % 50, 'cantidad_nueva': (numero + 1) % 50},
+                fecha_hora=ahora - timedelta(seconds=random.randint(0, segundos_historia)),
+            ))
+            if len(lote) >= 5000:
+                Auditoria.objects.bulk_create(lote)
+                lote = []
+        Auditoria.objects.bulk_create(lote)
+
+    def _flujos(self):
+        """
+        Flujos medidos: nombre -> (rol del cliente, función que hace el request, preparación o None).
+        La preparación se ejecuta antes de cada request, fuera de la medición.
+        """
+        return {
+            'login': (None, lambda cliente: cliente.post(reverse('login'), {
+                'account_type': 'colaborador', 'username': self.colaborador.username, 'password': PASSWORD_BENCH,
+            }), None),
+            'index': (None, lambda cliente: cliente.get(reverse('index')), None),
+            'registro_asistencia': ('colaborador', lambda cliente: cliente.get(reverse('registro_asistencia')), None),
+            'registro_asistencia_post': ('colaborador', lambda cliente: cliente.post(
+                reverse('registro_asistencia'), {'turno': 'apertura'},
+            ), self._quitar_asistencia_de_hoy),
+            'cambiar_stock': ('colaborador', lambda cliente: cliente.get(reverse('cambiar_stock')), None),
+            'actualizar_stock_post': ('colaborador', lambda cliente: cliente.post(
+                reverse('actualizar_stock', args=[self.producto.id]), {'operacion': 'sumar', 'cantidad': 1},
+            ), None),
+            'conteo_stock_post': ('colaborador', lambda cliente: cliente.post(
+                reverse('conteo_stock'), self.datos_conteo,
+            ), self._preparar_conteo),
+            'auditoria': ('admin', lambda cliente: cliente.get(reverse('auditoria')), None),
+            'auditoria_busqueda': ('admin', lambda cliente: cliente.get(reverse('auditoria'), {'search': 'producto'}), None),
+            'pedidos': ('admin', lambda cliente: cliente.get(reverse('pedidos')), None),
+        }
+
+    def _quitar_asistencia_de_hoy(self):
+        """Cada request registra la asistencia de hoy; la anterior se elimina para no caer en 'ya registrada'"""
+        from core.models import Asistencia
+
+        Asistencia.objects.filter(usuario=self.colaborador, fecha=self.hoy).delete()
+
+    def _preparar_conteo(self):
+        """Datos del formset de conteo masivo: cada producto cambia en una unidad, con su versión actual"""
+        from core.models import Inventario
+
+        productos = list(Inventario.objects.only('id', 'cantidad', 'fecha_actualizacion').order_by('id'))
+        self.datos_conteo = {
+            'form-TOTAL_FORMS': len(productos),
+            'form-INITIAL_FORMS': len(productos),
+        }
+        for indice, producto in enumerate(productos):
+            self.datos_conteo.update({
+                f'form-{indice}-producto_id': producto.id,
+                f'form-{indice}-version': producto.version_stock,
+                f'form-{indice}-cantidad': (producto.cantidad + 1) % 100,
+            })
+
+    def _medir_flujos(self, iteraciones):
+        resultados = {}
+        for nombre, (rol, hacer_request, preparar) in self._flujos().items():
+            latencias = []
+            consultas = []
+            cliente = Client()
+            if rol == 'admin':
+                cliente.force_login(self.admin)
+            elif rol == 'colaborador':
+                cliente.force_login(self.colaborador)
+
+            if preparar:
+                preparar()
+            hacer_request(cliente)  # Calentamiento (caches, plantillas compiladas)
+            duracion = 0
+            for _ in range(iteraciones):
+                if rol is None:
+                    # Visitante: sesión nueva en cada request (el login no debe reutilizar la sesión iniciada)
+                    cliente = Client()
+                if preparar:
+                    preparar()
+                with CaptureQueriesContext(connection) as capturadas:
+                    inicio = time.perf_counter()
+                    respuesta = hacer_request(cliente)
+                    latencias.append((time.perf_counter() - inicio) * 1000)
+                duracion += latencias[-1] / 1000
+                consultas.append(len(capturadas))
+                if respuesta.status_code >= 400:
+                    self.stdout.write(self.style.WARNING(f'{nombre}: respuesta {respuesta.status_code}'))
+
+            latencias.sort()
+            resultados[nombre] = {
+                'iteraciones': iteraciones,
+                'throughput': round(iteraciones / duracion, 2),
+                'media_ms': round(statistics.mean(latencias), 2),
+                'p50_ms': round(percentil(latencias, 50), 2),
+                'p95_ms': round(percentil(latencias, 95), 2),
+                'p99_ms': round(percentil(latencias, 99), 2),
+                'max_ms': round(latencias[-1], 2),
+                'consultas_promedio': round(statistics.mean(consultas), 2),
+            }
+        return resultados
+
+    def _commit_actual(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,42 @@
+"""
+Comando de Django para generar los derivados (WebP/JPEG por ancho) de las imágenes ya subidas
+Ejecutar con: python manage.py generar_derivados_imagenes [--forzar]
+
+Las imágenes nuevas generan sus derivados al subirse (core.imagenes); este comando
+completa las que se subieron antes.
+"""
+from django.core.management.base import BaseCommand
+
+from core.imagenes import MODELOS_CON_IMAGEN, derivados, generar_derivados
+
+
+class Command(BaseCommand):
+    help = 'Genera los derivados responsivos de las imágenes de carrusel, eventos, noticias, contactos e inventario'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--forzar',
+            action='store_true',
+            help='Regenera también las imágenes que ya tienen derivados',
+        )
+
+    def handle(self, *args, **options):
+        generadas = 0
+        omitidas = 0
+        errores = 0
+        for modelo in MODELOS_CON_IMAGEN:
+            nombres = modelo.objects.exclude(imagen='').exclude(imagen__isnull=True).values_list('imagen', flat=True)
+            for nombre in nombres.distinct():
+                if not options['forzar'] and derivados(nombre):
+                    omitidas += 1
+                    continue
+                try:
+                    generar_derivados(nombre)
+                    generadas += 1
+                except Exception as e:
+                    errores += 1
+                    self.stdout.write(self.style.WARNING(f'{nombre}: {e}'))
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Derivados generados para {generadas} imagen(es); {omitidas} ya los tenían; {errores} con error')
+        )
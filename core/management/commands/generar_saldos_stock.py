@@ -0,0 +1,64 @@
+"""
+Comando de Django para guardar el saldo de stock de cada producto a una fecha de corte
+Ejecutar con: python manage.py generar_saldos_stock [--fecha AAAA-MM-DD] [--verificar]
+
+Pensado para correr a diario (cron): con un SaldoStock reciente, Inventario.stock_en()
+solo suma los movimientos posteriores al último corte.
+"""
+from datetime import date, datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.models import Inventario, MovimientoStock, SaldoStock
+
+
+class Command(BaseCommand):
+    help = 'Guarda un SaldoStock por producto al inicio del día indicado, calculado desde el libro de movimientos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fecha',
+            help='Día de corte en formato AAAA-MM-DD; el saldo se toma a las 00:00 de ese día (por defecto: hoy)',
+        )
+        parser.add_argument(
+            '--verificar',
+            action='store_true',
+            help='Compara además la cantidad de cada producto con la suma de sus movimientos',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            dia = date.fromisoformat(options['fecha']) if options['fecha'] else timezone.localdate()
+        except ValueError:
+            raise CommandError('--fecha debe tener el formato AAAA-MM-DD')
+        if dia > timezone.localdate():
+            # Un corte futuro quedaría desactualizado con los movimientos que aún faltan por registrar
+            raise CommandError('--fecha no puede ser posterior a hoy')
+        corte = timezone.make_aware(datetime.combine(dia, time.min))
+        
+        productos = list(Inventario.objects.exclude(saldos__fecha=corte).only('id', 'nombre'))
+        with transaction.atomic():
+            SaldoStock.objects.bulk_create(
+                [SaldoStock(producto=producto, fecha=corte, cantidad=producto.stock_en(corte)) for producto in productos],
+                ignore_conflicts=True,
+            )
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Saldos al {corte.strftime("%d/%m/%Y %H:%M")}: {len(productos)} producto(s)')
+        )
+        
+        if options['verificar']:
+            sumas = dict(MovimientoStock.objects.values('producto').annotate(total=Sum('delta')).values_list('producto', 'total'))
+            descuadres = 0
+            for producto in Inventario.objects.only('id', 'nombre', 'cantidad'):
+                total = sumas.get(producto.id, 0)
+                if total != producto.cantidad:
+                    descuadres += 1
+                    self.stdout.write(
+                        self.style.WARNING(f'{producto.nombre}: cantidad {producto.cantidad}, movimientos {total}')
+                    )
+            if not descuadres:
+                self.stdout.write(self.style.SUCCESS('El stock de todos los productos cuadra con sus movimientos.'))
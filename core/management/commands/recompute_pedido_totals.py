@@ -0,0 +1,65 @@
+"""
+Comando de Django para recalcular y verificar los totales almacenados de los pedidos
+Ejecutar con: python manage.py recompute_pedido_totals [--verificar] [--batch-size N]
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core.models import Pedido
+
+
+class Command(BaseCommand):
+    help = 'Recalcula total y num_items de cada pedido a partir de sus detalles (o solo verifica con --verificar)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verificar',
+            action='store_true',
+            help='Solo informa los pedidos con totales desincronizados, sin modificarlos',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Cantidad de pedidos procesados por lote (por defecto: 500)',
+        )
+
+    def handle(self, *args, **options):
+        verificar = options['verificar']
+        batch_size = options['batch_size']
+        
+        # Los totales reales se calculan en la base de datos en una sola consulta
+        pedidos = Pedido.objects.with_totals().only('id', 'codigo', 'total', 'num_items').order_by('id')
+        
+        revisados = 0
+        desincronizados = []
+        
+        for pedido in pedidos.iterator(chunk_size=batch_size):
+            revisados += 1
+            if pedido.total != pedido.total_calculado or pedido.num_items != pedido.num_detalles:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'Desincronizado: {pedido.codigo} (id {pedido.id}) - '
+                        f'total {pedido.total} -> {pedido.total_calculado}, '
+                        f'productos {pedido.num_items} -> {pedido.num_detalles}'
+                    )
+                )
+                pedido.total = pedido.total_calculado
+                pedido.num_items = pedido.num_detalles
+                desincronizados.append(pedido)
+        
+        if desincronizados and not verificar:
+            with transaction.atomic():
+                Pedido.objects.bulk_update(desincronizados, ['total', 'num_items'], batch_size=batch_size)
+        
+        accion = 'Por corregir' if verificar else 'Corregidos'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\nProceso completado:\n'
+                f'   - Pedidos revisados: {revisados}\n'
+                f'   - {accion}: {len(desincronizados)}'
+            )
+        )
+        
+        if verificar and desincronizados:
+            # Código de salida distinto de cero para poder usarlo en verificaciones automáticas
+            raise CommandError(f'{len(desincronizados)} de {revisados} pedido(s) con totales desincronizados')
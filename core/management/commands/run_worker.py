@@ -0,0 +1,73 @@
+"""
+Comando de Django que ejecuta las tareas en segundo plano de core.tareas (modelo Tarea)
+Ejecutar con: python manage.py run_worker [--una-vez] [--intervalo SEGUNDOS]
+
+Pensado para correr como proceso aparte (por ejemplo, un "background worker" junto al
+servicio web). Se puede levantar más de uno: cada tarea la toma un solo worker. Con
+SIGTERM o Ctrl+C termina la tarea en curso antes de salir.
+"""
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.tareas import ejecutar, limpiar_historial, recuperar_abandonadas, tomar_siguiente
+
+# Cada cuántos segundos se recuperan las tareas abandonadas y se limpia el historial
+INTERVALO_MANTENCION = 5 * 60
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta las tareas pendientes de la cola (procesamiento de imágenes subidas, etc.)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Ejecuta las tareas pendientes y termina (para cron) en vez de quedar esperando',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=2.0,
+            help='Segundos de espera cuando la cola está vacía (por defecto: 2)',
+        )
+
+    def handle(self, *args, **options):
+        self.detener = False
+        signal.signal(signal.SIGTERM, self._detener)
+        signal.signal(signal.SIGINT, self._detener)
+        
+        completadas = 0
+        fallidas = 0
+        ultima_mantencion = 0
+        while not self.detener:
+            # Un proceso de larga duración debe descartar las conexiones caídas o vencidas
+            close_old_connections()
+            
+            if time.monotonic() - ultima_mantencion >= INTERVALO_MANTENCION:
+                recuperadas = recuperar_abandonadas()
+                if recuperadas:
+                    self.stdout.write(self.style.WARNING(f'{recuperadas} tarea(s) abandonada(s) devuelta(s) a la cola'))
+                limpiar_historial()
+                ultima_mantencion = time.monotonic()
+            
+            tarea = tomar_siguiente()
+            if tarea is None:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+            
+            if ejecutar(tarea):
+                completadas += 1
+                self.stdout.write(f'Tarea {tarea.id} ({tarea.tipo}) completada')
+            else:
+                fallidas += 1
+                self.stdout.write(self.style.WARNING(f'Tarea {tarea.id} ({tarea.tipo}) falló: {tarea.get_estado_display().lower()}'))
+        
+        self.stdout.write(self.style.SUCCESS(f'Worker detenido: {completadas} tarea(s) completada(s), {fallidas} con error'))
+
+    def _detener(self, signum, frame):
+        self.detener = True
@@ -0,0 +1,126 @@
+"""
+Métricas de rendimiento por vista (tiempo total, consultas a la BD, tiempo en BD y en plantillas).
+
+MetricasMiddleware (core.middleware) mide cada request y guarda la muestra aquí, en un
+buffer circular por nombre de URL. Los datos viven en memoria del proceso: con varios
+workers de gunicorn cada uno tiene sus propias métricas, y se pierden al reiniciar.
+"""
+import math
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.template.backends.django import Template as PlantillaDjango
+
+CAMPOS_MUESTRA = ['tiempo_total', 'consultas', 'tiempo_db', 'tiempo_plantillas']
+
+# Medición en curso del request actual (None fuera de MetricasMiddleware)
+medicion_actual = ContextVar('medicion_actual', default=None)
+
+
+class Medicion:
+    """Acumula los tiempos de un request mientras se procesa"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tiempo_db = 0.0
+        self.tiempo_plantillas = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Wrapper para connection.execute_wrapper(): cuenta y cronometra cada consulta"""
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas += 1
+            self.tiempo_db += time.perf_counter() - inicio
+
+    def muestra(self):
+        """Retorna la muestra del request (tiempos en milisegundos)"""
+        return (
+            (time.perf_counter() - self.inicio) * 1000,
+            self.consultas,
+            self.tiempo_db * 1000,
+            self.tiempo_plantillas * 1000,
+        )
+
+
+def percentil(valores_ordenados, p):
+    """Percentil p (0-100) por rango más cercano sobre una lista ya ordenada"""
+    indice = max(0, math.ceil(p / 100 * len(valores_ordenados)) - 1)
+    return valores_ordenados[indice]
+
+
+class RegistroMetricas:
+    """Buffer circular de muestras por nombre de URL, seguro entre hilos"""
+
+    def __init__(self, muestras_por_ruta=500):
+        self.muestras_por_ruta = muestras_por_ruta
+        self._muestras = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, ruta, muestra):
+        with self._lock:
+            if ruta not in self._muestras:
+                self._muestras[ruta] = deque(maxlen=self.muestras_por_ruta)
+            self._muestras[ruta].append(muestra)
+
+    def limpiar(self):
+        with self._lock:
+            self._muestras.clear()
+
+    def resumen(self):
+        """
+        Agrega las muestras de cada ruta.
+
+        Returns:
+            Lista de diccionarios (uno por ruta, ordenados por p95 del tiempo total descendente)
+            con 'ruta', 'cantidad' y p50/p95/max de cada campo de CAMPOS_MUESTRA
+        """
+        with self._lock:
+            copia = {ruta: list(muestras) for ruta, muestras in self._muestras.items()}
+
+        resultado = []
+        for ruta, muestras in copia.items():
+            fila = {'ruta': ruta, 'cantidad': len(muestras)}
+            for posicion, campo in enumerate(CAMPOS_MUESTRA):
+                valores = sorted(muestra[posicion] for muestra in muestras)
+                fila[campo] = {
+                    'p50': round(percentil(valores, 50), 2),
+                    'p95': round(percentil(valores, 95), 2),
+                    'max': round(valores[-1], 2),
+                }
+            resultado.append(fila)
+        resultado.sort(key=lambda fila: fila['tiempo_total']['p95'], reverse=True)
+        return resultado
+
+
+metricas = RegistroMetricas()
+
+_render_original = None
+
+
+def instrumentar_plantillas():
+    """
+    Envuelve el render de las plantillas de Django para sumar su tiempo a la medición en curso.
+    Se mide solo el render de nivel superior (render() / render_to_string()), que incluye
+    los {% include %} y {% extends %}.
+    """
+    global _render_original
+    if _render_original is not None:
+        return
+    _render_original = PlantillaDjango.render
+
+    def render_medido(self, context=None, request=None):
+        medicion = medicion_actual.get()
+        if medicion is None:
+            return _render_original(self, context, request)
+        inicio = time.perf_counter()
+        try:
+            return _render_original(self, context, request)
+        finally:
+            medicion.tiempo_plantillas += time.perf_counter() - inicio
+
+    PlantillaDjango.render = render_medido
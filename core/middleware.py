@@ -51,3 +51,43 @@ class SessionTimeoutMiddleware:
         response = self.get_response(request)
         return response
 
+
+
+class MetricasMiddleware:
+    """
+    Middleware opcional que mide cada request: tiempo total, cantidad y tiempo de
+    consultas a la base de datos y tiempo de render de plantillas.
+    Las muestras se agrupan por nombre de URL y se consultan en /panel/metricas/.
+    Se activa con METRICAS_ACTIVAS=True en settings.
+    """
+    
+    def __init__(self, get_response):
+        from django.conf import settings
+        from django.core.exceptions import MiddlewareNotUsed
+        
+        if not getattr(settings, 'METRICAS_ACTIVAS', False):
+            raise MiddlewareNotUsed
+        
+        from .metricas import instrumentar_plantillas, metricas
+        
+        metricas.muestras_por_ruta = getattr(settings, 'METRICAS_MUESTRAS_POR_RUTA', 500)
+        instrumentar_plantillas()
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        from django.db import connection
+        from .metricas import Medicion, medicion_actual, metricas
+        
+        medicion = Medicion()
+        token = medicion_actual.set(medicion)
+        try:
+            with connection.execute_wrapper(medicion):
+                response = self.get_response(request)
+        finally:
+            medicion_actual.reset(token)
+        
+        # Las rutas sin nombre (404, archivos estáticos) se agrupan juntas
+        resolver_match = getattr(request, 'resolver_match', None)
+        ruta = resolver_match.view_name if resolver_match and resolver_match.view_name else 'sin_ruta'
+        metricas.registrar(ruta, medicion.muestra())
+        return response
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def calcular_totales_pedidos(apps, schema_editor):
+    """Rellena total y num_items de los pedidos existentes a partir de sus detalles"""
+    Pedido = apps.get_model('core', 'Pedido')
+    pedidos = Pedido.objects.annotate(
+        total_calculado=Coalesce(
+            Sum(F('detalles__cantidad') * F('detalles__precio_unitario'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+            Value(0),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+        num_detalles=Count('detalles'),
+    )
+    actualizados = []
+    for pedido in pedidos.iterator(chunk_size=500):
+        pedido.total = pedido.total_calculado
+        pedido.num_items = pedido.num_detalles
+        actualizados.append(pedido)
+    Pedido.objects.bulk_update(actualizados, ['total', 'num_items'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_remove_usuario_es_empleado_usuario_es_colaborador'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total'),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='num_items',
+            field=models.IntegerField(default=0, verbose_name='Cantidad de Productos'),
+        ),
+        migrations.RunPython(calcular_totales_pedidos, migrations.RunPython.noop),
+    ]
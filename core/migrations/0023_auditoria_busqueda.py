@@ -0,0 +1,105 @@
+"""
+Índice de búsqueda de texto completo para Auditoria (descripcion y objeto_afectado).
+
+- PostgreSQL: columna tsvector generada (se mantiene sola) con índice GIN.
+- SQLite: tabla virtual FTS5 de contenido externo, sincronizada con triggers
+  (los registros se insertan con bulk_create, que no emite señales).
+Otros motores no crean índice y la búsqueda usa icontains (ver core.busqueda).
+"""
+from django.db import migrations
+
+
+POSTGRES_CREAR = [
+    """
+    ALTER TABLE core_auditoria ADD COLUMN busqueda tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('spanish', coalesce(descripcion, '') || ' ' || coalesce(objeto_afectado, ''))
+    ) STORED
+    """,
+    "CREATE INDEX core_auditoria_busqueda_gin ON core_auditoria USING GIN (busqueda)",
+]
+
+POSTGRES_ELIMINAR = [
+    "DROP INDEX IF EXISTS core_auditoria_busqueda_gin",
+    "ALTER TABLE core_auditoria DROP COLUMN IF EXISTS busqueda",
+]
+
+SQLITE_CREAR = [
+    """
+    CREATE VIRTUAL TABLE core_auditoria_fts USING fts5(
+        descripcion, objeto_afectado,
+        content='core_auditoria', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER core_auditoria_fts_ai AFTER INSERT ON core_auditoria BEGIN
+        INSERT INTO core_auditoria_fts(rowid, descripcion, objeto_afectado)
+        VALUES (new.id, new.descripcion, coalesce(new.objeto_afectado, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER core_auditoria_fts_ad AFTER DELETE ON core_auditoria BEGIN
+        INSERT INTO core_auditoria_fts(core_auditoria_fts, rowid, descripcion, objeto_afectado)
+        VALUES ('delete', old.id, old.descripcion, coalesce(old.objeto_afectado, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER core_auditoria_fts_au AFTER UPDATE ON core_auditoria BEGIN
+        INSERT INTO core_auditoria_fts(core_auditoria_fts, rowid, descripcion, objeto_afectado)
+        VALUES ('delete', old.id, old.descripcion, coalesce(old.objeto_afectado, ''));
+        INSERT INTO core_auditoria_fts(rowid, descripcion, objeto_afectado)
+        VALUES (new.id, new.descripcion, coalesce(new.objeto_afectado, ''));
+    END
+    """,
+    # Indexar los registros existentes
+    "INSERT INTO core_auditoria_fts(core_auditoria_fts) VALUES ('rebuild')",
+]
+
+SQLITE_ELIMINAR = [
+    "DROP TRIGGER IF EXISTS core_auditoria_fts_ai",
+    "DROP TRIGGER IF EXISTS core_auditoria_fts_ad",
+    "DROP TRIGGER IF EXISTS core_auditoria_fts_au",
+    "DROP TABLE IF EXISTS core_auditoria_fts",
+]
+
+
+def _sqlite_tiene_fts5(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def crear_indice_busqueda(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        sentencias = POSTGRES_CREAR
+    elif vendor == 'sqlite' and _sqlite_tiene_fts5(schema_editor):
+        sentencias = SQLITE_CREAR
+    else:
+        return
+    for sentencia in sentencias:
+        schema_editor.execute(sentencia)
+
+
+def eliminar_indice_busqueda(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        sentencias = POSTGRES_ELIMINAR
+    elif vendor == 'sqlite':
+        sentencias = SQLITE_ELIMINAR
+    else:
+        return
+    for sentencia in sentencias:
+        schema_editor.execute(sentencia)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_pedido_total_num_items'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice_busqueda, eliminar_indice_busqueda),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:49
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_auditoria_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivoAuditoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(unique=True, verbose_name='Mes')),
+                ('cantidad', models.IntegerField(default=0, verbose_name='Cantidad de Registros')),
+                ('contenido', models.BinaryField(verbose_name='Contenido (JSON Lines + gzip)')),
+                ('fecha_creacion', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha de Creación')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')),
+            ],
+            options={
+                'verbose_name': 'Archivo de Auditoría',
+                'verbose_name_plural': 'Archivos de Auditoría',
+                'ordering': ['-mes'],
+            },
+        ),
+    ]
@@ -0,0 +1,82 @@
+"""
+Convierte Auditoria.detalles de texto (salida de json.dumps) a JSONField.
+
+Se agrega una columna nueva, se copian los valores parseados en lotes y luego se
+reemplaza la columna antigua. Los valores que no son JSON válido (guardados con str()
+cuando json.dumps fallaba) se conservan como {"texto": valor_original}.
+"""
+import json
+
+import core.models
+import django.db.models.fields.json
+from django.db import migrations, models
+
+TAMANO_LOTE = 1000
+
+
+def parsear_detalles(apps, schema_editor):
+    Auditoria = apps.get_model('core', 'Auditoria')
+    pendientes = Auditoria.objects.exclude(detalles__isnull=True).exclude(detalles='').only('id', 'detalles').order_by('id')
+    lote = []
+    for registro in pendientes.iterator(chunk_size=TAMANO_LOTE):
+        try:
+            registro.detalles_json = json.loads(registro.detalles)
+        except ValueError:
+            registro.detalles_json = {'texto': registro.detalles}
+        lote.append(registro)
+        if len(lote) >= TAMANO_LOTE:
+            Auditoria.objects.bulk_update(lote, ['detalles_json'])
+            lote = []
+    if lote:
+        Auditoria.objects.bulk_update(lote, ['detalles_json'])
+
+
+def serializar_detalles(apps, schema_editor):
+    Auditoria = apps.get_model('core', 'Auditoria')
+    pendientes = Auditoria.objects.exclude(detalles_json__isnull=True).only('id', 'detalles_json').order_by('id')
+    lote = []
+    for registro in pendientes.iterator(chunk_size=TAMANO_LOTE):
+        registro.detalles = json.dumps(registro.detalles_json, ensure_ascii=False)
+        lote.append(registro)
+        if len(lote) >= TAMANO_LOTE:
+            Auditoria.objects.bulk_update(lote, ['detalles'])
+            lote = []
+    if lote:
+        Auditoria.objects.bulk_update(lote, ['detalles'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_archivoauditoria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditoria',
+            name='detalles_json',
+            field=models.JSONField(blank=True, null=True, encoder=core.models.AuditoriaJSONEncoder, verbose_name='Detalles Adicionales (JSON)'),
+        ),
+        migrations.RunPython(parsear_detalles, serializar_detalles),
+        migrations.RemoveField(
+            model_name='auditoria',
+            name='detalles',
+        ),
+        migrations.RenameField(
+            model_name='auditoria',
+            old_name='detalles_json',
+            new_name='detalles',
+        ),
+        migrations.AddIndex(
+            model_name='auditoria',
+            index=models.Index(django.db.models.fields.json.KeyTransform('cantidad_nueva', 'detalles'), name='auditoria_det_cant_nueva_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditoria',
+            index=models.Index(django.db.models.fields.json.KeyTransform('contador_falla', 'detalles'), name='auditoria_det_cont_falla_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditoria',
+            index=models.Index(django.db.models.fields.json.KeyTransform('usuario_afectado', 'detalles'), name='auditoria_det_usuario_af_idx'),
+        ),
+    ]
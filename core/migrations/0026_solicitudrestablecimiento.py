@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def copiar_solicitudes_desde_auditoria(apps, schema_editor):
+    """
+    Crea las solicitudes a partir de los registros de auditoría existentes.
+    Una solicitud queda atendida si hay un restablecimiento por admin posterior para el mismo usuario.
+    """
+    Auditoria = apps.get_model('core', 'Auditoria')
+    Usuario = apps.get_model('core', 'Usuario')
+    SolicitudRestablecimiento = apps.get_model('core', 'SolicitudRestablecimiento')
+
+    solicitudes = list(
+        Auditoria.objects.filter(accion='password_reset_request').values('usuario_id', 'detalles', 'fecha_hora')
+    )
+    if not solicitudes:
+        return
+
+    # Restablecimientos por username del usuario afectado, ordenados por fecha
+    restablecimientos = {}
+    for registro in Auditoria.objects.filter(accion='password_reset_admin').order_by('fecha_hora').values('usuario_id', 'detalles', 'fecha_hora'):
+        detalles = registro['detalles']
+        username = detalles.get('usuario_afectado') if isinstance(detalles, dict) else None
+        if username:
+            restablecimientos.setdefault(username, []).append(registro)
+
+    usuarios = Usuario.objects.in_bulk(
+        {solicitud['usuario_id'] for solicitud in solicitudes if solicitud['usuario_id']}
+    )
+
+    nuevas = []
+    for solicitud in solicitudes:
+        usuario = usuarios.get(solicitud['usuario_id'])
+        if usuario is None:
+            continue
+        atencion = next(
+            (r for r in restablecimientos.get(usuario.username, []) if r['fecha_hora'] >= solicitud['fecha_hora']),
+            None,
+        )
+        nuevas.append(SolicitudRestablecimiento(
+            usuario_id=usuario.id,
+            fecha_solicitud=solicitud['fecha_hora'],
+            fecha_atencion=atencion['fecha_hora'] if atencion else None,
+            atendida_por_id=atencion['usuario_id'] if atencion else None,
+        ))
+    SolicitudRestablecimiento.objects.bulk_create(nuevas, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_auditoria_detalles_jsonfield'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolicitudRestablecimiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_solicitud', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha de Solicitud')),
+                ('fecha_atencion', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Atención')),
+                ('atendida_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='solicitudes_restablecimiento_atendidas', to=settings.AUTH_USER_MODEL, verbose_name='Atendida por')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='solicitudes_restablecimiento', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Solicitud de Restablecimiento',
+                'verbose_name_plural': 'Solicitudes de Restablecimiento',
+                'ordering': ['-fecha_solicitud'],
+                'indexes': [models.Index(fields=['usuario', 'fecha_atencion', 'fecha_solicitud'], name='solicitud_rest_pendiente_idx')],
+            },
+        ),
+        migrations.RunPython(copiar_solicitudes_desde_auditoria, migrations.RunPython.noop),
+    ]
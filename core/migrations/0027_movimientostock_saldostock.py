@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def crear_movimientos_iniciales(apps, schema_editor):
+    """
+    Registra el stock actual de cada producto como movimiento inicial, para que
+    la suma de los movimientos coincida con Inventario.cantidad desde el comienzo.
+    """
+    Inventario = apps.get_model('core', 'Inventario')
+    MovimientoStock = apps.get_model('core', 'MovimientoStock')
+
+    MovimientoStock.objects.bulk_create([
+        MovimientoStock(producto_id=producto['id'], delta=producto['cantidad'], motivo='inicial', fecha=producto['fecha_actualizacion'])
+        for producto in Inventario.objects.exclude(cantidad=0).values('id', 'cantidad', 'fecha_actualizacion')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_solicitudrestablecimiento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(verbose_name='Fecha de Corte')),
+                ('cantidad', models.IntegerField(verbose_name='Cantidad')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='core.inventario', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Saldo de Stock',
+                'verbose_name_plural': 'Saldos de Stock',
+                'ordering': ['-fecha'],
+                'unique_together': {('producto', 'fecha')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField(verbose_name='Variación')),
+                ('motivo', models.CharField(choices=[('inicial', 'Stock inicial'), ('ajuste', 'Ajuste manual'), ('conteo', 'Conteo'), ('edicion', 'Edición del producto')], default='ajuste', max_length=20, verbose_name='Motivo')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='core.inventario', verbose_name='Producto')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_stock', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Stock',
+                'verbose_name_plural': 'Movimientos de Stock',
+                'ordering': ['-fecha'],
+                'indexes': [models.Index(fields=['producto', 'fecha'], name='movimiento_stock_prod_fecha')],
+            },
+        ),
+        migrations.RunPython(crear_movimientos_iniciales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations
+
+CONTACTOS_POR_DEFECTO = [
+    {
+        'nombre': 'Gerente General',
+        'cargo': 'Gerente General',
+        'email': 'gerente.general@popupnescafe.cl',
+        'telefono': '+56 9 XXXX XXXX',
+        'orden': 1,
+    },
+    {
+        'nombre': 'Gerente de Operaciones',
+        'cargo': 'Gerente de Operaciones',
+        'email': 'operaciones@popupnescafe.cl',
+        'telefono': '+56 9 XXXX XXXX',
+        'orden': 2,
+    },
+    {
+        'nombre': 'Gerente de Recursos Humanos',
+        'cargo': 'Gerente de RRHH',
+        'email': 'rrhh@popupnescafe.cl',
+        'telefono': '+56 9 XXXX XXXX',
+        'orden': 3,
+    },
+    {
+        'nombre': 'Gerente de Marketing',
+        'cargo': 'Gerente de Marketing',
+        'email': 'marketing@popupnescafe.cl',
+        'telefono': '+56 9 XXXX XXXX',
+        'orden': 4,
+    },
+    {
+        'nombre': 'Gerente de Finanzas',
+        'cargo': 'Gerente de Finanzas',
+        'email': 'finanzas@popupnescafe.cl',
+        'telefono': '+56 9 XXXX XXXX',
+        'orden': 5,
+    },
+]
+
+
+def crear_contactos_por_defecto(apps, schema_editor):
+    """
+    Crea los contactos de gerencia por defecto si todavía no hay ninguno (antes lo
+    hacían contactanos_view y gestionar_contactos_view en cada request).
+    """
+    Contacto = apps.get_model('core', 'Contacto')
+    if Contacto.objects.exists():
+        return
+    Contacto.objects.bulk_create([Contacto(activo=True, **contacto) for contacto in CONTACTOS_POR_DEFECTO])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_movimientostock_saldostock'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_contactos_por_defecto, migrations.RunPython.noop),
+    ]
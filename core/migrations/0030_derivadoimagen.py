@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_tarea'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DerivadoImagen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original', models.CharField(max_length=255, verbose_name='Imagen Original')),
+                ('ancho', models.PositiveIntegerField(verbose_name='Ancho')),
+                ('extension', models.CharField(max_length=10, verbose_name='Extensión')),
+                ('nombre', models.CharField(max_length=255, verbose_name='Nombre en el Storage')),
+            ],
+            options={
+                'verbose_name': 'Derivado de Imagen',
+                'verbose_name_plural': 'Derivados de Imágenes',
+                'unique_together': {('original', 'ancho', 'extension')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:39
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_derivadoimagen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubidaPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(max_length=100, verbose_name='Modelo')),
+                ('objeto_id', models.PositiveBigIntegerField(verbose_name='ID del Registro')),
+                ('nombre', models.CharField(max_length=255, verbose_name='Nombre Pedido')),
+                ('contenido', models.BinaryField(verbose_name='Contenido')),
+                ('fecha_creacion', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha de Creación')),
+            ],
+            options={
+                'verbose_name': 'Subida Pendiente',
+                'verbose_name_plural': 'Subidas Pendientes',
+                'indexes': [models.Index(fields=['modelo', 'objeto_id'], name='subida_modelo_objeto')],
+            },
+        ),
+    ]
@@ -1,8 +1,14 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.fields.json import KeyTransform
+from django.db.models.functions import Coalesce
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 import re
+from datetime import timedelta
+from decimal import Decimal
 
 
 def validar_rut_chileno(rut):
@@ -95,6 +101,10 @@ class Usuario(AbstractUser):
         return self._es_administrador or self.is_superuser
 
 
+class ConflictoStockError(Exception):
+    """El stock del producto cambió desde que se leyó (la versión enviada ya no coincide)"""
+
+
 class Inventario(models.Model):
     """Modelo para gestionar el inventario"""
     CATEGORIA_CHOICES = [
@@ -119,6 +129,140 @@ class Inventario(models.Model):
     
     def __str__(self):
         return f"{self.nombre} ({self.get_categoria_display()}) - Cantidad: {self.cantidad}"
+    
+    @property
+    def version_stock(self):
+        """Versión del stock para el control de concurrencia optimista (fecha_actualizacion en ISO 8601)"""
+        return self.fecha_actualizacion.isoformat() if self.fecha_actualizacion else ''
+    
+    def ajustar_stock(self, delta, usuario=None, motivo='ajuste'):
+        """
+        Suma delta (positivo o negativo) al stock con un UPDATE atómico sobre F('cantidad').
+        Solo se escriben cantidad y fecha_actualizacion; dos ajustes simultáneos nunca se pisan.
+        El movimiento queda en MovimientoStock dentro de la misma transacción.
+        
+        Returns:
+            Tupla (cantidad_anterior, cantidad_nueva)
+        
+        Raises:
+            ValidationError: si el stock quedaría negativo
+        """
+        ahora = timezone.now()
+        with transaction.atomic():
+            filas = Inventario.objects.filter(pk=self.pk)
+            if delta < 0:
+                filas = filas.filter(cantidad__gte=-delta)
+            if not filas.update(cantidad=F('cantidad') + delta, fecha_actualizacion=ahora):
+                if not Inventario.objects.filter(pk=self.pk).exists():
+                    raise Inventario.DoesNotExist('El producto ya no existe')
+                raise ValidationError('No hay stock suficiente para descontar esa cantidad')
+            # El UPDATE mantiene bloqueada la fila hasta el commit, así que esta lectura es consistente
+            cantidad_nueva = Inventario.objects.filter(pk=self.pk).values_list('cantidad', flat=True).get()
+            MovimientoStock.objects.create(producto_id=self.pk, delta=delta, motivo=motivo, usuario=usuario, fecha=ahora)
+            # update() no envía post_save: invalidar el catálogo en caché explícitamente
+            from .catalogo import invalidar_catalogo
+            invalidar_catalogo()
+        
+        self.cantidad = cantidad_nueva
+        self.fecha_actualizacion = ahora
+        return cantidad_nueva - delta, cantidad_nueva
+    
+    def fijar_stock(self, cantidad, version=None, usuario=None, motivo='ajuste'):
+        """
+        Reemplaza el stock por una cantidad contada, bloqueando solo la fila del producto.
+        La diferencia con el stock anterior queda en MovimientoStock.
+        
+        Args:
+            cantidad: Nueva cantidad
+            version: fecha_actualizacion que tenía el producto cuando se leyó; si cambió
+                entretanto (otro usuario modificó el stock) se lanza ConflictoStockError
+            usuario: Usuario que hace el cambio (para el movimiento)
+            motivo: Motivo del movimiento (ver MovimientoStock.MOTIVO_CHOICES)
+        
+        Returns:
+            Tupla (cantidad_anterior, cantidad_nueva)
+        """
+        ahora = timezone.now()
+        with transaction.atomic():
+            actual = Inventario.objects.select_for_update().filter(pk=self.pk).values('cantidad', 'fecha_actualizacion').first()
+            if actual is None:
+                raise Inventario.DoesNotExist('El producto ya no existe')
+            if version is not None and actual['fecha_actualizacion'] != version:
+                raise ConflictoStockError(f'El stock de "{self.nombre}" fue modificado por otro usuario')
+            Inventario.objects.filter(pk=self.pk).update(cantidad=cantidad, fecha_actualizacion=ahora)
+            if cantidad != actual['cantidad']:
+                MovimientoStock.objects.create(producto_id=self.pk, delta=cantidad - actual['cantidad'], motivo=motivo, usuario=usuario, fecha=ahora)
+            from .catalogo import invalidar_catalogo
+            invalidar_catalogo()
+        
+        self.cantidad = cantidad
+        self.fecha_actualizacion = ahora
+        return actual['cantidad'], cantidad
+    
+    def stock_en(self, momento):
+        """
+        Stock que tenía el producto en un momento dado.
+        
+        Parte del SaldoStock más cercano anterior a momento y suma solo los movimientos
+        posteriores a ese saldo (rango sobre el índice producto + fecha), sin recorrer
+        toda la historia.
+        """
+        saldo = self.saldos.filter(fecha__lte=momento).order_by('-fecha').values('fecha', 'cantidad').first()
+        movimientos = self.movimientos.filter(fecha__lte=momento)
+        base = 0
+        if saldo:
+            movimientos = movimientos.filter(fecha__gt=saldo['fecha'])
+            base = saldo['cantidad']
+        return base + (movimientos.aggregate(total=Sum('delta'))['total'] or 0)
+
+
+class MovimientoStock(models.Model):
+    """
+    Movimiento del stock de un producto (libro de movimientos, solo se agregan filas).
+    Inventario.cantidad es el saldo materializado de estos movimientos.
+    """
+    MOTIVO_CHOICES = [
+        ('inicial', 'Stock inicial'),
+        ('ajuste', 'Ajuste manual'),
+        ('conteo', 'Conteo'),
+        ('edicion', 'Edición del producto'),
+    ]
+    
+    producto = models.ForeignKey(Inventario, on_delete=models.CASCADE, related_name='movimientos', verbose_name='Producto')
+    delta = models.IntegerField(verbose_name='Variación')
+    motivo = models.CharField(max_length=20, choices=MOTIVO_CHOICES, default='ajuste', verbose_name='Motivo')
+    usuario = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_stock', verbose_name='Usuario')
+    fecha = models.DateTimeField(default=timezone.now, verbose_name='Fecha')
+    
+    class Meta:
+        verbose_name = 'Movimiento de Stock'
+        verbose_name_plural = 'Movimientos de Stock'
+        ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['producto', 'fecha'], name='movimiento_stock_prod_fecha'),
+        ]
+    
+    def __str__(self):
+        return f"{self.producto.nombre}: {self.delta:+d} ({self.get_motivo_display()}) - {self.fecha.strftime('%d/%m/%Y %H:%M')}"
+
+
+class SaldoStock(models.Model):
+    """
+    Foto periódica del stock de un producto (generada con el comando generar_saldos_stock),
+    para responder "stock en la fecha D" sin sumar todos los movimientos desde el inicio.
+    """
+    producto = models.ForeignKey(Inventario, on_delete=models.CASCADE, related_name='saldos', verbose_name='Producto')
+    fecha = models.DateTimeField(verbose_name='Fecha de Corte')
+    cantidad = models.IntegerField(verbose_name='Cantidad')
+    
+    class Meta:
+        verbose_name = 'Saldo de Stock'
+        verbose_name_plural = 'Saldos de Stock'
+        ordering = ['-fecha']
+        unique_together = ['producto', 'fecha']
+    
+    def __str__(self):
+        return f"{self.producto.nombre} al {self.fecha.strftime('%d/%m/%Y %H:%M')}: {self.cantidad}"
 
 
 class Asistencia(models.Model):
@@ -196,12 +340,49 @@ class RegistroLlamada(models.Model):
         return f"Llamada #{self.contador_llamada} - {self.motivo} - {self.fecha}"
 
 
+def _expresion_subtotal(prefijo=''):
+    """Expresión SQL de cantidad * precio_unitario para los detalles de pedido"""
+    return F(f'{prefijo}cantidad') * F(f'{prefijo}precio_unitario')
+
+
+class PedidoQuerySet(models.QuerySet):
+    """QuerySet con los cálculos de totales de pedidos resueltos en la base de datos"""
+    
+    def with_totals(self):
+        """Anota cada pedido con 'total_calculado' y 'num_detalles' en una sola consulta"""
+        return self.annotate(
+            total_calculado=Coalesce(
+                Sum(_expresion_subtotal('detalles__'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+                Value(0),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+            num_detalles=Count('detalles'),
+        )
+    
+    def total_spent(self, desde=None, hasta=None):
+        """
+        Retorna la suma de los totales almacenados de los pedidos del queryset,
+        opcionalmente acotada al rango de fechas [desde, hasta].
+        """
+        pedidos = self
+        if desde:
+            pedidos = pedidos.filter(fecha_creacion__gte=desde)
+        if hasta:
+            pedidos = pedidos.filter(fecha_creacion__lte=hasta)
+        return pedidos.aggregate(suma=Sum('total'))['suma'] or 0
+
+
 class Pedido(models.Model):
     """Modelo para gestionar pedidos"""
     codigo = models.CharField(max_length=200, verbose_name='Código del Pedido')
     fecha_creacion = models.DateTimeField(default=timezone.now, verbose_name='Fecha de Creación')
     usuario_creacion = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='pedidos_creados', verbose_name='Usuario que Crea')
     observaciones = models.TextField(blank=True, verbose_name='Observaciones')
+    # Totales desnormalizados, mantenidos por DetallePedido.save()/delete()
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Total')
+    num_items = models.IntegerField(default=0, verbose_name='Cantidad de Productos')
+    
+    objects = PedidoQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Pedido'
@@ -210,6 +391,15 @@ class Pedido(models.Model):
     
     def __str__(self):
         return f"Pedido: {self.codigo} - {self.fecha_creacion.strftime('%d/%m/%Y %H:%M')}"
+    
+    def actualizar_totales(self):
+        """Recalcula total y num_items desde los detalles y los guarda"""
+        resultado = Pedido.objects.filter(pk=self.pk).with_totals().values('total_calculado', 'num_detalles').first()
+        if resultado is None:
+            return
+        self.total = resultado['total_calculado']
+        self.num_items = resultado['num_detalles']
+        Pedido.objects.filter(pk=self.pk).update(total=self.total, num_items=self.num_items)
 
 
 class DetallePedido(models.Model):
@@ -229,10 +419,55 @@ class DetallePedido(models.Model):
         """Calcula el precio total del detalle (cantidad * precio_unitario)"""
         return self.cantidad * self.precio_unitario
     
+    @staticmethod
+    def _aplicar_delta(pedido_id, delta_total, delta_items):
+        """Aplica un incremento atómico a los totales almacenados del pedido"""
+        if not delta_total and not delta_items:
+            return
+        Pedido.objects.filter(pk=pedido_id).update(
+            total=F('total') + delta_total,
+            num_items=F('num_items') + delta_items,
+        )
+    
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            anterior = None
+            if self.pk:
+                anterior = DetallePedido.objects.filter(pk=self.pk).values('pedido_id', 'cantidad', 'precio_unitario').first()
+            super().save(*args, **kwargs)
+            subtotal = self.cantidad * Decimal(str(self.precio_unitario))
+            if anterior is None:
+                self._aplicar_delta(self.pedido_id, subtotal, 1)
+            else:
+                subtotal_anterior = anterior['cantidad'] * anterior['precio_unitario']
+                if anterior['pedido_id'] == self.pedido_id:
+                    self._aplicar_delta(self.pedido_id, subtotal - subtotal_anterior, 0)
+                else:
+                    self._aplicar_delta(anterior['pedido_id'], -subtotal_anterior, -1)
+                    self._aplicar_delta(self.pedido_id, subtotal, 1)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            anterior = DetallePedido.objects.filter(pk=self.pk).values('pedido_id', 'cantidad', 'precio_unitario').first()
+            resultado = super().delete(*args, **kwargs)
+            if anterior is not None:
+                self._aplicar_delta(anterior['pedido_id'], -(anterior['cantidad'] * anterior['precio_unitario']), -1)
+        return resultado
+    
     def __str__(self):
         return f"{self.producto_nombre} - Cantidad: {self.cantidad} - Precio: ${self.precio_unitario}"
 
 
+class AuditoriaJSONEncoder(DjangoJSONEncoder):
+    """Encoder de los detalles de auditoría: los valores no serializables se guardan como texto"""
+    
+    def default(self, o):
+        try:
+            return super().default(o)
+        except TypeError:
+            return str(o)
+
+
 class Auditoria(models.Model):
     """Modelo para registrar todas las acciones del sistema"""
     ACCION_CHOICES = [
@@ -291,7 +526,7 @@ class Auditoria(models.Model):
     accion = models.CharField(max_length=50, choices=ACCION_CHOICES, verbose_name='Acción')
     modulo = models.CharField(max_length=50, choices=MODULO_CHOICES, verbose_name='Módulo')
     descripcion = models.TextField(verbose_name='Descripción')
-    detalles = models.TextField(blank=True, null=True, verbose_name='Detalles Adicionales (JSON)')
+    detalles = models.JSONField(blank=True, null=True, encoder=AuditoriaJSONEncoder, verbose_name='Detalles Adicionales (JSON)')
     fecha_hora = models.DateTimeField(default=timezone.now, verbose_name='Fecha y Hora')
     objeto_afectado = models.CharField(max_length=200, blank=True, null=True, verbose_name='Objeto Afectado')
     
@@ -304,6 +539,12 @@ class Auditoria(models.Model):
             models.Index(fields=['usuario']),
             models.Index(fields=['modulo']),
             models.Index(fields=['accion']),
+            # Índices de expresión sobre las claves de detalles más consultadas
+            # (ej. detalles__cantidad_nueva__lt=0). Los aprovecha PostgreSQL; en SQLite
+            # la ruta JSON va como parámetro y el planificador no los usa.
+            models.Index(KeyTransform('cantidad_nueva', 'detalles'), name='auditoria_det_cant_nueva_idx'),
+            models.Index(KeyTransform('contador_falla', 'detalles'), name='auditoria_det_cont_falla_idx'),
+            models.Index(KeyTransform('usuario_afectado', 'detalles'), name='auditoria_det_usuario_af_idx'),
         ]
     
     def __str__(self):
@@ -311,6 +552,66 @@ class Auditoria(models.Model):
         return f"{usuario_nombre} - {self.get_accion_display()} - {self.fecha_hora.strftime('%d/%m/%Y %H:%M:%S')}"
 
 
+class ArchivoAuditoria(models.Model):
+    """Registros de auditoría archivados de un mes, guardados como JSON Lines comprimido con gzip"""
+    mes = models.DateField(unique=True, verbose_name='Mes')  # Primer día del mes archivado
+    cantidad = models.IntegerField(default=0, verbose_name='Cantidad de Registros')
+    contenido = models.BinaryField(verbose_name='Contenido (JSON Lines + gzip)')
+    fecha_creacion = models.DateTimeField(default=timezone.now, verbose_name='Fecha de Creación')
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')
+    
+    class Meta:
+        verbose_name = 'Archivo de Auditoría'
+        verbose_name_plural = 'Archivos de Auditoría'
+        ordering = ['-mes']
+    
+    def __str__(self):
+        return f"Auditoría {self.mes.strftime('%m/%Y')} - {self.cantidad} registros"
+
+
+# Días durante los que una solicitud de restablecimiento sin atender se considera pendiente
+DIAS_SOLICITUD_RESTABLECIMIENTO = 30
+
+
+class SolicitudRestablecimientoQuerySet(models.QuerySet):
+    """QuerySet de SolicitudRestablecimiento con las consultas de solicitudes pendientes"""
+
+    def pending_reset_requests(self, dias=DIAS_SOLICITUD_RESTABLECIMIENTO):
+        """Solicitudes sin atender hechas en los últimos 'dias' días (usa el índice por usuario y fecha_atencion)"""
+        fecha_limite = timezone.now() - timedelta(days=dias)
+        return self.filter(fecha_atencion__isnull=True, fecha_solicitud__gte=fecha_limite)
+
+
+class SolicitudRestablecimiento(models.Model):
+    """Solicitud de restablecimiento de contraseña hecha por un usuario, pendiente hasta que un administrador la atiende"""
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='solicitudes_restablecimiento', verbose_name='Usuario')
+    fecha_solicitud = models.DateTimeField(default=timezone.now, verbose_name='Fecha de Solicitud')
+    fecha_atencion = models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Atención')
+    atendida_por = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='solicitudes_restablecimiento_atendidas', verbose_name='Atendida por')
+
+    objects = SolicitudRestablecimientoQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Solicitud de Restablecimiento'
+        verbose_name_plural = 'Solicitudes de Restablecimiento'
+        ordering = ['-fecha_solicitud']
+        indexes = [
+            models.Index(fields=['usuario', 'fecha_atencion', 'fecha_solicitud'], name='solicitud_rest_pendiente_idx'),
+        ]
+
+    def __str__(self):
+        estado = 'Atendida' if self.fecha_atencion else 'Pendiente'
+        return f"{self.usuario.username} - {self.fecha_solicitud.strftime('%d/%m/%Y %H:%M')} ({estado})"
+
+    @classmethod
+    def marcar_atendidas(cls, usuario, atendida_por=None):
+        """Marca como atendidas todas las solicitudes abiertas del usuario"""
+        return cls.objects.filter(usuario=usuario, fecha_atencion__isnull=True).update(
+            fecha_atencion=timezone.now(),
+            atendida_por=atendida_por,
+        )
+
+
 class ImagenCarrusel(models.Model):
     """Modelo para gestionar las imágenes del carrusel"""
     imagen = models.ImageField(upload_to='carousel/', verbose_name='Imagen del Carrusel')
@@ -417,3 +718,79 @@ class Contacto(models.Model):
         return f"{self.nombre} - {self.cargo}"
 
 
+
+
+class Tarea(models.Model):
+    """
+    Trabajo en segundo plano (cola en la base de datos, sin broker externo).
+    Se encola con core.tareas.encolar() y lo ejecuta el comando run_worker.
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('completada', 'Completada'),
+        ('fallida', 'Fallida'),
+    ]
+    
+    tipo = models.CharField(max_length=50, verbose_name='Tipo')
+    parametros = models.JSONField(default=dict, blank=True, verbose_name='Parámetros')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente', verbose_name='Estado')
+    intentos = models.PositiveSmallIntegerField(default=0, verbose_name='Intentos')
+    disponible_desde = models.DateTimeField(default=timezone.now, verbose_name='Disponible Desde')
+    error = models.TextField(blank=True, verbose_name='Último Error')
+    fecha_creacion = models.DateTimeField(default=timezone.now, verbose_name='Fecha de Creación')
+    fecha_inicio = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de Inicio')
+    fecha_fin = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de Término')
+    
+    class Meta:
+        verbose_name = 'Tarea'
+        verbose_name_plural = 'Tareas'
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'disponible_desde'], name='tarea_estado_disponible'),
+        ]
+    
+    def __str__(self):
+        return f"{self.tipo} ({self.get_estado_display()}) - {self.fecha_creacion.strftime('%d/%m/%Y %H:%M')}"
+
+
+class DerivadoImagen(models.Model):
+    """
+    Versión redimensionada de una imagen subida (ver core.imagenes). Guarda el nombre
+    con que el storage la guardó, que puede no ser el que se pidió.
+    """
+    original = models.CharField(max_length=255, verbose_name='Imagen Original')
+    ancho = models.PositiveIntegerField(verbose_name='Ancho')
+    extension = models.CharField(max_length=10, verbose_name='Extensión')
+    nombre = models.CharField(max_length=255, verbose_name='Nombre en el Storage')
+    
+    class Meta:
+        verbose_name = 'Derivado de Imagen'
+        verbose_name_plural = 'Derivados de Imágenes'
+        unique_together = ['original', 'ancho', 'extension']
+    
+    def __str__(self):
+        return self.nombre
+
+
+class SubidaPendiente(models.Model):
+    """
+    Imagen recibida en un request que todavía no se sube al storage. El request la deja
+    en la base de datos (compartida con el worker) y la tarea 'subir_imagen' la sube y la
+    asigna a su registro (ver core.imagenes).
+    """
+    modelo = models.CharField(max_length=100, verbose_name='Modelo')
+    objeto_id = models.PositiveBigIntegerField(verbose_name='ID del Registro')
+    nombre = models.CharField(max_length=255, verbose_name='Nombre Pedido')
+    contenido = models.BinaryField(verbose_name='Contenido')
+    fecha_creacion = models.DateTimeField(default=timezone.now, verbose_name='Fecha de Creación')
+    
+    class Meta:
+        verbose_name = 'Subida Pendiente'
+        verbose_name_plural = 'Subidas Pendientes'
+        indexes = [
+            models.Index(fields=['modelo', 'objeto_id'], name='subida_modelo_objeto'),
+        ]
+    
+    def __str__(self):
+        return f"{self.nombre} ({self.modelo} #{self.objeto_id})"
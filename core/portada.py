@@ -0,0 +1,88 @@
+"""
+Caché de la página principal (index_view).
+
+El contenido de la portada (carrusel, último evento y última noticia) cambia pocas
+veces al mes, así que se guarda en el caché bajo una versión de contenido que se
+incrementa, al confirmarse la transacción, con cada post_save/post_delete de
+ImagenCarrusel, Evento o Noticia.
+
+Hay dos niveles:
+- Página completa: solo para visitantes anónimos sin mensajes pendientes; un acierto
+  responde sin consultar la base de datos.
+- Fragmentos ({% cache %} en index.html, con la versión como clave): los usan los
+  usuarios autenticados, cuya página depende de su sesión y no se puede compartir.
+
+Como la versión cambia en cuanto se guarda un cambio, los administradores ven sus
+ediciones de inmediato. Las entradas de versiones anteriores simplemente vencen.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+from .cache import ClaveVersionada, cache_contenido as cache
+from .imagenes import precargar_derivados
+from .models import Evento, ImagenCarrusel, Noticia
+
+_version = ClaveVersionada('default', 'portada:version')
+DURACION_CACHE = 24 * 60 * 60
+
+
+def version_portada():
+    """Versión vigente del contenido de la portada"""
+    return _version.version()
+
+
+def invalidar_portada():
+    """Marca la portada en caché como desactualizada cuando se confirme la transacción en curso"""
+    _version.invalidar()
+
+
+@receiver(post_save, sender=ImagenCarrusel)
+@receiver(post_delete, sender=ImagenCarrusel)
+@receiver(post_save, sender=Evento)
+@receiver(post_delete, sender=Evento)
+@receiver(post_save, sender=Noticia)
+@receiver(post_delete, sender=Noticia)
+def _invalidar_al_cambiar_contenido(sender, **kwargs):
+    invalidar_portada()
+
+
+def imagenes_carrusel():
+    """
+    Imágenes activas del carrusel ordenadas por su campo 'orden'.
+
+    Se pasa a la plantilla sin llamar (la plantilla la llama al usarla), así la
+    consulta solo se hace cuando el fragmento del carrusel no está en el caché. Las
+    imágenes que el worker todavía no sube (ver core.imagenes) no se muestran.
+    """
+    imagenes = []
+    for imagen in ImagenCarrusel.objects.filter(activo=True).exclude(imagen='').order_by('orden', 'fecha_creacion'):
+        imagenes.append({
+            'tipo': 'real',
+            'imagen': imagen,
+            'indice': imagen.orden if imagen.orden > 0 else len(imagenes) + 1,
+            'titulo_barista': imagen.titulo_barista if imagen.orden == 1 else None
+        })
+    # Ordenar por índice (orden) para asegurar el orden correcto
+    imagenes.sort(key=lambda x: x['indice'])
+    precargar_derivados([item['imagen'].imagen.name for item in imagenes])
+    return imagenes
+
+
+def _clave_pagina(version):
+    return f'portada:pagina:{version}'
+
+
+def pagina_en_cache(version):
+    """Respuesta guardada para la versión dada, o None si no está en el caché"""
+    guardada = cache.get(_clave_pagina(version))
+    if guardada is None:
+        return None
+    contenido, tipo = guardada
+    return HttpResponse(contenido, content_type=tipo)
+
+
+def guardar_pagina(version, respuesta):
+    """Guarda una respuesta 200 de la portada bajo la versión dada"""
+    if respuesta.status_code == 200 and not respuesta.cookies:
+        cache.set(_clave_pagina(version), (respuesta.content, respuesta['Content-Type']), DURACION_CACHE)
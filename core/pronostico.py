@@ -0,0 +1,145 @@
+"""
+Pronóstico de consumo del inventario y sugerencias de reposición.
+
+El consumo diario de cada producto sale de MovimientoStock (los movimientos negativos:
+descuentos y conteos que bajan el stock). La tasa de consumo es un suavizado
+exponencial (EWMA) de esos totales diarios, calculado para todos los productos en
+una sola pasada por día.
+
+Los totales diarios se guardan en el caché. Cada consulta vuelve a leer los movimientos
+de la franja de los últimos MARGEN_IDS ids (sobre el "piso" guardado) y suma solo los
+que no había contado, usando los ids ya contados de esa franja: con transacciones
+concurrentes (PostgreSQL) un movimiento con id menor puede confirmarse después de que
+se leyó uno mayor, y sin la franja quedaría fuera hasta la reconstrucción. El caché
+vence a diario, lo que fuerza una reconstrucción completa.
+"""
+import math
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .cache import cache_inventario as cache
+from .models import Inventario, MovimientoStock
+
+CLAVE_CACHE = 'pronostico_consumo:2'
+DURACION_CACHE = 24 * 60 * 60
+DIAS_HISTORIA = 90
+# Peso del último día en la tasa suavizada (0 < ALFA <= 1)
+ALFA = 0.3
+# Días de consumo que debe cubrir un pedido sugerido
+DIAS_COBERTURA = 14
+# Ids bajo el mayor leído que se vuelven a revisar (más que los movimientos que se
+# insertan mientras una transacción de stock sigue abierta)
+MARGEN_IDS = 1000
+
+
+def _consumos_diarios(hasta_id, desde_fecha):
+    """Consumo por producto y día (dia en ISO) de los movimientos con id hasta hasta_id desde desde_fecha"""
+    filas = (
+        MovimientoStock.objects.filter(id__lte=hasta_id, delta__lt=0, fecha__gte=desde_fecha)
+        .annotate(dia=TruncDate('fecha'))
+        .values('producto_id', 'dia')
+        .annotate(consumo=Sum('delta'))
+    )
+    return [(fila['producto_id'], fila['dia'].isoformat(), -fila['consumo']) for fila in filas]
+
+
+def _movimientos_recientes(piso):
+    """Consumos (id, producto_id, dia en ISO, consumo) de los movimientos con id mayor a piso"""
+    filas = MovimientoStock.objects.filter(id__gt=piso, delta__lt=0).values_list('id', 'producto_id', 'fecha', 'delta')
+    return [(id_, producto_id, timezone.localtime(fecha).date().isoformat(), -delta) for id_, producto_id, fecha, delta in filas]
+
+
+def _estado_actualizado():
+    """
+    Retorna el estado del caché ({'piso', 'contados', 'consumos': {producto_id: {dia: consumo}}})
+    con los movimientos nuevos ya sumados. Los movimientos con id hasta 'piso' están todos
+    sumados; de los siguientes, solo los de 'contados'.
+    """
+    estado = cache.get(CLAVE_CACHE)
+    limite = (timezone.localdate() - timedelta(days=DIAS_HISTORIA)).isoformat()
+    consumos_nuevos = []
+    reconstruido = estado is None
+    if reconstruido:
+        ultimo_id = MovimientoStock.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        piso = max(ultimo_id - MARGEN_IDS, 0)
+        estado = {'piso': piso, 'contados': set(), 'consumos': {}}
+        consumos_nuevos = _consumos_diarios(piso, timezone.now() - timedelta(days=DIAS_HISTORIA + 1))
+
+    recientes = [fila for fila in _movimientos_recientes(estado['piso']) if fila[0] not in estado['contados']]
+    if not reconstruido and not recientes:
+        return estado
+    for id_, producto_id, dia, consumo in recientes:
+        estado['contados'].add(id_)
+        if dia >= limite:
+            consumos_nuevos.append((producto_id, dia, consumo))
+
+    consumos = estado['consumos']
+    for producto_id, dia, consumo in consumos_nuevos:
+        dias = consumos.setdefault(producto_id, {})
+        dias[dia] = dias.get(dia, 0) + consumo
+    # Descartar los días que quedaron fuera de la ventana de historia
+    for dias in consumos.values():
+        for dia in [dia for dia in dias if dia < limite]:
+            del dias[dia]
+
+    # Subir el piso hasta MARGEN_IDS bajo el mayor id contado
+    if estado['contados']:
+        estado['piso'] = max(estado['piso'], max(estado['contados']) - MARGEN_IDS)
+        estado['contados'] = {id_ for id_ in estado['contados'] if id_ > estado['piso']}
+    cache.set(CLAVE_CACHE, estado, DURACION_CACHE)
+    return estado
+
+
+def tasas_de_consumo():
+    """
+    Tasa de consumo diaria suavizada de cada producto con historia.
+
+    Solo se usan días completos (hasta ayer). La serie de cada producto parte en su
+    primer día con consumo y los días sin consumo cuentan como cero.
+
+    Returns:
+        Diccionario producto_id -> unidades por día
+    """
+    consumos = _estado_actualizado()['consumos']
+    hoy = timezone.localdate()
+    dias = [(hoy - timedelta(days=atras)).isoformat() for atras in range(DIAS_HISTORIA, 0, -1)]
+
+    tasas = {}
+    for dia in dias:
+        for producto_id, por_dia in consumos.items():
+            consumo = por_dia.get(dia, 0)
+            if producto_id in tasas:
+                tasas[producto_id] = ALFA * consumo + (1 - ALFA) * tasas[producto_id]
+            elif consumo:
+                tasas[producto_id] = consumo
+    return tasas
+
+
+def sugerencias_de_reposicion(dias_cobertura=DIAS_COBERTURA):
+    """
+    Cantidades sugeridas para pedir, de modo que el stock alcance para dias_cobertura días.
+
+    Returns:
+        Lista de diccionarios con 'producto', 'tasa' (unidades por día), 'dias_restantes'
+        y 'cantidad' sugerida, ordenada por días restantes
+    """
+    tasas = tasas_de_consumo()
+    productos = Inventario.objects.filter(id__in=list(tasas)).only('id', 'nombre', 'categoria', 'cantidad', 'precio_unitario')
+
+    sugerencias = []
+    for producto in productos:
+        tasa = tasas[producto.id]
+        cantidad = math.ceil(tasa * dias_cobertura) - max(producto.cantidad, 0)
+        if tasa <= 0 or cantidad <= 0:
+            continue
+        sugerencias.append({
+            'producto': producto,
+            'tasa': round(tasa, 2),
+            'dias_restantes': round(max(producto.cantidad, 0) / tasa, 1),
+            'cantidad': cantidad,
+        })
+    sugerencias.sort(key=lambda sugerencia: sugerencia['dias_restantes'])
+    return sugerencias
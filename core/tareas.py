@@ -0,0 +1,153 @@
+"""
+Cola de tareas en segundo plano sobre la base de datos (modelo Tarea, sin broker externo).
+
+Los módulos registran sus funciones con @registrar_tarea('tipo') y las encolan con
+encolar('tipo', **parametros) (los parámetros deben poder guardarse como JSON). La
+tarea se inserta en la misma transacción que el cambio que la origina, así que el
+worker solo la ve si ese cambio se confirma.
+
+El comando run_worker toma las tareas pendientes: cada una se reclama con un UPDATE
+condicional sobre el estado, así varios workers pueden correr a la vez sin tomar la
+misma tarea. Una tarea que falla se reintenta con espera exponencial hasta
+MAX_INTENTOS veces y luego queda 'fallida' (visible en el panel, en Tareas).
+
+Con TAREAS_ASINCRONAS=False (por ejemplo, en desarrollo sin worker) encolar() ejecuta
+la tarea en el mismo proceso al confirmarse la transacción.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+# Tipo -> función que ejecuta la tarea
+TIPOS = {}
+MAX_INTENTOS = 3
+# Espera antes del primer reintento, en segundos (se duplica en cada intento)
+ESPERA_REINTENTO = 30
+# Una tarea 'en_proceso' por más tiempo se da por abandonada (el worker se cayó)
+TIEMPO_MAXIMO = 15 * 60
+# Días que se conservan las tareas completadas
+DIAS_HISTORIAL = 7
+
+
+def registrar_tarea(tipo):
+    """Decorador que registra la función como la que ejecuta las tareas del tipo dado"""
+    def decorador(funcion):
+        TIPOS[tipo] = funcion
+        return funcion
+    return decorador
+
+
+def _ejecutar_sincronica(tipo, parametros):
+    try:
+        TIPOS[tipo](**parametros)
+    except Exception:
+        logger.exception('Falló la tarea %s %s', tipo, parametros)
+
+
+def encolar(tipo, **parametros):
+    """
+    Encola una tarea del tipo dado.
+
+    Returns:
+        La Tarea creada (None con TAREAS_ASINCRONAS=False)
+    """
+    if tipo not in TIPOS:
+        raise ValueError(f'Tipo de tarea desconocido: {tipo}')
+    if not getattr(settings, 'TAREAS_ASINCRONAS', True):
+        transaction.on_commit(lambda: _ejecutar_sincronica(tipo, parametros))
+        return None
+    return Tarea.objects.create(tipo=tipo, parametros=parametros)
+
+
+def tomar_siguiente():
+    """Reclama la próxima tarea pendiente disponible y la retorna (None si no hay)"""
+    ahora = timezone.now()
+    candidatas = list(
+        Tarea.objects.filter(estado='pendiente', disponible_desde__lte=ahora)
+        .order_by('disponible_desde', 'id')
+        .values_list('id', flat=True)[:10]
+    )
+    for tarea_id in candidatas:
+        # Si otro worker la tomó antes, el UPDATE no encuentra la fila en 'pendiente'
+        reclamada = Tarea.objects.filter(id=tarea_id, estado='pendiente').update(
+            estado='en_proceso', fecha_inicio=ahora, fecha_fin=None, intentos=F('intentos') + 1,
+        )
+        if reclamada:
+            return Tarea.objects.get(id=tarea_id)
+    return None
+
+
+def ejecutar(tarea):
+    """
+    Ejecuta una tarea reclamada y guarda el resultado.
+
+    Returns:
+        True si la tarea se completó
+    """
+    try:
+        funcion = TIPOS.get(tarea.tipo)
+        if funcion is None:
+            raise LookupError(f'Tipo de tarea desconocido: {tarea.tipo}')
+        funcion(**tarea.parametros)
+    except Exception:
+        logger.warning('Falló la tarea %s (intento %s)', tarea.id, tarea.intentos, exc_info=True)
+        tarea.error = traceback.format_exc()[-4000:]
+        if tarea.intentos < MAX_INTENTOS:
+            tarea.estado = 'pendiente'
+            tarea.disponible_desde = timezone.now() + timedelta(seconds=ESPERA_REINTENTO * 2 ** (tarea.intentos - 1))
+        else:
+            tarea.estado = 'fallida'
+    else:
+        tarea.estado = 'completada'
+        tarea.error = ''
+    tarea.fecha_fin = timezone.now()
+    tarea.save(update_fields=['estado', 'error', 'disponible_desde', 'fecha_fin'])
+    return tarea.estado == 'completada'
+
+
+def ejecutar_pendientes(limite=None):
+    """
+    Ejecuta las tareas pendientes disponibles hasta vaciar la cola (o hasta 'limite' tareas).
+
+    Returns:
+        Cantidad de tareas ejecutadas
+    """
+    ejecutadas = 0
+    while limite is None or ejecutadas < limite:
+        tarea = tomar_siguiente()
+        if tarea is None:
+            break
+        ejecutar(tarea)
+        ejecutadas += 1
+    return ejecutadas
+
+
+def recuperar_abandonadas():
+    """
+    Devuelve a la cola las tareas 'en_proceso' por más de TIEMPO_MAXIMO (o las marca
+    'fallida' si ya agotaron sus intentos).
+
+    Returns:
+        Cantidad de tareas recuperadas o marcadas como fallidas
+    """
+    abandonadas = Tarea.objects.filter(estado='en_proceso', fecha_inicio__lt=timezone.now() - timedelta(seconds=TIEMPO_MAXIMO))
+    error = 'El worker no terminó la tarea (se detuvo o superó el tiempo máximo)'
+    return (
+        abandonadas.filter(intentos__lt=MAX_INTENTOS).update(estado='pendiente', error=error)
+        + abandonadas.update(estado='fallida', error=error, fecha_fin=timezone.now())
+    )
+
+
+def limpiar_historial(dias=DIAS_HISTORIAL):
+    """Borra las tareas completadas hace más de 'dias' días; retorna cuántas borró"""
+    borradas, _ = Tarea.objects.filter(estado='completada', fecha_fin__lt=timezone.now() - timedelta(days=dias)).delete()
+    return borradas
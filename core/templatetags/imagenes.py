@@ -0,0 +1,45 @@
+"""
+Etiquetas de plantilla para imágenes con derivados (ver core.imagenes).
+
+    {% load imagenes %}
+    {% imagen_responsiva evento.imagen sizes="(max-width: 768px) 100vw, 50vw" alt=evento.titulo class="news-image" %}
+"""
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from ..imagenes import FORMATOS, derivados
+
+register = template.Library()
+
+
+def srcset(guardados):
+    """Valor del atributo srcset con los derivados dados (lista de (nombre en el storage, ancho))"""
+    return ', '.join(f'{default_storage.url(derivado)} {ancho}w' for derivado, ancho in guardados)
+
+
+@register.simple_tag
+def imagen_responsiva(imagen, sizes='100vw', **atributos):
+    """
+    <picture> con los derivados WebP y JPEG de la imagen y el original como src.
+
+    Args:
+        imagen: FieldFile de un ImageField o nombre de la imagen en el storage
+        sizes: Ancho con que se muestra la imagen (atributo sizes)
+        atributos: Demás atributos del <img> (alt, class, loading, style...)
+    """
+    nombre = getattr(imagen, 'name', imagen)
+    if not nombre:
+        return ''
+    img_atributos = format_html_join('', ' {}="{}"', sorted(atributos.items()))
+    original = default_storage.url(nombre)
+    guardados = derivados(nombre)
+    webp, jpeg = guardados.get(FORMATOS['WEBP'][0]), guardados.get(FORMATOS['JPEG'][0])
+    if not webp or not jpeg:
+        return format_html('<img src="{}"{}>', original, img_atributos)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        srcset(webp), sizes,
+        original, srcset(jpeg), sizes, img_atributos,
+    )
@@ -0,0 +1,1371 @@
+"""
+Presupuestos de consultas a la base de datos y de tiempo de respuesta por vista.
+
+Recorre todas las rutas de core/urls.py (como administrador, colaborador o visitante)
+sobre una base de datos con datos de tamaño realista y falla si alguna vista supera
+su presupuesto. Un bucle que hace una consulta por fila (N+1) hace crecer la cantidad
+de consultas con los datos y rompe el presupuesto de esa vista.
+
+Ejecutar con: python manage.py test core
+Para máquinas lentas, los tiempos se pueden escalar con PRESUPUESTO_TIEMPO_FACTOR=2.
+"""
+import base64
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import urls as core_urls
+from .archivo_auditoria import CAMPOS_ARCHIVADOS, archivar_mes, leer_archivo, restar_meses
+from .auditoria_buffer import EscritorAuditoria
+from .busqueda import buscar_auditoria, indice_disponible
+from .models import (
+    ArchivoAuditoria, Asistencia, Auditoria, ConflictoStockError, Contacto, DerivadoImagen, DetallePedido, Evento, ImagenCarrusel,
+    Inventario, ManualInterno, MovimientoStock, Noticia, Pedido, RegistroFalla, RegistroLlamada, SaldoStock,
+    SolicitudRestablecimiento, SubidaPendiente, Tarea, Usuario,
+)
+from .utils import codificar_cursor, decodificar_cursor, paginar_por_cursor, registrar_auditoria, registrar_auditoria_lote
+
+ADMIN = 'admin'
+COLABORADOR = 'colaborador'
+VISITANTE = None
+
+# Presupuesto por nombre de URL: (quién hace el request, máximo de consultas, máximo de milisegundos)
+# Toda ruta nueva en core/urls.py debe agregarse aquí. Los requests autenticados incluyen
+# 2 consultas de sesión/usuario y 3 más para guardar la sesión (SESSION_SAVE_EVERY_REQUEST).
+PRESUPUESTOS = {
+    'index': (VISITANTE, 7, 500),
+    'login': (VISITANTE, 0, 300),
+    'logout': (ADMIN, 4, 300),
+    'solicitar_restablecimiento': (VISITANTE, 0, 300),
+    'cambiar_password': (ADMIN, 5, 300),
+    'restablecer_password_admin': (ADMIN, 6, 300),
+    'contactanos': (VISITANTE, 2, 300),
+    'documentacion': (VISITANTE, 3, 300),
+    'equipo': (VISITANTE, 0, 300),
+    'creditos': (VISITANTE, 0, 300),
+    'reglamento_interno': (VISITANTE, 1, 300),
+    'colaborador_dashboard': (COLABORADOR, 5, 300),
+    'registro_asistencia': (COLABORADOR, 5, 300),
+    'cambiar_stock': (COLABORADOR, 6, 500),
+    'actualizar_stock': (COLABORADOR, 6, 300),
+    'conteo_stock': (COLABORADOR, 6, 500),
+    'panel': (ADMIN, 6, 300),
+    'usuarios': (ADMIN, 6, 500),
+    'crear_usuario': (ADMIN, 5, 300),
+    'editar_usuario': (ADMIN, 7, 300),
+    'eliminar_usuario': (ADMIN, 15, 300),
+    'inventario': (ADMIN, 6, 500),
+    'crear_inventario': (ADMIN, 5, 300),
+    'editar_inventario': (ADMIN, 6, 300),
+    'eliminar_inventario': (ADMIN, 6, 300),
+    'asistencia': (ADMIN, 11, 1000),
+    'productos': (ADMIN, 9, 500),
+    'agregar_al_carrito': (ADMIN, 6, 300),
+    'ver_carrito': (ADMIN, 6, 300),
+    'sugerir_carrito': (ADMIN, 5, 300),
+    'eliminar_del_carrito': (ADMIN, 5, 300),
+    'modificar_cantidad_carrito': (ADMIN, 5, 300),
+    'pedidos': (ADMIN, 7, 500),
+    'crear_pedido': (ADMIN, 5, 300),
+    'exportar_pedido_excel': (ADMIN, 7, 1000),
+    'eliminar_pedido': (ADMIN, 6, 300),
+    'editar_precio_producto': (ADMIN, 6, 300),
+    'deliverys': (ADMIN, 5, 300),
+    'operaciones': (ADMIN, 13, 500),
+    'crear_falla': (ADMIN, 5, 300),
+    'editar_falla': (ADMIN, 6, 300),
+    'eliminar_falla': (ADMIN, 6, 300),
+    'crear_llamada': (ADMIN, 5, 300),
+    'editar_llamada': (ADMIN, 6, 300),
+    'eliminar_llamada': (ADMIN, 6, 300),
+    'editar_asistencia': (ADMIN, 7, 300),
+    'eliminar_asistencia': (ADMIN, 6, 300),
+    'auditoria': (ADMIN, 8, 1000),
+    'auditoria_mas': (ADMIN, 6, 500),
+    'metricas': (ADMIN, 5, 300),
+    'tareas': (ADMIN, 7, 300),
+    'gestionar_carrusel': (ADMIN, 6, 300),
+    'crear_imagen_carrusel': (ADMIN, 6, 300),
+    'editar_imagen_carrusel': (ADMIN, 8, 300),
+    'eliminar_imagen_carrusel': (ADMIN, 6, 300),
+    'gestionar_eventos': (ADMIN, 6, 300),
+    'crear_evento': (ADMIN, 5, 300),
+    'editar_evento': (ADMIN, 6, 300),
+    'eliminar_evento': (ADMIN, 6, 300),
+    'gestionar_noticias': (ADMIN, 6, 300),
+    'crear_noticia': (ADMIN, 5, 300),
+    'editar_noticia': (ADMIN, 6, 300),
+    'eliminar_noticia': (ADMIN, 6, 300),
+    'gestionar_contactos': (ADMIN, 7, 300),
+    'crear_contacto': (ADMIN, 5, 300),
+    'editar_contacto': (ADMIN, 6, 300),
+    'eliminar_contacto': (ADMIN, 6, 300),
+    'gestionar_manual_interno': (ADMIN, 6, 300),
+    'crear_manual_interno': (ADMIN, 5, 300),
+    'editar_manual_interno': (ADMIN, 6, 300),
+    'eliminar_manual_interno': (ADMIN, 6, 300),
+}
+
+FACTOR_TIEMPO = float(os.environ.get('PRESUPUESTO_TIEMPO_FACTOR', '1'))
+
+# Cantidades de los datos de prueba
+CANTIDAD_USUARIOS = 25
+CANTIDAD_PRODUCTOS_POR_CATEGORIA = 20
+CANTIDAD_PEDIDOS = 40
+DETALLES_POR_PEDIDO = 8
+DIAS_ASISTENCIA = 14
+CANTIDAD_REGISTROS_OPERACIONES = 50
+CANTIDAD_AUDITORIA = 300
+CANTIDAD_CONTENIDO = 10
+DIAS_MOVIMIENTOS = 30
+
+
+@override_settings(AUDITORIA_ASINCRONA=False)
+class PresupuestoVistasTest(TestCase):
+    """Cada ruta de core/urls.py debe respetar su presupuesto de consultas y tiempo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        ahora = timezone.now()
+        hoy = timezone.localdate()
+
+        cls.admin = Usuario.objects.create_user(
+            username='admin_presupuesto', password='clave-prueba', nombre='Ana', apellido='Admin',
+            _es_administrador=True, es_colaborador=False, cambio_password_requerido=False,
+        )
+        cls.colaborador = Usuario.objects.create_user(
+            username='colaborador_presupuesto', password='clave-prueba', nombre='Carlos', apellido='Colaborador',
+            cambio_password_requerido=False,
+        )
+        usuarios = [cls.admin, cls.colaborador] + [
+            Usuario.objects.create_user(
+                username=f'usuario{numero}', password='clave-prueba', nombre=f'Nombre{numero}', apellido=f'Apellido{numero}',
+                rut=f'{10000000 + numero}-{numero % 10}', cambio_password_requerido=False,
+            )
+            for numero in range(CANTIDAD_USUARIOS)
+        ]
+        SolicitudRestablecimiento.objects.bulk_create([
+            SolicitudRestablecimiento(usuario=usuario) for usuario in usuarios[2:7]
+        ])
+
+        productos = Inventario.objects.bulk_create([
+            Inventario(
+                nombre=f'Producto {categoria} {numero}', categoria=categoria,
+                cantidad=numero * 3, precio_unitario=Decimal('1000') + numero * 250,
+            )
+            for categoria, _ in Inventario.CATEGORIA_CHOICES
+            for numero in range(CANTIDAD_PRODUCTOS_POR_CATEGORIA)
+        ])
+        cls.producto = productos[0]
+        # Consumo diario para el pronóstico de reposición (productos_view)
+        MovimientoStock.objects.bulk_create([
+            MovimientoStock(producto=producto, delta=-(indice % 5 + 1), motivo='conteo', usuario=cls.colaborador, fecha=ahora - timedelta(days=dia))
+            for indice, producto in enumerate(productos)
+            for dia in range(1, DIAS_MOVIMIENTOS + 1)
+        ])
+
+        pedidos = Pedido.objects.bulk_create([
+            Pedido(codigo=f'PED-{numero:04d}', fecha_creacion=ahora - timedelta(days=numero), usuario_creacion=cls.admin)
+            for numero in range(CANTIDAD_PEDIDOS)
+        ])
+        DetallePedido.objects.bulk_create([
+            DetallePedido(
+                pedido=pedido, producto_nombre=producto.nombre,
+                cantidad=indice + 1, precio_unitario=producto.precio_unitario,
+            )
+            for pedido in pedidos
+            for indice, producto in enumerate(productos[:DETALLES_POR_PEDIDO])
+        ])
+        for pedido in pedidos:
+            pedido.actualizar_totales()
+        cls.pedido = pedidos[0]
+
+        asistencias = Asistencia.objects.bulk_create([
+            Asistencia(usuario=usuario, fecha=hoy - timedelta(days=dia), estado='presente', turno='apertura')
+            for usuario in usuarios[1:]
+            for dia in range(DIAS_ASISTENCIA)
+        ])
+        cls.asistencia = asistencias[0]
+
+        cls.falla = RegistroFalla.objects.bulk_create([
+            RegistroFalla(
+                contador_falla=numero + 1, fecha=hoy - timedelta(days=numero), maquina=f'MAQ-{numero % 4}',
+                descripcion='Falla de prueba', usuario_registro=cls.colaborador,
+            )
+            for numero in range(CANTIDAD_REGISTROS_OPERACIONES)
+        ])[0]
+        cls.llamada = RegistroLlamada.objects.bulk_create([
+            RegistroLlamada(
+                contador_llamada=numero + 1, fecha=hoy - timedelta(days=numero), motivo='Mantención',
+                tecnico_contactado='Técnico', descripcion='Llamada de prueba', usuario_registro=cls.colaborador,
+            )
+            for numero in range(CANTIDAD_REGISTROS_OPERACIONES)
+        ])[0]
+
+        Auditoria.objects.bulk_create([
+            Auditoria(
+                usuario=usuarios[numero % len(usuarios)], accion='inventario_stock_change', modulo='inventario',
+                descripcion=f'Cambio de stock {numero}', objeto_afectado=productos[numero % len(productos)].nombre,
+                detalles={'cantidad_anterior': numero, 'cantidad_nueva': numero + 1},
+                fecha_hora=ahora - timedelta(minutes=numero),
+            )
+            for numero in range(CANTIDAD_AUDITORIA)
+        ])
+
+        cls.imagen_carrusel = ImagenCarrusel.objects.bulk_create([
+            ImagenCarrusel(imagen=f'carousel/imagen{numero}.jpg', orden=numero + 1, titulo_barista='Barista' if numero == 0 else None)
+            for numero in range(5)
+        ])[0]
+        cls.evento = Evento.objects.bulk_create([
+            Evento(titulo=f'Evento {numero}', descripcion='Descripción', fecha_evento=hoy + timedelta(days=numero))
+            for numero in range(CANTIDAD_CONTENIDO)
+        ])[0]
+        cls.noticia = Noticia.objects.bulk_create([
+            Noticia(titulo=f'Noticia {numero}', descripcion='Descripción', fecha_publicacion=hoy - timedelta(days=numero))
+            for numero in range(CANTIDAD_CONTENIDO)
+        ])[0]
+        cls.contacto = Contacto.objects.bulk_create([
+            Contacto(nombre=f'Contacto {numero}', cargo='Gerencia', email=f'contacto{numero}@example.com', telefono='+56900000000', orden=numero)
+            for numero in range(6)
+        ])[0]
+        cls.manual = ManualInterno.objects.bulk_create([
+            ManualInterno(titulo='Reglamento', tipo='reglamento', archivo='manuales/reglamento.pdf'),
+            ManualInterno(titulo='Operaciones', tipo='operaciones', archivo='manuales/operaciones.pdf'),
+        ])[0]
+
+    def setUp(self):
+        # El pronóstico de consumo, la portada y los contactos quedan en el caché entre tests
+        caches['inventario'].clear()
+        caches['default'].clear()
+
+    def _parametros_ruta(self, patron):
+        """Argumentos de la URL a partir de los objetos creados en setUpTestData"""
+        objetos = {
+            'usuario_id': self.colaborador,
+            'producto_id': self.producto,
+            'pedido_id': self.pedido,
+            'falla_id': self.falla,
+            'llamada_id': self.llamada,
+            'asistencia_id': self.asistencia,
+            'imagen_id': self.imagen_carrusel,
+            'evento_id': self.evento,
+            'noticia_id': self.noticia,
+            'contacto_id': self.contacto,
+            'manual_id': self.manual,
+        }
+        return {parametro: objetos[parametro].pk for parametro in patron.pattern.converters}
+
+    def _cliente(self, rol):
+        """Cliente con sesión iniciada según el rol (el login no cuenta en el presupuesto)"""
+        cliente = self.client_class()
+        if rol == ADMIN:
+            cliente.force_login(self.admin)
+            # Carrito con varios productos para medir ver_carrito con datos
+            sesion = cliente.session
+            sesion['carrito'] = {
+                str(producto.id): {'nombre': producto.nombre, 'precio': float(producto.precio_unitario), 'cantidad': 2}
+                for producto in Inventario.objects.all()[:10]
+            }
+            sesion.save()
+        elif rol == COLABORADOR:
+            cliente.force_login(self.colaborador)
+        return cliente
+
+    def test_todas_las_rutas_tienen_presupuesto(self):
+        sin_presupuesto = [patron.name for patron in core_urls.urlpatterns if patron.name not in PRESUPUESTOS]
+        self.assertEqual(sin_presupuesto, [], f'Rutas sin presupuesto en PRESUPUESTOS: {sin_presupuesto}')
+
+    def test_presupuesto_por_vista(self):
+        for patron in core_urls.urlpatterns:
+            if patron.name not in PRESUPUESTOS:
+                continue
+            rol, max_consultas, max_ms = PRESUPUESTOS[patron.name]
+            with self.subTest(vista=patron.name):
+                cliente = self._cliente(rol)
+                url = reverse(patron.name, kwargs=self._parametros_ruta(patron))
+
+                with CaptureQueriesContext(connection) as consultas:
+                    inicio = time.perf_counter()
+                    respuesta = cliente.get(url)
+                    milisegundos = (time.perf_counter() - inicio) * 1000
+
+                self.assertLess(respuesta.status_code, 500, f'{patron.name} respondió {respuesta.status_code}')
+                self.assertLessEqual(
+                    len(consultas), max_consultas,
+                    f'{patron.name} hizo {len(consultas)} consultas (presupuesto: {max_consultas}):\n'
+                    + '\n'.join(consulta['sql'] for consulta in consultas.captured_queries),
+                )
+                self.assertLessEqual(
+                    milisegundos, max_ms * FACTOR_TIEMPO,
+                    f'{patron.name} tardó {milisegundos:.0f} ms (presupuesto: {max_ms * FACTOR_TIEMPO:.0f} ms)',
+                )
+
+
+@override_settings(AUDITORIA_ASINCRONA=True)
+class AuditoriaBufferTest(TestCase):
+    """Escritura diferida y por lotes de la auditoría (core.auditoria_buffer)"""
+
+    def setUp(self):
+        # Escritor propio y sin hilo: el test decide cuándo se guarda la cola
+        self.escritor = EscritorAuditoria(tamano_lote=2, intervalo=60, capacidad=10)
+        for parche in (
+            mock.patch.object(EscritorAuditoria, '_iniciar_hilo'),
+            mock.patch('core.auditoria_buffer.escritor_auditoria', self.escritor),
+        ):
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def test_flush_guarda_los_registros_en_cola(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_auditoria(None, 'login', 'sesion', 'Primer ingreso')
+            registrar_auditoria(None, 'logout', 'sesion', 'Primera salida')
+        self.assertEqual(self.escritor.cola.qsize(), 2)
+        self.assertFalse(Auditoria.objects.exists())
+
+        self.escritor.flush()
+        self.assertEqual(self.escritor.cola.qsize(), 0)
+        self.assertEqual(
+            sorted(Auditoria.objects.values_list('descripcion', flat=True)), ['Primer ingreso', 'Primera salida']
+        )
+
+    def test_transaccion_revertida_no_guarda_nada(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    registrar_auditoria(None, 'login', 'sesion', 'Ingreso revertido')
+                    raise RuntimeError('falla dentro de la transacción')
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.escritor.cola.qsize(), 0)
+        self.escritor.flush()
+        self.assertFalse(Auditoria.objects.exists())
+
+    def test_lote_se_guarda_en_inserciones_de_tamano_lote(self):
+        entradas = [{'descripcion': f'Conteo {i}', 'objeto_afectado': f'Producto {i}'} for i in range(5)]
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_auditoria_lote(None, 'inventario_stock_change', 'inventario', entradas)
+        self.assertEqual(self.escritor.cola.qsize(), 5)
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.escritor.flush()
+        inserciones = [c['sql'] for c in consultas.captured_queries if c['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserciones), 3)  # 2 + 2 + 1
+        self.assertEqual(Auditoria.objects.filter(accion='inventario_stock_change').count(), 5)
+
+    def test_cola_llena_guarda_de_inmediato(self):
+        self.escritor = EscritorAuditoria(tamano_lote=2, intervalo=60, capacidad=1)
+        with mock.patch('core.auditoria_buffer.escritor_auditoria', self.escritor):
+            with self.captureOnCommitCallbacks(execute=True):
+                registrar_auditoria_lote(None, 'inventario_stock_change', 'inventario', [{'descripcion': 'A'}, {'descripcion': 'B'}])
+        self.assertEqual(self.escritor.cola.qsize(), 1)
+        self.assertEqual(list(Auditoria.objects.values_list('descripcion', flat=True)), ['B'])
+
+    @override_settings(AUDITORIA_ASINCRONA=False)
+    def test_lote_sincronico_usa_una_sola_insercion(self):
+        entradas = [{'descripcion': f'Conteo {i}'} for i in range(5)]
+        with CaptureQueriesContext(connection) as consultas:
+            registrar_auditoria_lote(None, 'inventario_stock_change', 'inventario', entradas)
+        self.assertEqual(len(consultas.captured_queries), 1)
+        self.assertEqual(self.escritor.cola.qsize(), 0)
+        self.assertEqual(Auditoria.objects.count(), 5)
+
+
+class PaginacionCursorTest(TestCase):
+    """Paginación por keyset de la auditoría (core.utils.paginar_por_cursor)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        base = timezone.now().replace(microsecond=0)
+        # Cuatro pares de registros con la misma fecha_hora: el id desempata
+        Auditoria.objects.bulk_create([
+            Auditoria(accion='login', modulo='sesion', descripcion=f'Registro {i}', fecha_hora=base - timedelta(minutes=i // 2))
+            for i in range(8)
+        ])
+        cls.orden = list(Auditoria.objects.order_by('-fecha_hora', '-pk'))
+
+    def _recorrer(self, registros, tamano_pagina):
+        paginas = []
+        cursor = None
+        while True:
+            pagina, cursor = paginar_por_cursor(registros, cursor, tamano_pagina=tamano_pagina)
+            paginas.append(pagina)
+            if cursor is None:
+                return paginas
+
+    def test_recorre_todo_sin_repetir_ni_saltar_empates(self):
+        # Páginas de 3 cortan los pares con la misma fecha_hora por la mitad
+        paginas = self._recorrer(Auditoria.objects.all(), 3)
+        self.assertEqual([len(pagina) for pagina in paginas], [3, 3, 2])
+        self.assertEqual([registro.pk for pagina in paginas for registro in pagina], [r.pk for r in self.orden])
+
+    def test_lista_ordenada_pagina_igual_que_el_queryset(self):
+        paginas = self._recorrer(list(self.orden), 3)
+        self.assertEqual([registro.pk for pagina in paginas for registro in pagina], [r.pk for r in self.orden])
+
+    def test_ultima_pagina_exacta_no_tiene_siguiente(self):
+        paginas = self._recorrer(Auditoria.objects.all(), 4)
+        self.assertEqual([len(pagina) for pagina in paginas], [4, 4])
+        pagina, cursor = paginar_por_cursor(Auditoria.objects.all(), codificar_cursor(self.orden[-1]), tamano_pagina=4)
+        self.assertEqual((pagina, cursor), ([], None))
+
+    def test_cursor_codificado_se_decodifica(self):
+        registro = self.orden[2]
+        self.assertEqual(decodificar_cursor(codificar_cursor(registro)), (registro.fecha_hora, registro.pk))
+
+    def test_cursor_invalido_vuelve_a_la_primera_pagina(self):
+        valido = codificar_cursor(self.orden[0])
+        for cursor in ['', 'no-es-base64!', 'c2luLXNlcGFyYWRvcg', valido[:-4] + 'AAAA', 'eHx5']:
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decodificar_cursor(cursor))
+                pagina, _ = paginar_por_cursor(Auditoria.objects.all(), cursor, tamano_pagina=3)
+                self.assertEqual([r.pk for r in pagina], [r.pk for r in self.orden[:3]])
+
+    def test_vista_auditoria_con_cursor_manipulado(self):
+        admin = Usuario.objects.create_user(
+            username='admin_cursor', password='clave-prueba', _es_administrador=True, es_colaborador=False,
+            cambio_password_requerido=False,
+        )
+        self.client.force_login(admin)
+        self.assertEqual(self.client.get(reverse('auditoria'), {'cursor': '%%%'}).status_code, 200)
+
+
+class BusquedaAuditoriaTest(TestCase):
+    """Búsqueda de texto completo de la auditoría (core.busqueda y los triggers de la migración 0023)"""
+
+    def _buscar(self, texto):
+        return set(buscar_auditoria(Auditoria.objects.all(), texto).values_list('pk', flat=True))
+
+    def test_indice_disponible_en_la_base_migrada(self):
+        self.assertTrue(indice_disponible())
+
+    def test_registro_nuevo_se_encuentra(self):
+        registro = Auditoria.objects.create(
+            accion='inventario_edit', modulo='inventario', descripcion='Ajuste de harina integral',
+            objeto_afectado='Producto: Harina',
+        )
+        Auditoria.objects.create(accion='login', modulo='sesion', descripcion='Inicio de sesión')
+        self.assertEqual(self._buscar('harina'), {registro.pk})
+        # Prefijo y sin tildes (remove_diacritics)
+        self.assertEqual(self._buscar('integ'), {registro.pk})
+        self.assertEqual(self._buscar('sesion'), self._buscar('sesión'))
+
+    def test_registro_editado_se_reindexa(self):
+        registro = Auditoria.objects.create(accion='evento_edit', modulo='contenido', descripcion='Evento de primavera')
+        registro.descripcion = 'Evento de invierno'
+        registro.save(update_fields=['descripcion'])
+        self.assertEqual(self._buscar('invierno'), {registro.pk})
+        self.assertEqual(self._buscar('primavera'), set())
+
+    def test_registro_eliminado_sale_del_indice(self):
+        registro = Auditoria.objects.create(accion='noticia_delete', modulo='contenido', descripcion='Noticia retirada')
+        registro.delete()
+        self.assertEqual(self._buscar('retirada'), set())
+
+    def test_busca_por_nombre_de_usuario(self):
+        usuario = Usuario.objects.create_user(username='mgarcia', password='clave-prueba', nombre='Marta', apellido='García')
+        registro = Auditoria.objects.create(usuario=usuario, accion='login', modulo='sesion', descripcion='Inicio de sesión')
+        self.assertEqual(self._buscar('Marta'), {registro.pk})
+
+    def test_rango_prefiere_la_coincidencia_mas_relevante(self):
+        fuerte = Auditoria.objects.create(accion='inventario_edit', modulo='inventario', descripcion='stock stock stock', objeto_afectado='stock')
+        debil = Auditoria.objects.create(
+            accion='inventario_edit', modulo='inventario', descripcion='Cambio de stock registrado por el turno de la tarde',
+        )
+        rangos = dict(buscar_auditoria(Auditoria.objects.all(), 'stock').values_list('pk', 'rango'))
+        self.assertGreater(rangos[fuerte.pk], rangos[debil.pk])
+
+    def _resultados_por_rango(self):
+        ahora = timezone.now().replace(microsecond=0)
+        descripciones = ['stock stock stock', 'Cambio de stock del turno', 'stock', 'Cambio de stock del turno', 'Ingreso sin coincidencia']
+        Auditoria.objects.bulk_create([
+            Auditoria(accion='inventario_edit', modulo='inventario', descripcion=descripcion, fecha_hora=ahora - timedelta(minutes=i))
+            for i, descripcion in enumerate(descripciones)
+        ])
+        return list(buscar_auditoria(Auditoria.objects.all(), 'stock').order_by('-rango', '-fecha_hora', '-pk'))
+
+    def test_paginacion_por_rango_recorre_todo_sin_repetir(self):
+        esperados = self._resultados_por_rango()
+        self.assertEqual(len(esperados), 4)
+        vistos = []
+        cursor = None
+        while True:
+            pagina, cursor = paginar_por_cursor(
+                buscar_auditoria(Auditoria.objects.all(), 'stock'), cursor, tamano_pagina=1, por_rango=True
+            )
+            vistos.extend(registro.pk for registro in pagina)
+            if cursor is None:
+                break
+        self.assertEqual(vistos, [registro.pk for registro in esperados])
+
+    def test_cursor_por_rango_invalido_vuelve_a_la_primera_pagina(self):
+        esperados = self._resultados_por_rango()
+        self.assertIsNone(decodificar_cursor(codificar_cursor(esperados[0]), por_rango=True))
+        for valor in ['nan|2024-01-01T00:00:00|1', 'x|2024-01-01T00:00:00|1']:
+            cursor = base64.urlsafe_b64encode(valor.encode()).decode()
+            with self.subTest(cursor=valor):
+                self.assertIsNone(decodificar_cursor(cursor, por_rango=True))
+
+    def test_vista_ordena_la_busqueda_por_relevancia(self):
+        esperados = self._resultados_por_rango()
+        admin = Usuario.objects.create_user(
+            username='admin_busqueda', password='clave-prueba', _es_administrador=True, es_colaborador=False,
+            cambio_password_requerido=False,
+        )
+        self.client.force_login(admin)
+        respuesta = self.client.get(reverse('auditoria'), {'search': 'stock'})
+        self.assertEqual([r.pk for r in respuesta.context['registros']], [r.pk for r in esperados])
+        self.assertNotEqual(
+            [r.pk for r in esperados], [r.pk for r in sorted(esperados, key=lambda r: (r.fecha_hora, r.pk), reverse=True)]
+        )
+
+
+class ArchivoAuditoriaTest(TestCase):
+    """Archivado mensual de la auditoría (core.archivo_auditoria y el comando archivar_auditoria)"""
+
+    def setUp(self):
+        hoy = timezone.localdate()
+        self.mes_antiguo = restar_meses(hoy, 8)
+        self.mes_siguiente = restar_meses(hoy, 7)
+        self.usuario = Usuario.objects.create_user(username='archivista', password='clave-prueba', nombre='Ana', apellido='Archivo')
+
+        def en(mes, dia, hora=12):
+            return timezone.make_aware(datetime(mes.year, mes.month, dia, hora))
+
+        self.antiguos = [
+            Auditoria.objects.create(
+                usuario=self.usuario, accion='inventario_stock_change', modulo='inventario', descripcion='Cambio de stock: Harina',
+                detalles={'cantidad_anterior': 10, 'cantidad_nueva': 4}, objeto_afectado='Producto: Harina', fecha_hora=en(self.mes_antiguo, 1, 0),
+            ),
+            Auditoria.objects.create(accion='login_failed', modulo='sesion', descripcion='Intento fallido', fecha_hora=en(self.mes_antiguo, 28)),
+        ]
+        self.siguiente = Auditoria.objects.create(accion='login', modulo='sesion', descripcion='Ingreso', fecha_hora=en(self.mes_siguiente, 1, 0))
+        self.reciente = Auditoria.objects.create(accion='logout', modulo='sesion', descripcion='Salida')
+
+    def test_archivar_mes_borra_solo_ese_mes(self):
+        self.assertEqual(archivar_mes(self.mes_antiguo), 2)
+        archivo = ArchivoAuditoria.objects.get(mes=self.mes_antiguo)
+        self.assertEqual(archivo.cantidad, 2)
+        self.assertEqual(set(Auditoria.objects.values_list('pk', flat=True)), {self.siguiente.pk, self.reciente.pk})
+
+    def test_archivo_reconstruye_los_registros(self):
+        archivar_mes(self.mes_antiguo)
+        registros = leer_archivo(ArchivoAuditoria.objects.get(mes=self.mes_antiguo))
+        self.assertEqual([r.pk for r in registros], [r.pk for r in reversed(self.antiguos)])
+        for original, archivado in zip(reversed(self.antiguos), registros):
+            for campo in CAMPOS_ARCHIVADOS:
+                self.assertEqual(getattr(archivado, campo), getattr(original, campo), campo)
+            self.assertEqual(archivado.fecha_hora, original.fecha_hora)
+        self.assertEqual(registros[1].usuario, self.usuario)
+
+    def test_usuario_eliminado_conserva_el_nombre(self):
+        archivar_mes(self.mes_antiguo)
+        self.usuario.delete()
+        registros = leer_archivo(ArchivoAuditoria.objects.get(mes=self.mes_antiguo))
+        self.assertEqual(registros[1].usuario.username, 'Ana Archivo')
+
+    def test_archivar_de_nuevo_agrega_al_archivo_del_mes(self):
+        archivar_mes(self.mes_antiguo)
+        tardio = Auditoria.objects.create(accion='login', modulo='sesion', descripcion='Tardío', fecha_hora=self.antiguos[1].fecha_hora)
+        self.assertEqual(archivar_mes(self.mes_antiguo), 1)
+        archivo = ArchivoAuditoria.objects.get(mes=self.mes_antiguo)
+        self.assertEqual(archivo.cantidad, 3)
+        self.assertEqual(len(leer_archivo(archivo)), 3)
+        self.assertFalse(Auditoria.objects.filter(pk=tardio.pk).exists())
+
+    def test_comando_archiva_los_meses_antiguos(self):
+        salida = StringIO()
+        call_command('archivar_auditoria', '--meses', '6', stdout=salida)
+        self.assertEqual(
+            dict(ArchivoAuditoria.objects.values_list('mes', 'cantidad')), {self.mes_antiguo: 2, self.mes_siguiente: 1}
+        )
+        self.assertEqual(list(Auditoria.objects.values_list('pk', flat=True)), [self.reciente.pk])
+        self.assertIn('Registros archivados: 3', salida.getvalue())
+
+    def test_comando_dry_run_no_modifica_nada(self):
+        salida = StringIO()
+        call_command('archivar_auditoria', '--meses', '6', '--dry-run', stdout=salida)
+        self.assertIn(f'Se archivaría: {self.mes_antiguo.strftime("%m/%Y")}', salida.getvalue())
+        self.assertFalse(ArchivoAuditoria.objects.exists())
+        self.assertEqual(Auditoria.objects.count(), 4)
+
+    def test_comando_rechaza_meses_invalidos(self):
+        with self.assertRaises(CommandError):
+            call_command('archivar_auditoria', '--meses', '0')
+
+
+class PedidoTotalesTest(TestCase):
+    """Totales almacenados de Pedido (total, num_items) mantenidos por DetallePedido y recompute_pedido_totals"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_user(
+            username='admin_pedidos', password='clave-prueba', _es_administrador=True, es_colaborador=False,
+            cambio_password_requerido=False,
+        )
+
+    def assertTotalesSincronizados(self, *pedidos):
+        for pedido in Pedido.objects.filter(pk__in=[p.pk for p in pedidos]).with_totals():
+            self.assertEqual((pedido.total, pedido.num_items), (pedido.total_calculado, pedido.num_detalles))
+
+    def test_crear_editar_y_borrar_detalles(self):
+        pedido = Pedido.objects.create(codigo='P-1')
+        otro = Pedido.objects.create(codigo='P-2')
+        leche = DetallePedido.objects.create(pedido=pedido, producto_nombre='Leche', cantidad=3, precio_unitario=Decimal('1.50'))
+        DetallePedido.objects.create(pedido=pedido, producto_nombre='Café', cantidad=2, precio_unitario=Decimal('10.00'))
+        pedido.refresh_from_db()
+        self.assertEqual((pedido.total, pedido.num_items), (Decimal('24.50'), 2))
+        self.assertTotalesSincronizados(pedido)
+
+        leche.cantidad = 5
+        leche.save()
+        self.assertTotalesSincronizados(pedido)
+        # Mover un detalle a otro pedido actualiza ambos
+        leche.pedido = otro
+        leche.save()
+        self.assertTotalesSincronizados(pedido, otro)
+        otro.refresh_from_db()
+        self.assertEqual((otro.total, otro.num_items), (Decimal('7.50'), 1))
+
+        leche.delete()
+        self.assertTotalesSincronizados(pedido, otro)
+        otro.refresh_from_db()
+        self.assertEqual((otro.total, otro.num_items), (Decimal('0.00'), 0))
+
+    def test_crear_pedido_desde_el_carrito(self):
+        self.client.force_login(self.admin)
+        sesion = self.client.session
+        sesion['carrito'] = {
+            '1': {'nombre': 'Leche', 'precio': 1.5, 'cantidad': 4},
+            '2': {'nombre': 'Café', 'precio': 10.25, 'cantidad': 2},
+        }
+        sesion.save()
+        self.assertEqual(self.client.post(reverse('crear_pedido'), {'codigo': 'P-CARRITO'}).status_code, 302)
+        pedido = Pedido.objects.get(codigo='P-CARRITO')
+        self.assertEqual((pedido.total, pedido.num_items), (Decimal('26.50'), 2))
+        self.assertTotalesSincronizados(pedido)
+
+    def test_recompute_pedido_totals_verifica_y_corrige(self):
+        pedido = Pedido.objects.create(codigo='P-1')
+        DetallePedido.objects.create(pedido=pedido, producto_nombre='Leche', cantidad=2, precio_unitario=Decimal('3.00'))
+        Pedido.objects.filter(pk=pedido.pk).update(total=Decimal('1.00'), num_items=5)
+
+        with self.assertRaisesMessage(CommandError, '1 de 1 pedido(s) con totales desincronizados'):
+            call_command('recompute_pedido_totals', '--verificar', stdout=StringIO())
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.total, Decimal('1.00'))
+
+        call_command('recompute_pedido_totals', stdout=StringIO())
+        self.assertTotalesSincronizados(pedido)
+        call_command('recompute_pedido_totals', '--verificar', stdout=StringIO())
+
+
+@override_settings(AUDITORIA_ASINCRONA=False)
+class LibroStockTest(TestCase):
+    """Cambios de stock con movimientos, saldos y control de concurrencia (Inventario, MovimientoStock, SaldoStock)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.colaborador = Usuario.objects.create_user(username='contador', password='clave-prueba', cambio_password_requerido=False)
+
+    def setUp(self):
+        self.producto = Inventario.objects.create(nombre='Leche', categoria='bodega', cantidad=10)
+
+    def test_fijar_stock_registra_la_diferencia(self):
+        self.assertEqual(self.producto.fijar_stock(7, usuario=self.colaborador, motivo='conteo'), (10, 7))
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.cantidad, 7)
+        movimiento = MovimientoStock.objects.get(producto=self.producto)
+        self.assertEqual((movimiento.delta, movimiento.motivo, movimiento.usuario), (-3, 'conteo', self.colaborador))
+
+        # Sin diferencia no hay movimiento
+        self.producto.fijar_stock(7)
+        self.assertEqual(MovimientoStock.objects.filter(producto=self.producto).count(), 1)
+
+    def test_fijar_stock_con_version_vieja_lanza_conflicto(self):
+        version = self.producto.fecha_actualizacion
+        Inventario.objects.get(pk=self.producto.pk).ajustar_stock(2)
+        with self.assertRaises(ConflictoStockError):
+            self.producto.fijar_stock(5, version=version)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.cantidad, 12)
+
+    def test_stock_en_parte_del_saldo_anterior(self):
+        ahora = timezone.now()
+        MovimientoStock.objects.bulk_create([
+            MovimientoStock(producto=self.producto, delta=10, motivo='inicial', fecha=ahora - timedelta(days=10)),
+            MovimientoStock(producto=self.producto, delta=-3, motivo='conteo', fecha=ahora - timedelta(days=5)),
+            MovimientoStock(producto=self.producto, delta=-2, motivo='conteo', fecha=ahora - timedelta(days=2)),
+        ])
+        self.assertEqual(self.producto.stock_en(ahora - timedelta(days=7)), 10)
+        self.assertEqual(self.producto.stock_en(ahora), 5)
+
+        # Con un saldo, solo se suman los movimientos posteriores a él (el saldo difiere a
+        # propósito de la suma de movimientos para comprobar que se usa)
+        SaldoStock.objects.create(producto=self.producto, fecha=ahora - timedelta(days=6), cantidad=100)
+        self.assertEqual(self.producto.stock_en(ahora - timedelta(days=7)), 10)
+        self.assertEqual(self.producto.stock_en(ahora - timedelta(days=6)), 100)
+        self.assertEqual(self.producto.stock_en(ahora - timedelta(days=4)), 97)
+        self.assertEqual(self.producto.stock_en(ahora), 95)
+
+    def test_conteo_con_version_vieja_no_sobrescribe(self):
+        version = self.producto.version_stock
+        # Otro usuario cambia el stock después de abrir el conteo
+        Inventario.objects.get(pk=self.producto.pk).ajustar_stock(2)
+
+        self.client.force_login(self.colaborador)
+        respuesta = self.client.post(reverse('conteo_stock'), {
+            'form-TOTAL_FORMS': '1',
+            'form-INITIAL_FORMS': '1',
+            'form-0-producto_id': str(self.producto.pk),
+            'form-0-version': version,
+            'form-0-cantidad': '3',
+        })
+        self.assertRedirects(respuesta, reverse('cambiar_stock'), fetch_redirect_response=False)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.cantidad, 12)
+        self.assertFalse(MovimientoStock.objects.filter(producto=self.producto, motivo='conteo').exists())
+        self.assertIn('otro usuario modificó su stock', ' '.join(str(mensaje) for mensaje in get_messages(respuesta.wsgi_request)))
+
+
+class PronosticoConsumoTest(TestCase):
+    """Tasas de consumo suavizadas y sugerencias de reposición (core.pronostico)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producto = Inventario.objects.create(nombre='Leche', categoria='bodega', cantidad=10)
+        cls.sin_consumo = Inventario.objects.create(nombre='Milo', categoria='bodega', cantidad=10)
+        ahora = timezone.now()
+        MovimientoStock.objects.bulk_create([
+            MovimientoStock(producto=cls.producto, delta=-4, motivo='conteo', fecha=ahora - timedelta(days=dia))
+            for dia in range(1, 21)
+        ] + [
+            MovimientoStock(producto=cls.sin_consumo, delta=50, motivo='ajuste', fecha=ahora - timedelta(days=3)),
+        ])
+
+    def setUp(self):
+        caches['inventario'].clear()
+
+    def test_sugerencia_cubre_los_dias_de_cobertura(self):
+        from .pronostico import DIAS_COBERTURA, sugerencias_de_reposicion, tasas_de_consumo
+
+        tasas = tasas_de_consumo()
+        self.assertAlmostEqual(tasas[self.producto.id], 4)
+        # Las entradas de stock no son consumo
+        self.assertNotIn(self.sin_consumo.id, tasas)
+
+        sugerencias = sugerencias_de_reposicion()
+        self.assertEqual([s['producto'].id for s in sugerencias], [self.producto.id])
+        self.assertEqual(sugerencias[0]['cantidad'], 4 * DIAS_COBERTURA - 10)
+        self.assertEqual(sugerencias[0]['dias_restantes'], 2.5)
+
+    def test_movimientos_nuevos_actualizan_el_cache(self):
+        from .pronostico import tasas_de_consumo
+
+        tasa_inicial = tasas_de_consumo()[self.producto.id]
+        MovimientoStock.objects.create(producto=self.producto, delta=-40, motivo='conteo', fecha=timezone.now() - timedelta(days=1))
+        with CaptureQueriesContext(connection) as consultas:
+            tasa_nueva = tasas_de_consumo()[self.producto.id]
+        self.assertGreater(tasa_nueva, tasa_inicial)
+        # Solo los movimientos de la franja reciente
+        self.assertEqual(len(consultas), 1)
+
+    def _consumo_de_ayer(self):
+        from . import pronostico
+
+        pronostico.tasas_de_consumo()
+        ayer = (timezone.localdate() - timedelta(days=1)).isoformat()
+        return caches['inventario'].get(pronostico.CLAVE_CACHE)['consumos'][self.producto.id][ayer]
+
+    def test_movimiento_insertado_durante_la_reconstruccion_se_cuenta_una_vez(self):
+        from . import pronostico
+
+        # Simula un movimiento que se inserta después de leer el último id y antes de leer los consumos
+        consumos_diarios = pronostico._consumos_diarios
+
+        def consumos_con_insercion(*args, **kwargs):
+            MovimientoStock.objects.create(producto=self.producto, delta=-8, motivo='conteo', fecha=timezone.now() - timedelta(days=1))
+            return consumos_diarios(*args, **kwargs)
+
+        with mock.patch.object(pronostico, '_consumos_diarios', consumos_con_insercion):
+            pronostico.tasas_de_consumo()
+        self.assertEqual(self._consumo_de_ayer(), 4 + 8)
+        self.assertEqual(self._consumo_de_ayer(), 4 + 8)
+
+    def test_movimiento_con_id_menor_confirmado_despues_se_cuenta_una_vez(self):
+        ultimo_id = MovimientoStock.objects.order_by('-id').values_list('id', flat=True).first()
+        ayer = timezone.now() - timedelta(days=1)
+        MovimientoStock.objects.create(id=ultimo_id + 5, producto=self.producto, delta=-40, motivo='conteo', fecha=ayer)
+        self.assertEqual(self._consumo_de_ayer(), 4 + 40)
+        # Otra transacción, que obtuvo un id menor, se confirma después de la lectura
+        MovimientoStock.objects.create(id=ultimo_id + 2, producto=self.producto, delta=-8, motivo='conteo', fecha=ayer)
+        self.assertEqual(self._consumo_de_ayer(), 4 + 40 + 8)
+        self.assertEqual(self._consumo_de_ayer(), 4 + 40 + 8)
+
+
+class CatalogoCacheTest(TestCase):
+    """El catálogo en caché se invalida con cada cambio de producto (core.catalogo)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producto = Inventario.objects.create(nombre='Leche', categoria='bodega', cantidad=10)
+
+    def setUp(self):
+        caches['inventario'].clear()
+
+    def _cantidad_en_catalogo(self):
+        from .catalogo import productos_por_id
+        return productos_por_id()[self.producto.id]['cantidad']
+
+    def test_catalogo_vigente_no_consulta_la_base_de_datos(self):
+        self._cantidad_en_catalogo()
+        with self.assertNumQueries(0):
+            self.assertEqual(self._cantidad_en_catalogo(), 10)
+
+    def test_cambios_de_producto_invalidan_el_catalogo(self):
+        self._cantidad_en_catalogo()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.ajustar_stock(5)
+        self.assertEqual(self._cantidad_en_catalogo(), 15)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Inventario.objects.create(nombre='Sucralosa', categoria='meson', cantidad=3)
+        from .catalogo import productos_por_id
+        self.assertEqual(len(productos_por_id()), 2)
+
+
+class PortadaCacheTest(TestCase):
+    """La portada en caché se invalida con cada cambio de su contenido (core.portada)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.noticia = Noticia.objects.create(titulo='Noticia inicial', descripcion='Descripción')
+        cls.admin = Usuario.objects.create_user(
+            username='admin_portada', password='clave-prueba', nombre='Ana',
+            _es_administrador=True, es_colaborador=False, cambio_password_requerido=False,
+        )
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_visitante_anonimo_no_consulta_la_base_de_datos(self):
+        self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            respuesta = self.client.get(reverse('index'))
+        self.assertContains(respuesta, 'Noticia inicial')
+
+    def test_cambios_de_contenido_invalidan_la_portada(self):
+        self.client.get(reverse('index'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.noticia.titulo = 'Noticia editada'
+            self.noticia.save()
+        self.assertContains(self.client.get(reverse('index')), 'Noticia editada')
+
+        # El administrador no recibe la página compartida y ve sus cambios de inmediato
+        self.client.force_login(self.admin)
+        self.client.get(reverse('index'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Evento.objects.create(titulo='Evento nuevo', descripcion='Descripción', fecha_evento=timezone.localdate())
+        self.assertContains(self.client.get(reverse('index')), 'Evento nuevo')
+        self.assertContains(self.client.get(reverse('index')), 'Bienvenido/a')
+
+
+class ContactosCacheTest(TestCase):
+    """La página de contactos no escribe ni consulta la base de datos con la lista en caché (core.contactos)"""
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_contactos_por_defecto_creados_por_la_migracion(self):
+        self.assertEqual(Contacto.objects.count(), 5)
+
+    def test_lista_vigente_no_consulta_la_base_de_datos(self):
+        self.client.get(reverse('contactanos'))
+        with self.assertNumQueries(0):
+            respuesta = self.client.get(reverse('contactanos'))
+        self.assertContains(respuesta, 'Gerente General')
+
+    def test_cambios_de_contacto_invalidan_la_lista(self):
+        self.client.get(reverse('contactanos'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Contacto.objects.filter(nombre='Gerente General').first().delete()
+        self.assertNotContains(self.client.get(reverse('contactanos')), 'Gerente General')
+
+
+class PaginaCondicionalTest(TestCase):
+    """Las páginas de contenido responden 304 mientras no cambien (core.condicional)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manual = ManualInterno.objects.create(titulo='Reglamento', tipo='reglamento', archivo='manuales/reglamento.pdf')
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_pagina_sin_cambios_responde_304_sin_consultas(self):
+        respuesta = self.client.get(reverse('documentacion'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('no-cache', respuesta['Cache-Control'])
+        with self.assertNumQueries(0):
+            respuesta = self.client.get(reverse('documentacion'), HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(respuesta.status_code, 304)
+
+    def test_cambios_y_sesion_cambian_el_etag(self):
+        etag = self.client.get(reverse('documentacion'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.manual.delete()
+        respuesta = self.client.get(reverse('documentacion'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+
+        etag = respuesta['ETag']
+        usuario = Usuario.objects.create_user(username='lector', password='clave-prueba', cambio_password_requerido=False)
+        self.client.force_login(usuario)
+        self.assertEqual(self.client.get(reverse('documentacion'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class StorageRenombra(FileSystemStorage):
+    """Storage que, como Cloudinary, no guarda los archivos con el nombre pedido"""
+
+    def get_available_name(self, name, max_length=None):
+        base, extension = os.path.splitext(name)
+        return super().get_available_name(f'{base}_v2{extension}', max_length)
+
+
+class ImagenesDerivadosTest(TestCase):
+    """Derivados WebP/JPEG de las imágenes subidas y su srcset (core.imagenes)"""
+
+    def setUp(self):
+        caches['default'].clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        configuracion = override_settings(MEDIA_ROOT=media)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+
+    def _imagen_subida(self, ancho, alto):
+        contenido = tempfile.SpooledTemporaryFile()
+        Image.new('RGBA', (ancho, alto), (200, 120, 40, 128)).save(contenido, 'PNG')
+        contenido.seek(0)
+        return SimpleUploadedFile('foto.png', contenido.read(), content_type='image/png')
+
+    def _subir(self, instancia):
+        """Ejecuta solo la tarea que sube la imagen al storage y recarga la instancia"""
+        from .tareas import ejecutar_pendientes
+        self.assertEqual(ejecutar_pendientes(limite=1), 1)
+        instancia.refresh_from_db()
+        return instancia
+
+    def _imagen_con_exif(self, ancho, alto):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotar 90° a la derecha
+        contenido = tempfile.SpooledTemporaryFile()
+        Image.new('RGB', (ancho, alto), (10, 20, 30)).save(contenido, 'JPEG', exif=exif)
+        contenido.seek(0)
+        return SimpleUploadedFile('foto.jpg', contenido.read(), content_type='image/jpeg')
+
+    def test_subida_genera_derivados_y_srcset(self):
+        from .imagenes import nombre_derivado
+        from .tareas import ejecutar_pendientes
+        evento = Evento.objects.create(
+            titulo='Evento', descripcion='Descripción', fecha_evento=timezone.localdate(), imagen=self._imagen_subida(1200, 600),
+        )
+        # El request solo deja la imagen en la base de datos: la sube el worker
+        evento.refresh_from_db()
+        self.assertFalse(evento.imagen)
+        self.assertEqual(SubidaPendiente.objects.get().objeto_id, evento.pk)
+        self.assertEqual(ejecutar_pendientes(), 2)
+        evento.refresh_from_db()
+        nombre = evento.imagen.name
+        self.assertTrue(nombre.startswith('eventos/'))
+        self.assertFalse(SubidaPendiente.objects.exists())
+        with default_storage.open(nombre_derivado(nombre, 960, 'webp')) as archivo:
+            self.assertEqual(Image.open(archivo).size, (960, 480))
+        # Un original más angosto que el ancho no se amplía
+        with default_storage.open(nombre_derivado(nombre, 1600, 'jpg')) as archivo:
+            self.assertEqual(Image.open(archivo).size, (1200, 600))
+
+        html = Template('{% load imagenes %}{% imagen_responsiva evento.imagen alt="Foto" %}').render(Context({'evento': evento}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('_480w.webp 480w', html)
+        self.assertIn('alt="Foto"', html)
+
+        evento.delete()
+        ejecutar_pendientes()
+        self.assertFalse(default_storage.exists(nombre_derivado(nombre, 480, 'jpg')))
+
+    def test_portada_en_cache_muestra_los_derivados_al_generarse(self):
+        from .tareas import ejecutar_pendientes
+        with self.captureOnCommitCallbacks(execute=True):
+            self._subir(ImagenCarrusel.objects.create(orden=1, imagen=self._imagen_subida(1000, 500)))
+        # La primera visita se renderiza sin derivados y queda en caché
+        antes = self.client.get(reverse('index'))
+        self.assertContains(antes, 'carousel-image')
+        self.assertNotContains(antes, 'srcset')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(ejecutar_pendientes(), 1)
+        despues = self.client.get(reverse('index'))
+        self.assertContains(despues, '_480w.webp 480w')
+        # El navegador con la copia anterior no recibe 304
+        self.assertEqual(self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=antes['ETag']).status_code, 200)
+
+    def test_reemplazo_conserva_la_imagen_anterior_hasta_subir_la_nueva(self):
+        from .tareas import ejecutar_pendientes
+        noticia = Noticia.objects.create(titulo='Noticia', descripcion='Descripción', imagen=self._imagen_subida(300, 200))
+        ejecutar_pendientes()
+        noticia.refresh_from_db()
+        anterior = noticia.imagen.name
+
+        noticia.imagen = self._imagen_subida(500, 250)
+        noticia.save()
+        noticia.refresh_from_db()
+        self.assertEqual(noticia.imagen.name, anterior)
+        # Una segunda subida antes de que corra el worker reemplaza a la primera
+        noticia.imagen = self._imagen_subida(400, 200)
+        noticia.save()
+        self.assertEqual(SubidaPendiente.objects.count(), 1)
+
+        ejecutar_pendientes()
+        noticia.refresh_from_db()
+        self.assertNotEqual(noticia.imagen.name, anterior)
+        with default_storage.open(noticia.imagen.name) as archivo:
+            self.assertEqual(Image.open(archivo).size, (400, 200))
+        self.assertFalse(DerivadoImagen.objects.filter(original=anterior).exists())
+        self.assertTrue(DerivadoImagen.objects.filter(original=noticia.imagen.name).exists())
+        self.assertFalse(Tarea.objects.exclude(estado='completada').exists())
+
+    def test_imagen_quitada_antes_de_subirla_se_descarta(self):
+        from .tareas import ejecutar_pendientes
+        noticia = Noticia.objects.create(titulo='Noticia', descripcion='Descripción', imagen=self._imagen_subida(300, 200))
+        noticia.imagen = None
+        noticia.save()
+        self.assertFalse(SubidaPendiente.objects.exists())
+        ejecutar_pendientes()
+        noticia.refresh_from_db()
+        self.assertFalse(noticia.imagen)
+        self.assertFalse(os.listdir(settings.MEDIA_ROOT))
+
+    def test_falla_al_asignar_la_subida_no_deja_archivos_huerfanos(self):
+        from .tareas import ejecutar_pendientes
+        contacto = Contacto.objects.create(
+            nombre='Contacto', cargo='Gerencia', email='contacto@example.com', telefono='+56900000000',
+            imagen=self._imagen_subida(300, 200),
+        )
+        with mock.patch.object(Contacto, 'save', side_effect=DatabaseError('sin conexión')), self.assertLogs('core.tareas', 'WARNING'):
+            ejecutar_pendientes()
+        self.assertEqual(Tarea.objects.get().estado, 'pendiente')
+        self.assertTrue(SubidaPendiente.objects.exists())
+        self.assertFalse(os.listdir(os.path.join(settings.MEDIA_ROOT, 'contactos')))
+
+        Tarea.objects.update(disponible_desde=timezone.now())
+        ejecutar_pendientes()
+        contacto.refresh_from_db()
+        self.assertTrue(default_storage.exists(contacto.imagen.name))
+
+    def test_worker_quita_exif_y_aplica_la_orientacion(self):
+        from .tareas import ejecutar_pendientes
+        contacto = self._subir(Contacto.objects.create(
+            nombre='Contacto', cargo='Gerencia', email='contacto@example.com', telefono='+56900000000',
+            imagen=self._imagen_con_exif(600, 400),
+        ))
+        anterior = contacto.imagen.name
+        self.assertEqual(ejecutar_pendientes(), 2)  # quitar EXIF y, sobre la copia, generar derivados
+        contacto.refresh_from_db()
+        self.assertNotEqual(contacto.imagen.name, anterior)
+        self.assertFalse(default_storage.exists(anterior))
+        with default_storage.open(contacto.imagen.name) as archivo:
+            original = Image.open(archivo)
+            self.assertEqual(original.size, (400, 600))
+            self.assertFalse(original.getexif())
+        self.assertTrue(DerivadoImagen.objects.filter(original=contacto.imagen.name).exists())
+
+    def test_falla_al_quitar_exif_conserva_el_original(self):
+        from .tareas import ejecutar_pendientes
+        contacto = self._subir(Contacto.objects.create(
+            nombre='Contacto', cargo='Gerencia', email='contacto@example.com', telefono='+56900000000',
+            imagen=self._imagen_con_exif(60, 40),
+        ))
+        nombre = contacto.imagen.name
+        archivos = set(os.listdir(os.path.dirname(default_storage.path(nombre))))
+        with mock.patch.object(Contacto, 'save', side_effect=DatabaseError('sin conexión')), self.assertLogs('core.tareas', 'WARNING'):
+            ejecutar_pendientes()
+        tarea = Tarea.objects.get(tipo='procesar_imagen')
+        self.assertEqual((tarea.estado, tarea.intentos), ('pendiente', 1))
+        contacto.refresh_from_db()
+        self.assertEqual(contacto.imagen.name, nombre)
+        # El original sigue en uso y la copia sin EXIF no quedó huérfana
+        self.assertEqual(set(os.listdir(os.path.dirname(default_storage.path(nombre)))), archivos)
+
+        Tarea.objects.update(disponible_desde=timezone.now())
+        ejecutar_pendientes()
+        contacto.refresh_from_db()
+        self.assertNotEqual(contacto.imagen.name, nombre)
+        self.assertFalse(default_storage.exists(nombre))
+        self.assertEqual(Tarea.objects.filter(estado='completada').count(), 3)
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'core.tests.StorageRenombra'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_srcset_usa_los_nombres_que_retorna_el_storage(self):
+        from .imagenes import nombre_derivado
+        from .tareas import ejecutar_pendientes
+        noticia = Noticia.objects.create(titulo='Noticia', descripcion='Descripción', imagen=self._imagen_subida(1000, 500))
+        ejecutar_pendientes()
+        noticia.refresh_from_db()
+        nombre = noticia.imagen.name
+        guardados = list(DerivadoImagen.objects.filter(original=nombre).values_list('nombre', flat=True))
+        self.assertEqual(len(guardados), 6)
+        for derivado in guardados:
+            self.assertTrue(default_storage.exists(derivado))
+        self.assertFalse(default_storage.exists(nombre_derivado(nombre, 480, 'webp')))
+
+        html = Template('{% load imagenes %}{% imagen_responsiva noticia.imagen %}').render(Context({'noticia': noticia}))
+        webp = DerivadoImagen.objects.get(original=nombre, ancho=480, extension='webp').nombre
+        self.assertIn(f'{default_storage.url(webp)} 480w', html)
+
+        noticia.delete()
+        ejecutar_pendientes()
+        self.assertFalse(any(default_storage.exists(derivado) for derivado in guardados))
+        self.assertFalse(DerivadoImagen.objects.filter(original=nombre).exists())
+
+    def test_imagen_en_uso_que_falta_no_se_da_por_procesada(self):
+        from .tareas import ejecutar_pendientes
+        noticia = self._subir(Noticia.objects.create(titulo='Noticia', descripcion='Descripción', imagen=self._imagen_subida(300, 200)))
+        default_storage.delete(noticia.imagen.name)
+        with self.assertLogs('core.tareas', 'WARNING'):
+            ejecutar_pendientes()
+        tarea = Tarea.objects.get(tipo='procesar_imagen')
+        self.assertEqual(tarea.estado, 'pendiente')
+        self.assertIn('FileNotFoundError', tarea.error)
+
+    def test_imagen_sin_derivados_usa_el_original(self):
+        noticia = self._subir(Noticia.objects.create(titulo='Noticia', descripcion='Descripción', imagen=self._imagen_subida(300, 200)))
+        html = Template('{% load imagenes %}{% imagen_responsiva noticia.imagen %}').render(Context({'noticia': noticia}))
+        self.assertNotIn('srcset', html)
+        self.assertIn(noticia.imagen.url, html)
+
+
+class BenchComandoTest(TestCase):
+    """Validación de las opciones del comando bench (antes de crear la base de datos de prueba)"""
+
+    def test_opciones_invalidas_lanzan_command_error(self):
+        for opcion in ['--usuarios=0', '--iteraciones=0', '--productos=0', '--pedidos=-1', '--asistencias-por-dia=-1']:
+            with self.subTest(opcion=opcion), mock.patch('core.management.commands.bench.setup_databases') as setup:
+                with self.assertRaises(CommandError):
+                    call_command('bench', opcion, stdout=StringIO())
+                setup.assert_not_called()
+
+
+class TareasTest(TestCase):
+    """Cola de tareas en la base de datos (core.tareas)"""
+
+    def setUp(self):
+        from . import tareas
+        self.llamadas = []
+        tipos = {'anotar': lambda **parametros: self.llamadas.append(parametros), 'fallar': lambda: 1 / 0}
+        parche = mock.patch.dict(tareas.TIPOS, tipos)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_tarea_se_ejecuta_una_sola_vez(self):
+        from .tareas import encolar, ejecutar_pendientes, tomar_siguiente
+        tarea = encolar('anotar', nombre='foto.png')
+        self.assertEqual(ejecutar_pendientes(), 1)
+        self.assertIsNone(tomar_siguiente())
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos), ('completada', 1))
+        self.assertEqual(self.llamadas, [{'nombre': 'foto.png'}])
+
+    def test_tarea_fallida_se_reintenta_con_espera_y_luego_falla(self):
+        from .tareas import MAX_INTENTOS, encolar, ejecutar_pendientes
+        tarea = encolar('fallar')
+        for _ in range(MAX_INTENTOS):
+            with self.assertLogs('core.tareas', 'WARNING'):
+                self.assertEqual(ejecutar_pendientes(), 1)
+            # La espera del reintento la deja fuera de la cola por ahora
+            self.assertEqual(ejecutar_pendientes(), 0)
+            Tarea.objects.filter(id=tarea.id).update(disponible_desde=timezone.now())
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'fallida')
+        self.assertIn('ZeroDivisionError', tarea.error)
+
+    def test_tarea_abandonada_vuelve_a_la_cola(self):
+        from .tareas import TIEMPO_MAXIMO, encolar, recuperar_abandonadas, tomar_siguiente
+        tarea = encolar('anotar')
+        tomar_siguiente()
+        Tarea.objects.filter(id=tarea.id).update(fecha_inicio=timezone.now() - timedelta(seconds=TIEMPO_MAXIMO + 1))
+        self.assertEqual(recuperar_abandonadas(), 1)
+        self.assertEqual(tomar_siguiente().id, tarea.id)
+
+
+class LimitadoresTest(TestCase):
+    """Algoritmos de rate limiting de core.limites"""
+
+    def setUp(self):
+        caches['seguridad'].clear()
+
+    def test_cada_algoritmo_respeta_el_limite(self):
+        from .limites import ALGORITMOS, crear_limitador
+
+        for algoritmo in ALGORITMOS:
+            with self.subTest(algoritmo=algoritmo), mock.patch('core.limites.time.time', return_value=1_000_000.0):
+                limitador = crear_limitador(algoritmo, limite=5, ventana=60, prefijo=f'prueba_{algoritmo}')
+                resultados = [limitador.permitir('10.0.0.1') for _ in range(7)]
+                self.assertEqual(resultados, [True] * 5 + [False] * 2)
+                # Cada identificador tiene su propio contador
+                self.assertTrue(limitador.permitir('10.0.0.2'))
+
+    def test_cubeta_de_tokens_se_recarga_con_el_tiempo(self):
+        from .limites import crear_limitador
+
+        limitador = crear_limitador('cubeta_tokens', limite=5, ventana=60, prefijo='prueba_recarga')
+        with mock.patch('core.limites.time.time', return_value=1_000_000.0):
+            for _ in range(5):
+                limitador.permitir('10.0.0.1')
+            self.assertFalse(limitador.permitir('10.0.0.1'))
+        # Un token cada 12 segundos
+        with mock.patch('core.limites.time.time', return_value=1_000_012.0):
+            self.assertTrue(limitador.permitir('10.0.0.1'))
+            self.assertFalse(limitador.permitir('10.0.0.1'))
+
+    def test_solicitar_restablecimiento_limita_por_ip(self):
+        from .views import LIMITE_SOLICITUDES_RESTABLECIMIENTO
+
+        url = reverse('solicitar_restablecimiento')
+        for _ in range(LIMITE_SOLICITUDES_RESTABLECIMIENTO[0]):
+            self.assertEqual(self.client.post(url, {'username': 'no_existe'}).status_code, 302)
+        self.assertEqual(self.client.post(url, {'username': 'no_existe'}).status_code, 429)
+
+    @override_settings(NUM_PROXIES=1)
+    def test_x_forwarded_for_falso_no_reinicia_el_limite(self):
+        from .views import LIMITE_SOLICITUDES_RESTABLECIMIENTO
+
+        url = reverse('solicitar_restablecimiento')
+        # El proxy agrega al final la IP real; lo anterior lo escribe el cliente
+        def solicitar(i):
+            return self.client.post(url, {'username': 'no_existe'}, HTTP_X_FORWARDED_FOR=f'198.51.100.{i}, 203.0.113.7')
+        for i in range(LIMITE_SOLICITUDES_RESTABLECIMIENTO[0]):
+            self.assertEqual(solicitar(i).status_code, 302)
+        self.assertEqual(solicitar(99).status_code, 429)
+
+    def test_obtener_ip_cliente_cuenta_proxies_desde_la_derecha(self):
+        from django.test import RequestFactory
+        from .limites import obtener_ip_cliente
+
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='1.1.1.1, 203.0.113.7, 10.0.0.2', REMOTE_ADDR='10.0.0.3')
+        casos = {0: '10.0.0.3', 1: '10.0.0.2', 2: '203.0.113.7', 4: '10.0.0.3'}
+        for proxies, esperada in casos.items():
+            with self.subTest(proxies=proxies), override_settings(NUM_PROXIES=proxies):
+                self.assertEqual(obtener_ip_cliente(request), esperada)
+
+
+class LoginBloqueoTest(TestCase):
+    """login_view bloquea con espera exponencial y sin calcular el hash de la contraseña"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(
+            username='colaborador_login', password='clave-correcta', nombre='Carla', apellido='Login',
+            cambio_password_requerido=False,
+        )
+
+    def setUp(self):
+        caches['seguridad'].clear()
+
+    def _intentar(self, password):
+        return self.client.post(reverse('login'), {
+            'account_type': 'colaborador', 'username': self.usuario.username, 'password': password,
+        })
+
+    def test_bloqueo_tras_los_intentos_libres(self):
+        from .limites import intentos_login_usuario
+
+        for _ in range(intentos_login_usuario.intentos_libres):
+            self.assertEqual(self._intentar('incorrecta').status_code, 200)
+        # El primer fallo sobre el límite bloquea la cuenta
+        self._intentar('incorrecta')
+        with mock.patch('core.views.authenticate') as authenticate:
+            respuesta = self._intentar('clave-correcta')
+        self.assertEqual(respuesta.status_code, 429)
+        authenticate.assert_not_called()
+
+    def test_login_correcto_reinicia_los_fallos(self):
+        from .limites import intentos_login_usuario
+
+        for _ in range(intentos_login_usuario.intentos_libres):
+            self._intentar('incorrecta')
+        self.assertEqual(self._intentar('clave-correcta').status_code, 302)
+        self.client.logout()
+        self.assertEqual(self._intentar('incorrecta').status_code, 200)
+        self.assertEqual(intentos_login_usuario.segundos_bloqueo(self.usuario.username), 0)
+
+
+class MigracionDetallesTest(TransactionTestCase):
+    """Migración 0025: Auditoria.detalles pasa de texto (json.dumps) a JSONField"""
+
+    antes = [('core', '0024_archivoauditoria')]
+    despues = [('core', '0025_auditoria_detalles_jsonfield')]
+
+    def _migrar(self, destino):
+        ejecutor = MigrationExecutor(connection)
+        ejecutor.loader.build_graph()
+        ejecutor.migrate(destino)
+        return ejecutor.loader.project_state(destino).apps
+
+    def tearDown(self):
+        ejecutor = MigrationExecutor(connection)
+        self._migrar(ejecutor.loader.graph.leaf_nodes('core'))
+
+    def test_detalles_de_texto_se_convierten_a_json(self):
+        Auditoria = self._migrar(self.antes).get_model('core', 'Auditoria')
+        textos = {
+            'objeto': '{"cantidad_anterior": 10, "cantidad_nueva": 4}',
+            'lista': '["a", "b"]',
+            'str_fallback': "{'fecha': datetime.date(2024, 1, 5)}",
+            'vacio': '',
+            'nulo': None,
+        }
+        ids = {
+            clave: Auditoria.objects.create(accion='login', modulo='sesion', descripcion=clave, detalles=texto).pk
+            for clave, texto in textos.items()
+        }
+
+        Auditoria = self._migrar(self.despues).get_model('core', 'Auditoria')
+        detalles = dict(Auditoria.objects.values_list('pk', 'detalles'))
+        self.assertEqual(detalles[ids['objeto']], {'cantidad_anterior': 10, 'cantidad_nueva': 4})
+        self.assertEqual(detalles[ids['lista']], ['a', 'b'])
+        # Guardado con str() cuando json.dumps fallaba: se conserva el texto original
+        self.assertEqual(detalles[ids['str_fallback']], {'texto': textos['str_fallback']})
+        self.assertIsNone(detalles[ids['vacio']])
+        self.assertIsNone(detalles[ids['nulo']])
+        self.assertEqual(Auditoria.objects.filter(detalles__cantidad_nueva=4).count(), 1)
+
+    def test_revertir_vuelve_a_texto_json(self):
+        self._migrar(self.antes)
+        Auditoria = self._migrar(self.despues).get_model('core', 'Auditoria')
+        registro = Auditoria.objects.create(accion='login', modulo='sesion', descripcion='Ingreso', detalles={'ip': '10.0.0.1', 'ñandú': 1})
+
+        Auditoria = self._migrar(self.antes).get_model('core', 'Auditoria')
+        self.assertEqual(json.loads(Auditoria.objects.get(pk=registro.pk).detalles), {'ip': '10.0.0.1', 'ñandú': 1})
@@ -17,6 +17,7 @@ urlpatterns = [
     path('colaborador/registro-asistencia/', views.registro_asistencia_view, name='registro_asistencia'),
     path('colaborador/cambiar-stock/', views.cambiar_stock_view, name='cambiar_stock'),
     path('colaborador/actualizar-stock/<int:producto_id>/', views.actualizar_stock_view, name='actualizar_stock'),
+    path('colaborador/conteo-stock/', views.conteo_stock_view, name='conteo_stock'),
     path('panel/', views.panel_view, name='panel'),
     path('panel/usuarios/', views.usuarios_view, name='usuarios'),
     path('panel/usuarios/crear/', views.crear_usuario_view, name='crear_usuario'),
@@ -30,6 +31,7 @@ urlpatterns = [
     path('panel/productos/', views.productos_view, name='productos'),
     path('panel/productos/agregar-carrito/<int:producto_id>/', views.agregar_al_carrito_view, name='agregar_al_carrito'),
     path('panel/productos/carrito/', views.ver_carrito_view, name='ver_carrito'),
+    path('panel/productos/carrito/sugerir/', views.sugerir_carrito_view, name='sugerir_carrito'),
     path('panel/productos/carrito/eliminar/<int:producto_id>/', views.eliminar_del_carrito_view, name='eliminar_del_carrito'),
     path('panel/productos/carrito/modificar/<int:producto_id>/', views.modificar_cantidad_carrito_view, name='modificar_cantidad_carrito'),
     path('panel/productos/pedidos/', views.pedidos_view, name='pedidos'),
@@ -48,6 +50,9 @@ urlpatterns = [
     path('panel/asistencia/editar/<int:asistencia_id>/', views.editar_asistencia_view, name='editar_asistencia'),
     path('panel/asistencia/eliminar/<int:asistencia_id>/', views.eliminar_asistencia_view, name='eliminar_asistencia'),
     path('panel/auditoria/', views.auditoria_view, name='auditoria'),
+    path('panel/auditoria/mas/', views.auditoria_mas_view, name='auditoria_mas'),
+    path('panel/metricas/', views.metricas_view, name='metricas'),
+    path('panel/tareas/', views.tareas_view, name='tareas'),
     # Gestión de Contenido
     path('panel/carrusel/', views.gestionar_carrusel_view, name='gestionar_carrusel'),
     path('panel/carrusel/crear/', views.crear_imagen_carrusel_view, name='crear_imagen_carrusel'),
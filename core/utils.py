@@ -1,7 +1,13 @@
 """
 Utilidades para el sistema de auditoría
 """
-import json
+import base64
+import binascii
+import math
+from datetime import datetime
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 from .models import Auditoria
 
@@ -16,27 +22,161 @@ def registrar_auditoria(usuario, accion, modulo, descripcion, objeto_afectado=No
         modulo: Módulo afectado (debe ser una de las opciones en MODULO_CHOICES)
         descripcion: Descripción de la acción
         objeto_afectado: Nombre del objeto afectado (opcional)
-        detalles: Diccionario con detalles adicionales (opcional, se convertirá a JSON)
+        detalles: Diccionario con detalles adicionales (opcional, se guarda en un JSONField)
+    
+    Con AUDITORIA_ASINCRONA activo, el registro se guarda en segundo plano y por lotes
+    (ver core.auditoria_buffer) cuando la transacción actual confirma; si la cola está
+    llena se guarda de inmediato.
     
     Returns:
-        Instancia del registro de auditoría creado
+        Instancia del registro de auditoría (puede no estar guardada todavía)
     """
-    detalles_json = None
-    if detalles:
-        try:
-            detalles_json = json.dumps(detalles, ensure_ascii=False, default=str)
-        except (TypeError, ValueError):
-            detalles_json = str(detalles)
-    
-    registro = Auditoria.objects.create(
+    registro = Auditoria(
         usuario=usuario,
         accion=accion,
         modulo=modulo,
         descripcion=descripcion,
         objeto_afectado=objeto_afectado,
-        detalles=detalles_json,
+        detalles=detalles or None,
         fecha_hora=timezone.localtime(timezone.now())
     )
-    
+    _guardar_registros([registro])
     return registro
 
+
+def registrar_auditoria_lote(usuario, accion, modulo, entradas):
+    """
+    Registra varias acciones del mismo tipo de una sola vez (ej. un conteo de stock completo)
+    
+    Args:
+        usuario: Usuario que realiza las acciones (puede ser None)
+        accion: Tipo de acción (debe ser una de las opciones en ACCION_CHOICES)
+        modulo: Módulo afectado (debe ser una de las opciones en MODULO_CHOICES)
+        entradas: Lista de diccionarios con 'descripcion' y opcionalmente 'objeto_afectado' y 'detalles'
+    
+    Sin AUDITORIA_ASINCRONA los registros se insertan con un único bulk_create.
+    
+    Returns:
+        Lista de registros de auditoría (pueden no estar guardados todavía)
+    """
+    fecha_hora = timezone.localtime(timezone.now())
+    registros = [
+        Auditoria(
+            usuario=usuario,
+            accion=accion,
+            modulo=modulo,
+            descripcion=entrada['descripcion'],
+            objeto_afectado=entrada.get('objeto_afectado'),
+            detalles=entrada.get('detalles') or None,
+            fecha_hora=fecha_hora,
+        )
+        for entrada in entradas
+    ]
+    if registros:
+        _guardar_registros(registros)
+    return registros
+
+
+def _guardar_registros(registros):
+    """Guarda los registros de inmediato o los deja en la cola de escritura en segundo plano"""
+    if not getattr(settings, 'AUDITORIA_ASINCRONA', False):
+        if len(registros) == 1:
+            registros[0].save()
+        else:
+            Auditoria.objects.bulk_create(registros)
+        return
+    
+    def encolar():
+        from .auditoria_buffer import escritor_auditoria
+        # Cola llena: guardar de forma sincrónica para no perder los registros
+        sin_encolar = [registro for registro in registros if not escritor_auditoria.encolar(registro)]
+        if sin_encolar:
+            Auditoria.objects.bulk_create(sin_encolar)
+    
+    # Solo se encola si la transacción confirma (fuera de una transacción se ejecuta de inmediato)
+    transaction.on_commit(encolar)
+
+
+def codificar_cursor(registro, por_rango=False):
+    """
+    Codifica la posición (fecha_hora, id) de un registro como cursor opaco para la URL.
+    Con por_rango, la posición empieza por el 'rango' de búsqueda del registro.
+    """
+    valor = f"{registro.fecha_hora.isoformat()}|{registro.pk}"
+    if por_rango:
+        valor = f"{registro.rango!r}|{valor}"
+    return base64.urlsafe_b64encode(valor.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, por_rango=False):
+    """
+    Decodifica un cursor generado por codificar_cursor (con el mismo por_rango).
+    
+    Returns:
+        Tupla (fecha_hora, id), o (rango, fecha_hora, id) con por_rango;
+        None si el cursor no es válido
+    """
+    if not cursor:
+        return None
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valor = base64.urlsafe_b64decode(cursor + relleno).decode()
+        if por_rango:
+            rango_texto, fecha_texto, pk_texto = valor.split('|')
+            rango = float(rango_texto)
+            if not math.isfinite(rango):
+                return None
+            return rango, datetime.fromisoformat(fecha_texto), int(pk_texto)
+        fecha_texto, pk_texto = valor.rsplit('|', 1)
+        return datetime.fromisoformat(fecha_texto), int(pk_texto)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def paginar_por_cursor(registros, cursor=None, tamano_pagina=50, por_rango=False):
+    """
+    Pagina un queryset de auditoría por keyset sobre (-fecha_hora, -id).
+    
+    El costo de cada página depende solo de tamano_pagina (usa el índice de fecha_hora),
+    no del tamaño total de la tabla, a diferencia de OFFSET/LIMIT.
+    
+    Args:
+        registros: QuerySet de Auditoria (ya filtrado), o lista ya ordenada de forma
+            descendente por (fecha_hora, id), como la de los registros archivados
+        cursor: Cursor devuelto por la página anterior (opcional)
+        tamano_pagina: Cantidad máxima de registros por página
+        por_rango: Ordena por (-rango, -fecha_hora, -id); solo para querysets anotados
+            por core.busqueda.buscar_auditoria
+    
+    Returns:
+        Tupla (lista de registros de la página, cursor de la página siguiente o None)
+    """
+    posicion = decodificar_cursor(cursor, por_rango)
+    if isinstance(registros, list):
+        if posicion:
+            registros = [r for r in registros if (r.fecha_hora, r.pk) < posicion]
+        pagina = registros[:tamano_pagina + 1]
+    elif por_rango:
+        if posicion:
+            rango, fecha_hora, pk = posicion
+            registros = registros.filter(
+                Q(rango__lt=rango) |
+                Q(rango=rango, fecha_hora__lt=fecha_hora) |
+                Q(rango=rango, fecha_hora=fecha_hora, pk__lt=pk)
+            )
+        pagina = list(registros.order_by('-rango', '-fecha_hora', '-pk')[:tamano_pagina + 1])
+    else:
+        if posicion:
+            fecha_hora, pk = posicion
+            registros = registros.filter(
+                Q(fecha_hora__lt=fecha_hora) | Q(fecha_hora=fecha_hora, pk__lt=pk)
+            )
+        # Se pide un registro extra para saber si existe una página siguiente
+        pagina = list(registros.order_by('-fecha_hora', '-pk')[:tamano_pagina + 1])
+    
+    siguiente_cursor = None
+    if len(pagina) > tamano_pagina:
+        pagina = pagina[:tamano_pagina]
+        siguiente_cursor = codificar_cursor(pagina[-1], por_rango)
+    
+    return pagina, siguiente_cursor
@@ -3,20 +3,31 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from django.db import IntegrityError
-from django.db.models import Max, Q, Count, Avg, Sum
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Q, Count, Avg, Sum, Exists, OuterRef
+from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
-from .models import Usuario, Inventario, Asistencia, RegistroFalla, RegistroLlamada, Pedido, DetallePedido, Auditoria, ImagenCarrusel, Evento, Noticia, ManualInterno, Contacto
-from .forms import CrearUsuarioForm, RegistroAsistenciaForm, CambiarPasswordForm, EditarAsistenciaForm, EditarUsuarioForm, RegistroFallaForm, RegistroLlamadaForm, CrearInventarioForm, EditarInventarioForm, CrearPedidoForm, EditarPrecioProductoForm, CambiarStockForm, ImagenCarruselForm, EventoForm, NoticiaForm, ContactoForm, ManualInternoForm
-from django.http import HttpResponse
+from .models import Usuario, Inventario, Asistencia, RegistroFalla, RegistroLlamada, Pedido, DetallePedido, Auditoria, ArchivoAuditoria, SolicitudRestablecimiento, ConflictoStockError, MovimientoStock, ImagenCarrusel, Evento, Noticia, ManualInterno, Contacto, Tarea
+from .forms import CrearUsuarioForm, RegistroAsistenciaForm, CambiarPasswordForm, EditarAsistenciaForm, EditarUsuarioForm, RegistroFallaForm, RegistroLlamadaForm, CrearInventarioForm, EditarInventarioForm, CrearPedidoForm, EditarPrecioProductoForm, CambiarStockForm, ConteoStockFormSet, ImagenCarruselForm, EventoForm, NoticiaForm, ContactoForm, ManualInternoForm
+from django.http import Http404, HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+from .condicional import pagina_condicional
 import json
 import os
+from decimal import Decimal
 import logging
 import traceback
 
 logger = logging.getLogger(__name__)
 
+# Cantidad de registros de auditoría por página (paginación por cursor)
+AUDITORIA_PAGE_SIZE = 50
+TAREAS_PAGE_SIZE = 50
+
+# Solicitudes de restablecimiento de contraseña permitidas por IP: (cantidad, ventana en segundos)
+LIMITE_SOLICITUDES_RESTABLECIMIENTO = (5, 60 * 60)
+
 
 def login_view(request):
     """Vista para el login - siempre accesible"""
@@ -49,9 +60,23 @@ def login_view(request):
             messages.error(request, 'Por favor completa todos los campos')
             return render(request, 'core/login.html', {'account_type': account_type})
         
+        # Rechazar los intentos bloqueados antes de autenticar (authenticate() calcula el hash de la contraseña)
+        from .limites import intentos_login_ip, intentos_login_usuario, obtener_ip_cliente
+        ip_address = obtener_ip_cliente(request)
+        espera = max(intentos_login_usuario.segundos_bloqueo(username), intentos_login_ip.segundos_bloqueo(ip_address))
+        if espera:
+            messages.error(request, f'Demasiados intentos fallidos. Intenta nuevamente en {espera} segundos.')
+            return render(request, 'core/login.html', {'account_type': account_type}, status=429)
+        
         # Autenticar usuario
         user = authenticate(request, username=username, password=password)
         
+        if user is None:
+            intentos_login_usuario.registrar_fallo(username)
+            intentos_login_ip.registrar_fallo(ip_address)
+        else:
+            intentos_login_usuario.reiniciar(username)
+        
         if user is not None:
             # Verificar si el usuario está activo
             if not user.activo:
@@ -125,6 +150,13 @@ def logout_view(request):
 def solicitar_restablecimiento_password(request):
     """Vista para solicitar restablecimiento de contraseña"""
     if request.method == 'POST':
+        from .limites import crear_limitador, obtener_ip_cliente
+        limite, ventana = LIMITE_SOLICITUDES_RESTABLECIMIENTO
+        limitador = crear_limitador('ventana_deslizante', limite, ventana, prefijo='restablecimiento_ip')
+        if not limitador.permitir(obtener_ip_cliente(request)):
+            messages.error(request, 'Has realizado demasiadas solicitudes. Por favor, intenta más tarde.')
+            return render(request, 'core/solicitar_restablecimiento.html', status=429)
+        
         username = request.POST.get('username', '').strip()
         
         if not username:
@@ -140,6 +172,8 @@ def solicitar_restablecimiento_password(request):
                 messages.error(request, 'Esta cuenta está desactivada. Contacta al administrador.')
                 return render(request, 'core/solicitar_restablecimiento.html')
             
+            SolicitudRestablecimiento.objects.create(usuario=usuario)
+            
             # Registrar la solicitud en auditoría
             from .utils import registrar_auditoria
             registrar_auditoria(
@@ -183,6 +217,7 @@ def restablecer_password_admin(request, usuario_id):
         usuario.set_password('popup')
         usuario.cambio_password_requerido = True
         usuario.save()
+        SolicitudRestablecimiento.marcar_atendidas(usuario, atendida_por=request.user)
         
         # Registrar en auditoría
         from .utils import registrar_auditoria
@@ -263,7 +298,11 @@ def usuarios_view(request):
         messages.error(request, 'No tienes permisos para acceder a esta sección')
         return redirect('panel')
     
-    usuarios = Usuario.objects.all().order_by('-fecha_creacion')
+    # Marcar en la misma consulta a los usuarios con solicitudes de restablecimiento pendientes
+    solicitudes_pendientes = SolicitudRestablecimiento.objects.pending_reset_requests().filter(usuario=OuterRef('pk'))
+    usuarios = Usuario.objects.annotate(
+        tiene_solicitud_pendiente=Exists(solicitudes_pendientes)
+    ).order_by('-fecha_creacion')
     return render(request, 'core/usuarios.html', {'usuarios': usuarios})
 
 
@@ -309,33 +348,9 @@ def editar_usuario_view(request, usuario_id):
     # Verificar si el usuario intenta cambiar su propio estado y es administrador
     es_propia_cuenta_admin = usuario.id == request.user.id and (usuario._es_administrador or usuario.is_superuser)
     
-    # Verificar si hay solicitudes pendientes de restablecimiento de contraseña para este usuario
-    solicitudes_pendientes = Auditoria.objects.filter(
-        accion='password_reset_request',
-        objeto_afectado=f"{usuario.nombre} {usuario.apellido}" if usuario.nombre and usuario.apellido else usuario.username
-    ).order_by('-fecha_hora')
-    
-    # Considerar una solicitud como "pendiente" si fue hecha en los últimos 30 días
-    from datetime import timedelta
-    fecha_limite = timezone.now() - timedelta(days=30)
-    solicitudes_recientes = solicitudes_pendientes.filter(fecha_hora__gte=fecha_limite)
-    
-    # Verificar si ya se restableció la contraseña después de la última solicitud
-    ultimo_restablecimiento = Auditoria.objects.filter(
-        accion='password_reset_admin',
-        objeto_afectado=f"{usuario.nombre} {usuario.apellido}" if usuario.nombre and usuario.apellido else usuario.username
-    ).order_by('-fecha_hora').first()
-    
-    tiene_solicitud_pendiente = False
-    if solicitudes_recientes.exists():
-        if ultimo_restablecimiento:
-            # Si hay un restablecimiento más reciente que la última solicitud, no mostrar como pendiente
-            ultima_solicitud = solicitudes_recientes.first()
-            if ultimo_restablecimiento.fecha_hora < ultima_solicitud.fecha_hora:
-                tiene_solicitud_pendiente = True
-        else:
-            # Si no hay restablecimientos, mostrar como pendiente
-            tiene_solicitud_pendiente = True
+    # Última solicitud de restablecimiento de contraseña sin atender (si existe)
+    ultima_solicitud_pendiente = SolicitudRestablecimiento.objects.pending_reset_requests().filter(usuario=usuario).first()
+    tiene_solicitud_pendiente = ultima_solicitud_pendiente is not None
     
     if request.method == 'POST':
         form = EditarUsuarioForm(request.POST, instance=usuario)
@@ -405,7 +420,7 @@ def editar_usuario_view(request, usuario_id):
         'usuario': usuario,
         'es_propia_cuenta_admin': es_propia_cuenta_admin,
         'tiene_solicitud_pendiente': tiene_solicitud_pendiente,
-        'solicitudes_recientes': solicitudes_recientes
+        'ultima_solicitud_pendiente': ultima_solicitud_pendiente
     })
 
 
@@ -515,15 +530,10 @@ def inventario_view(request):
         messages.error(request, 'No tienes permisos para acceder a esta sección')
         return redirect('panel')
     
-    # Organizar productos por categoría
-    bodega = Inventario.objects.filter(categoria='bodega').order_by('nombre')
-    meson = Inventario.objects.filter(categoria='meson').order_by('nombre')
-    limpieza = Inventario.objects.filter(categoria='limpieza').order_by('nombre')
+    from .catalogo import catalogo_por_categoria
     
     context = {
-        'bodega': bodega,
-        'meson': meson,
-        'limpieza': limpieza,
+        'categorias': catalogo_por_categoria(request),
     }
     
     return render(request, 'core/inventario.html', context)
@@ -544,7 +554,10 @@ def crear_inventario_view(request):
         form = CrearInventarioForm(request.POST, request.FILES)
         if form.is_valid():
             try:
-                producto = form.save()
+                with transaction.atomic():
+                    producto = form.save()
+                    if producto.cantidad:
+                        MovimientoStock.objects.create(producto=producto, delta=producto.cantidad, motivo='inicial', usuario=request.user)
                 messages.success(request, f'Producto "{producto.nombre}" creado exitosamente.')
                 return redirect('inventario')
             except Exception as e:
@@ -579,7 +592,11 @@ def editar_inventario_view(request, producto_id):
                 'categoria': producto.categoria,
                 'cantidad': producto.cantidad,
             }
-            form.save()
+            producto = form.save(commit=False)
+            with transaction.atomic():
+                # La cantidad pasa por fijar_stock para que el cambio quede en MovimientoStock
+                producto.save(update_fields=['nombre', 'categoria', 'imagen'])
+                datos_anteriores['cantidad'], _ = producto.fijar_stock(form.cleaned_data['cantidad'], usuario=request.user, motivo='edicion')
             producto.refresh_from_db()
             # Registrar auditoría
             from .utils import registrar_auditoria
@@ -664,16 +681,12 @@ def productos_view(request):
         messages.error(request, 'No tienes permisos para acceder a esta sección')
         return redirect('panel')
     
-    # Obtener productos agrupados por categoría
-    productos = Inventario.objects.all().order_by('categoria', 'nombre')
-    bodega = productos.filter(categoria='bodega')
-    meson = productos.filter(categoria='meson')
-    limpieza = productos.filter(categoria='limpieza')
+    from .catalogo import catalogo_por_categoria
+    from .pronostico import sugerencias_de_reposicion
     
     return render(request, 'core/productos.html', {
-        'bodega': bodega,
-        'meson': meson,
-        'limpieza': limpieza
+        'categorias': catalogo_por_categoria(request),
+        'sugerencias': sugerencias_de_reposicion(),
     })
 
 
@@ -689,11 +702,8 @@ def pedidos_view(request):
     
     pedidos = Pedido.objects.all().order_by('-fecha_creacion')
     
-    # Calcular el total gastado en todos los pedidos
-    total_gastado = 0
-    for pedido in pedidos:
-        for detalle in pedido.detalles.all():
-            total_gastado += detalle.cantidad * detalle.precio_unitario
+    # Calcular el total gastado en todos los pedidos (suma de los totales almacenados)
+    total_gastado = Pedido.objects.total_spent()
     
     return render(request, 'core/pedidos.html', {
         'pedidos': pedidos,
@@ -750,7 +760,10 @@ def agregar_al_carrito_view(request, producto_id):
         messages.error(request, 'No tienes permisos para acceder a esta sección')
         return redirect('panel')
     
-    producto = get_object_or_404(Inventario, id=producto_id)
+    from .catalogo import productos_por_id
+    producto = productos_por_id(request).get(producto_id)
+    if producto is None:
+        raise Http404('El producto no existe')
     
     if request.method == 'POST':
         cantidad = int(request.POST.get('cantidad', 1))
@@ -768,19 +781,55 @@ def agregar_al_carrito_view(request, producto_id):
         else:
             # Agregar nuevo producto al carrito
             carrito[str(producto_id)] = {
-                'nombre': producto.nombre,
-                'precio': float(producto.precio_unitario),
+                'nombre': producto['nombre'],
+                'precio': float(producto['precio_unitario']),
                 'cantidad': cantidad
             }
         
         # Guardar el carrito en la sesión
         request.session['carrito'] = carrito
-        messages.success(request, f'"{producto.nombre}" agregado al carrito')
+        messages.success(request, f'"{producto["nombre"]}" agregado al carrito')
         return redirect('productos')
     
     return redirect('productos')
 
 
+@login_required
+def sugerir_carrito_view(request):
+    """Vista para prellenar el carrito con las cantidades sugeridas por el pronóstico de consumo"""
+    if request.user.es_colaborador and request.user.cambio_password_requerido:
+        return redirect('cambiar_password')
+    if not (request.user._es_administrador or request.user.is_superuser):
+        messages.error(request, 'No tienes permisos para acceder a esta sección')
+        return redirect('panel')
+    
+    if request.method != 'POST':
+        return redirect('productos')
+    
+    from .pronostico import sugerencias_de_reposicion
+    
+    carrito = request.session.get('carrito', {})
+    agregados = 0
+    for sugerencia in sugerencias_de_reposicion():
+        producto = sugerencia['producto']
+        # Los productos que ya están en el carrito conservan la cantidad elegida
+        if str(producto.id) in carrito:
+            continue
+        carrito[str(producto.id)] = {
+            'nombre': producto.nombre,
+            'precio': float(producto.precio_unitario),
+            'cantidad': sugerencia['cantidad']
+        }
+        agregados += 1
+    
+    request.session['carrito'] = carrito
+    if agregados:
+        messages.success(request, f'Se agregaron {agregados} producto(s) sugeridos al carrito. Revisa las cantidades antes de crear el pedido.')
+    else:
+        messages.info(request, 'No hay productos nuevos para sugerir')
+    return redirect('ver_carrito')
+
+
 @login_required
 def ver_carrito_view(request):
     """Vista para ver el carrito de compras"""
@@ -794,23 +843,26 @@ def ver_carrito_view(request):
     productos_carrito = []
     total = 0
     
-    for producto_id, datos in carrito.items():
-        try:
-            producto = Inventario.objects.get(id=producto_id)
-            subtotal = datos['precio'] * datos['cantidad']
-            total += subtotal
-            productos_carrito.append({
-                'id': producto_id,
-                'producto': producto,
-                'nombre': datos['nombre'],
-                'precio': datos['precio'],
-                'cantidad': datos['cantidad'],
-                'subtotal': subtotal
-            })
-        except Inventario.DoesNotExist:
+    from .catalogo import productos_por_id
+    productos = productos_por_id(request)
+    
+    for producto_id, datos in list(carrito.items()):
+        producto = productos.get(int(producto_id))
+        if producto is None:
             # Si el producto ya no existe, eliminarlo del carrito
             del carrito[producto_id]
             request.session['carrito'] = carrito
+            continue
+        subtotal = datos['precio'] * datos['cantidad']
+        total += subtotal
+        productos_carrito.append({
+            'id': producto_id,
+            'producto': producto,
+            'nombre': datos['nombre'],
+            'precio': datos['precio'],
+            'cantidad': datos['cantidad'],
+            'subtotal': subtotal
+        })
     
     return render(request, 'core/carrito.html', {
         'productos_carrito': productos_carrito,
@@ -897,20 +949,27 @@ def crear_pedido_view(request):
         form = CrearPedidoForm(request.POST)
         
         if form.is_valid():
-            pedido = form.save(commit=False)
-            pedido.usuario_creacion = request.user
-            pedido.save()
-            
             # Crear los detalles del pedido desde el carrito
-            productos_data = []
-            for producto_id, datos in carrito.items():
-                DetallePedido.objects.create(
-                    pedido=pedido,
+            detalles = [
+                DetallePedido(
                     producto_nombre=datos['nombre'],
                     cantidad=datos['cantidad'],
-                    precio_unitario=datos['precio']
+                    precio_unitario=Decimal(str(datos['precio']))
                 )
-                productos_data.append(datos)
+                for datos in carrito.values()
+            ]
+            productos_data = list(carrito.values())
+            
+            # El pedido y sus detalles se guardan juntos, con los totales ya calculados
+            with transaction.atomic():
+                pedido = form.save(commit=False)
+                pedido.usuario_creacion = request.user
+                pedido.total = sum((detalle.precio_total for detalle in detalles), Decimal('0'))
+                pedido.num_items = len(detalles)
+                pedido.save()
+                for detalle in detalles:
+                    detalle.pedido = pedido
+                DetallePedido.objects.bulk_create(detalles)
             
             # Limpiar el carrito después de crear el pedido
             request.session['carrito'] = {}
@@ -958,7 +1017,7 @@ def exportar_pedido_excel(request, pedido_id):
         messages.error(request, 'La librería openpyxl no está instalada.')
         return redirect('pedidos')
     
-    pedido = get_object_or_404(Pedido, id=pedido_id)
+    pedido = get_object_or_404(Pedido.objects.select_related('usuario_creacion'), id=pedido_id)
     detalles = pedido.detalles.all()
     
     # Crear un libro de trabajo Excel
@@ -996,15 +1055,13 @@ def exportar_pedido_excel(request, pedido_id):
     
     # Datos
     row = 8
-    total_general = 0
+    total_general = pedido.total
     for detalle in detalles:
         ws[f'A{row}'] = detalle.producto_nombre
         ws[f'B{row}'] = detalle.cantidad
         ws[f'C{row}'] = float(detalle.precio_unitario)
         ws[f'C{row}'].number_format = '#,##0.00'
-        total_detalle = detalle.precio_total
-        total_general += total_detalle
-        ws[f'D{row}'] = float(total_detalle)
+        ws[f'D{row}'] = float(detalle.precio_total)
         ws[f'D{row}'].number_format = '#,##0.00'
         row += 1
     
@@ -1508,25 +1565,18 @@ def eliminar_asistencia_view(request, asistencia_id):
     return render(request, 'core/eliminar_asistencia.html', {'asistencia': asistencia})
 
 
+@pagina_condicional('index')
 def index_view(request):
     """Vista para la página principal"""
-    # Obtener imágenes activas del carrusel ordenadas por orden
-    imagenes_carrusel = list(ImagenCarrusel.objects.filter(activo=True).order_by('orden', 'fecha_creacion'))
-    
-    # Crear una lista de imágenes - solo mostrar las imágenes reales disponibles
-    imagenes_completas = []
-    
-    # Agregar las imágenes reales ordenadas por su campo 'orden'
-    for imagen in imagenes_carrusel:
-        imagenes_completas.append({
-            'tipo': 'real',
-            'imagen': imagen,
-            'indice': imagen.orden if imagen.orden > 0 else len(imagenes_completas) + 1,
-            'titulo_barista': imagen.titulo_barista if imagen.orden == 1 else None
-        })
-    
-    # Ordenar por índice (orden) para asegurar el orden correcto
-    imagenes_completas.sort(key=lambda x: x['indice'])
+    from .portada import DURACION_CACHE, guardar_pagina, imagenes_carrusel, pagina_en_cache, version_portada
+
+    version = version_portada()
+    # Solo los visitantes anónimos sin mensajes pendientes reciben la página compartida
+    pagina_compartida = not request.user.is_authenticated and not len(messages.get_messages(request))
+    if pagina_compartida:
+        respuesta = pagina_en_cache(version)
+        if respuesta is not None:
+            return respuesta
     
     # Obtener eventos activos (ordenados por fecha del evento, más recientes primero)
     eventos = Evento.objects.filter(activo=True).order_by('-fecha_evento')[:1]  # Solo el más reciente
@@ -1534,13 +1584,20 @@ def index_view(request):
     # Obtener noticias activas (ordenadas por fecha de publicación, más recientes primero)
     noticias = Noticia.objects.filter(activo=True).order_by('-fecha_publicacion')[:1]  # Solo la más reciente
     
-    return render(request, 'core/index.html', {
-        'imagenes_carrusel': imagenes_completas,
+    # Las consultas son perezosas: solo se ejecutan si el fragmento no está en el caché
+    respuesta = render(request, 'core/index.html', {
+        'version_portada': version,
+        'duracion_cache': DURACION_CACHE,
+        'imagenes_carrusel': imagenes_carrusel,
         'eventos': eventos,
         'noticias': noticias
     })
+    if pagina_compartida:
+        guardar_pagina(version, respuesta)
+    return respuesta
 
 
+@pagina_condicional('documentacion')
 def documentacion_view(request):
     """Vista para mostrar la documentación (reglamento interno y manual de operaciones)"""
     # Obtener los documentos activos más recientes de cada tipo
@@ -1570,85 +1627,28 @@ def reglamento_interno_view(request):
         return redirect('index')
 
 
-def inicializar_contactos_default():
-    """Función para inicializar los contactos por defecto si no existen"""
-    contactos_default = [
-        {
-            'nombre': 'Gerente General',
-            'cargo': 'Gerente General',
-            'email': 'gerente.general@popupnescafe.cl',
-            'telefono': '+56 9 XXXX XXXX',
-            'orden': 1,
-        },
-        {
-            'nombre': 'Gerente de Operaciones',
-            'cargo': 'Gerente de Operaciones',
-            'email': 'operaciones@popupnescafe.cl',
-            'telefono': '+56 9 XXXX XXXX',
-            'orden': 2,
-        },
-        {
-            'nombre': 'Gerente de Recursos Humanos',
-            'cargo': 'Gerente de RRHH',
-            'email': 'rrhh@popupnescafe.cl',
-            'telefono': '+56 9 XXXX XXXX',
-            'orden': 3,
-        },
-        {
-            'nombre': 'Gerente de Marketing',
-            'cargo': 'Gerente de Marketing',
-            'email': 'marketing@popupnescafe.cl',
-            'telefono': '+56 9 XXXX XXXX',
-            'orden': 4,
-        },
-        {
-            'nombre': 'Gerente de Finanzas',
-            'cargo': 'Gerente de Finanzas',
-            'email': 'finanzas@popupnescafe.cl',
-            'telefono': '+56 9 XXXX XXXX',
-            'orden': 5,
-        }
-    ]
-    
-    # Verificar si ya existen contactos
-    if Contacto.objects.count() == 0:
-        for contacto_data in contactos_default:
-            Contacto.objects.create(
-                nombre=contacto_data['nombre'],
-                cargo=contacto_data['cargo'],
-                email=contacto_data['email'],
-                telefono=contacto_data['telefono'],
-                orden=contacto_data['orden'],
-                activo=True
-            )
-
-
+@pagina_condicional('contactanos')
 def contactanos_view(request):
     """Vista para la página de contáctanos"""
+    from .contactos import contactos_activos
+
     # Verificar si el usuario está autenticado
     usuario_autenticado = request.user.is_authenticated
     
-    # Inicializar contactos por defecto si no existen
-    inicializar_contactos_default()
-    
-    # Obtener contactos activos de la base de datos
-    try:
-        contactos = Contacto.objects.filter(activo=True).order_by('orden', 'nombre')
-    except:
-        # Si hay error, usar lista vacía (el template manejará el caso vacío)
-        contactos = []
-    
+    # Contactos activos desde el caché (los por defecto los crea la migración 0028)
     return render(request, 'core/contactanos.html', {
-        'contactos': contactos,
+        'contactos': contactos_activos(),
         'usuario_autenticado': usuario_autenticado
     })
 
 
+@pagina_condicional('equipo')
 def equipo_view(request):
     """Vista para la página de conoce al equipo"""
     return render(request, 'core/equipo.html')
 
 
+@pagina_condicional('creditos')
 def creditos_view(request):
     """Vista para la página de créditos y agradecimientos"""
     return render(request, 'core/creditos.html')
@@ -1663,9 +1663,6 @@ def gestionar_contactos_view(request):
         messages.error(request, 'No tienes permisos para acceder a esta sección')
         return redirect('panel')
     
-    # Inicializar contactos por defecto si no existen
-    inicializar_contactos_default()
-    
     contactos = Contacto.objects.all().order_by('orden', 'nombre')
     return render(request, 'core/gestionar_contactos.html', {'contactos': contactos})
 
@@ -1698,6 +1695,9 @@ def editar_contacto_view(request, contacto_id):
             if form.cleaned_data.get('eliminar_imagen') and not form.cleaned_data.get('imagen'):
                 Contacto.objects.filter(id=contacto.id).update(imagen=None)
                 contacto.refresh_from_db()
+                # update() no envía post_save
+                from .contactos import invalidar_contactos
+                invalidar_contactos()
             
             # Registrar auditoría
             from .utils import registrar_auditoria
@@ -2050,18 +2050,10 @@ def cambiar_stock_view(request):
     if request.user.cambio_password_requerido:
         return redirect('cambiar_password')
     
-    # Obtener todos los productos
-    productos = Inventario.objects.all().order_by('categoria', 'nombre')
-    
-    # Organizar productos por categoría
-    bodega = productos.filter(categoria='bodega')
-    meson = productos.filter(categoria='meson')
-    limpieza = productos.filter(categoria='limpieza')
+    from .catalogo import catalogo_por_categoria
     
     return render(request, 'core/cambiar_stock.html', {
-        'bodega': bodega,
-        'meson': meson,
-        'limpieza': limpieza,
+        'categorias': catalogo_por_categoria(request),
         'usuario': request.user
     })
 
@@ -2084,32 +2076,47 @@ def actualizar_stock_view(request, producto_id):
         messages.error(request, 'Producto no encontrado')
         return redirect('cambiar_stock')
     
-    form = CambiarStockForm(initial={'cantidad': producto.cantidad})
+    form = CambiarStockForm(initial={'cantidad': producto.cantidad, 'version': producto.version_stock})
     
     if request.method == 'POST':
         form = CambiarStockForm(request.POST)
         if form.is_valid():
-            cantidad_anterior = producto.cantidad
-            nueva_cantidad = form.cleaned_data['cantidad']
-            producto.cantidad = nueva_cantidad
-            producto.save()
-            # Registrar auditoría de cambio de stock
-            from .utils import registrar_auditoria
-            registrar_auditoria(
-                usuario=request.user,
-                accion='inventario_stock_change',
-                modulo='inventario',
-                descripcion=f'Stock de "{producto.nombre}" cambió de {cantidad_anterior} a {nueva_cantidad} unidades',
-                objeto_afectado=producto.nombre,
-                detalles={
-                    'cantidad_anterior': cantidad_anterior,
-                    'cantidad_nueva': nueva_cantidad,
-                    'diferencia': nueva_cantidad - cantidad_anterior,
-                    'categoria': producto.categoria,
-                }
-            )
-            messages.success(request, f'Stock de "{producto.nombre}" actualizado a {nueva_cantidad} unidades')
-            return redirect('cambiar_stock')
+            operacion = form.cleaned_data['operacion']
+            cantidad = form.cleaned_data['cantidad']
+            try:
+                # Los cambios se aplican con UPDATE atómicos sobre la fila (ver Inventario.ajustar_stock/fijar_stock)
+                if operacion == 'fijar':
+                    cantidad_anterior, nueva_cantidad = producto.fijar_stock(cantidad, version=form.cleaned_data['version'], usuario=request.user)
+                else:
+                    delta = cantidad if operacion == 'sumar' else -cantidad
+                    cantidad_anterior, nueva_cantidad = producto.ajustar_stock(delta, usuario=request.user)
+            except ConflictoStockError:
+                messages.error(request, f'El stock de "{producto.nombre}" fue modificado por otro usuario mientras lo editabas. Revisa la cantidad actual e intenta nuevamente.')
+                return redirect('actualizar_stock', producto_id=producto.id)
+            except Inventario.DoesNotExist:
+                messages.error(request, 'Producto no encontrado')
+                return redirect('cambiar_stock')
+            except ValidationError as e:
+                form.add_error('cantidad', e)
+            else:
+                # Registrar auditoría de cambio de stock
+                from .utils import registrar_auditoria
+                registrar_auditoria(
+                    usuario=request.user,
+                    accion='inventario_stock_change',
+                    modulo='inventario',
+                    descripcion=f'Stock de "{producto.nombre}" cambió de {cantidad_anterior} a {nueva_cantidad} unidades',
+                    objeto_afectado=producto.nombre,
+                    detalles={
+                        'cantidad_anterior': cantidad_anterior,
+                        'cantidad_nueva': nueva_cantidad,
+                        'diferencia': nueva_cantidad - cantidad_anterior,
+                        'operacion': operacion,
+                        'categoria': producto.categoria,
+                    }
+                )
+                messages.success(request, f'Stock de "{producto.nombre}" actualizado a {nueva_cantidad} unidades')
+                return redirect('cambiar_stock')
     
     return render(request, 'core/actualizar_stock.html', {
         'producto': producto,
@@ -2119,69 +2126,275 @@ def actualizar_stock_view(request, producto_id):
 
 
 @login_required
-def auditoria_view(request):
-    """Vista para ver los registros de auditoría"""
-    # Solo administradores pueden ver la auditoría
-    if not (request.user._es_administrador or request.user.is_superuser):
-        messages.error(request, 'No tienes permisos para acceder a esta sección')
+def conteo_stock_view(request):
+    """Vista para que colaboradores ingresen el conteo de stock de todos los productos en un solo envío"""
+    # Solo usuarios colaboradores pueden cambiar stock
+    if not request.user.es_colaborador:
+        messages.error(request, 'Solo los usuarios colaboradores pueden cambiar el stock')
         return redirect('panel')
     
-    # Obtener todos los registros de auditoría
+    # Si el usuario necesita cambiar su contraseña, redirigir primero
+    if request.user.cambio_password_requerido:
+        return redirect('cambiar_password')
+    
+    productos = list(Inventario.objects.only('id', 'nombre', 'categoria', 'cantidad', 'fecha_actualizacion').order_by('categoria', 'nombre'))
+    
+    if request.method == 'POST':
+        formset = ConteoStockFormSet(request.POST)
+        if formset.is_valid():
+            conteos = {
+                form.cleaned_data['producto_id']: (form.cleaned_data['cantidad'], form.cleaned_data['version'])
+                for form in formset
+                if form.cleaned_data.get('cantidad') is not None
+            }
+            ahora = timezone.now()
+            cambios = []
+            conflictos = []
+            movimientos = []
+            entradas_auditoria = []
+            
+            with transaction.atomic():
+                # Bloquear las filas para que la cantidad anterior auditada sea la real
+                actuales = Inventario.objects.select_for_update().in_bulk(list(conteos))
+                for producto_id, (nueva_cantidad, version) in conteos.items():
+                    producto = actuales.get(producto_id)
+                    if producto is None or producto.cantidad == nueva_cantidad:
+                        continue
+                    if version is not None and producto.fecha_actualizacion != version:
+                        # Otro usuario cambió este stock después de abrir el conteo: no sobrescribirlo
+                        conflictos.append(producto.nombre)
+                        continue
+                    cantidad_anterior = producto.cantidad
+                    producto.cantidad = nueva_cantidad
+                    # bulk_update no actualiza los campos auto_now
+                    producto.fecha_actualizacion = ahora
+                    cambios.append(producto)
+                    movimientos.append(MovimientoStock(
+                        producto=producto, delta=nueva_cantidad - cantidad_anterior, motivo='conteo', usuario=request.user, fecha=ahora,
+                    ))
+                    entradas_auditoria.append({
+                        'descripcion': f'Stock de "{producto.nombre}" cambió de {cantidad_anterior} a {nueva_cantidad} unidades (conteo masivo)',
+                        'objeto_afectado': producto.nombre,
+                        'detalles': {
+                            'cantidad_anterior': cantidad_anterior,
+                            'cantidad_nueva': nueva_cantidad,
+                            'diferencia': nueva_cantidad - cantidad_anterior,
+                            'categoria': producto.categoria,
+                        },
+                    })
+                
+                Inventario.objects.bulk_update(cambios, ['cantidad', 'fecha_actualizacion'])
+                MovimientoStock.objects.bulk_create(movimientos)
+                if cambios:
+                    # bulk_update no envía post_save
+                    from .catalogo import invalidar_catalogo
+                    invalidar_catalogo()
+                from .utils import registrar_auditoria_lote
+                registrar_auditoria_lote(request.user, 'inventario_stock_change', 'inventario', entradas_auditoria)
+            
+            if cambios:
+                messages.success(request, f'Conteo guardado: {len(cambios)} producto(s) actualizado(s)')
+            elif not conflictos:
+                messages.info(request, 'Conteo guardado: no hubo cambios de stock')
+            if conflictos:
+                messages.warning(request, f'No se guardó el conteo de {", ".join(conflictos)}: otro usuario modificó su stock mientras contabas. Revisa la cantidad actual.')
+            return redirect('cambiar_stock')
+    else:
+        formset = ConteoStockFormSet(initial=[
+            {'producto_id': producto.id, 'cantidad': producto.cantidad, 'version': producto.version_stock} for producto in productos
+        ])
+    
+    # Agrupar cada formulario con su producto, por categoría
+    productos_por_id = {producto.id: producto for producto in productos}
+    categorias = {valor: {'nombre': nombre, 'filas': []} for valor, nombre in Inventario.CATEGORIA_CHOICES}
+    for form in formset:
+        try:
+            producto = productos_por_id.get(int(form['producto_id'].value()))
+        except (TypeError, ValueError):
+            producto = None
+        if producto is not None:
+            categoria = categorias.setdefault(producto.categoria, {'nombre': producto.categoria, 'filas': []})
+            categoria['filas'].append({'form': form, 'producto': producto})
+    
+    return render(request, 'core/conteo_stock.html', {
+        'formset': formset,
+        'categorias': categorias.values(),
+        'usuario': request.user
+    })
+
+
+def _filtrar_auditoria(request):
+    """Aplica los filtros de la URL a los registros de auditoría y retorna (queryset, filtros)"""
     registros = Auditoria.objects.all().select_related('usuario')
     
     # Filtros
-    modulo_filter = request.GET.get('modulo', '')
-    accion_filter = request.GET.get('accion', '')
-    usuario_filter = request.GET.get('usuario', '')
-    fecha_desde = request.GET.get('fecha_desde', '')
-    fecha_hasta = request.GET.get('fecha_hasta', '')
-    search_query = request.GET.get('search', '')
+    filtros = {
+        'modulo_filter': request.GET.get('modulo', ''),
+        'accion_filter': request.GET.get('accion', ''),
+        'usuario_filter': request.GET.get('usuario', ''),
+        'fecha_desde': request.GET.get('fecha_desde', ''),
+        'fecha_hasta': request.GET.get('fecha_hasta', ''),
+        'search_query': request.GET.get('search', ''),
+    }
     
     # Aplicar filtros
-    if modulo_filter:
-        registros = registros.filter(modulo=modulo_filter)
-    if accion_filter:
-        registros = registros.filter(accion=accion_filter)
-    if usuario_filter:
-        registros = registros.filter(usuario_id=usuario_filter)
-    if fecha_desde:
-        registros = registros.filter(fecha_hora__date__gte=fecha_desde)
-    if fecha_hasta:
-        registros = registros.filter(fecha_hora__date__lte=fecha_hasta)
-    if search_query:
-        registros = registros.filter(
-            Q(descripcion__icontains=search_query) |
-            Q(objeto_afectado__icontains=search_query) |
-            Q(usuario__username__icontains=search_query) |
-            Q(usuario__nombre__icontains=search_query) |
-            Q(usuario__apellido__icontains=search_query)
-        )
+    if filtros['modulo_filter']:
+        registros = registros.filter(modulo=filtros['modulo_filter'])
+    if filtros['accion_filter']:
+        registros = registros.filter(accion=filtros['accion_filter'])
+    if filtros['usuario_filter']:
+        registros = registros.filter(usuario_id=filtros['usuario_filter'])
+    if filtros['fecha_desde']:
+        registros = registros.filter(fecha_hora__date__gte=filtros['fecha_desde'])
+    if filtros['fecha_hasta']:
+        registros = registros.filter(fecha_hora__date__lte=filtros['fecha_hasta'])
+    if filtros['search_query']:
+        # Búsqueda sobre el índice de texto completo (ver core.busqueda)
+        from .busqueda import buscar_auditoria
+        registros = buscar_auditoria(registros, filtros['search_query'])
+    
+    return registros, filtros
+
+
+def _obtener_archivo_auditoria(request):
+    """Retorna el ArchivoAuditoria del mes indicado en ?archivo=AAAA-MM, o None"""
+    valor = request.GET.get('archivo', '')
+    if not valor:
+        return None
+    try:
+        from datetime import datetime
+        mes = datetime.strptime(valor, '%Y-%m').date()
+    except ValueError:
+        return None
+    return ArchivoAuditoria.objects.filter(mes=mes).first()
+
+
+def _pagina_auditoria(request):
+    """
+    Retorna (registros de la página, cursor siguiente, filtros, archivo) para el visor de auditoría.
+    Si se eligió un mes archivado, los registros se leen de ese archivo (solo lectura).
+    """
+    from .utils import paginar_por_cursor
+    registros, filtros = _filtrar_auditoria(request)
+    archivo = _obtener_archivo_auditoria(request)
+    
+    if archivo:
+        from .archivo_auditoria import leer_archivo, filtrar_registros_archivados
+        registros = filtrar_registros_archivados(leer_archivo(archivo), filtros)
+    
+    # Paginación por cursor: solo se cargan AUDITORIA_PAGE_SIZE registros por página.
+    # Con búsqueda, los resultados van del más relevante al menos relevante (ver core.busqueda)
+    por_rango = bool(filtros['search_query']) and not archivo
+    registros, siguiente_cursor = paginar_por_cursor(
+        registros, request.GET.get('cursor'), AUDITORIA_PAGE_SIZE, por_rango=por_rango
+    )
+    return registros, siguiente_cursor, filtros, archivo
+
+
+@login_required
+def auditoria_view(request):
+    """Vista para ver los registros de auditoría"""
+    # Solo administradores pueden ver la auditoría
+    if not (request.user._es_administrador or request.user.is_superuser):
+        messages.error(request, 'No tienes permisos para acceder a esta sección')
+        return redirect('panel')
     
-    # Ordenar por fecha más reciente
-    registros = registros.order_by('-fecha_hora')
+    registros, siguiente_cursor, filtros, archivo = _pagina_auditoria(request)
     
-    # Paginación (opcional, por ahora mostramos todos)
-    # registros = registros[:100]  # Limitar a los últimos 100 registros
+    # Obtener opciones para los filtros (solo las columnas usadas por el selector)
+    usuarios = Usuario.objects.only('id', 'username', 'nombre', 'apellido').order_by('username')
+    archivos = ArchivoAuditoria.objects.only('mes', 'cantidad')
     
-    # Obtener opciones para los filtros
-    usuarios = Usuario.objects.all().order_by('username')
+    # Parámetros de filtro sin el cursor, para construir los enlaces de "cargar más"
+    parametros = request.GET.copy()
+    parametros.pop('cursor', None)
     
     context = {
         'registros': registros,
+        'siguiente_cursor': siguiente_cursor,
+        'parametros_filtro': parametros.urlencode(),
         'usuarios': usuarios,
+        'archivos': archivos,
+        'archivo': archivo,
+        'archivo_filter': request.GET.get('archivo', ''),
         'modulos': Auditoria.MODULO_CHOICES,
         'acciones': Auditoria.ACCION_CHOICES,
-        'modulo_filter': modulo_filter,
-        'accion_filter': accion_filter,
-        'usuario_filter': usuario_filter,
-        'fecha_desde': fecha_desde,
-        'fecha_hasta': fecha_hasta,
-        'search_query': search_query,
+        **filtros,
     }
     
     return render(request, 'core/auditoria.html', context)
 
 
+@login_required
+def auditoria_mas_view(request):
+    """Vista JSON que entrega la siguiente página de registros de auditoría ("cargar más")"""
+    if not (request.user._es_administrador or request.user.is_superuser):
+        return JsonResponse({'error': 'No tienes permisos para acceder a esta sección'}, status=403)
+    
+    registros, siguiente_cursor, filtros, archivo = _pagina_auditoria(request)
+    
+    html = render_to_string('core/auditoria_filas.html', {'registros': registros}, request=request)
+    return JsonResponse({
+        'html': html,
+        'cantidad': len(registros),
+        'siguiente_cursor': siguiente_cursor,
+    })
+
+
+@login_required
+def metricas_view(request):
+    """Vista de métricas de rendimiento por vista (percentiles de tiempo y consultas a la BD)"""
+    if not (request.user._es_administrador or request.user.is_superuser):
+        messages.error(request, 'No tienes permisos para acceder a esta sección')
+        return redirect('panel')
+    
+    from django.conf import settings
+    from .metricas import metricas
+    
+    if request.method == 'POST':
+        metricas.limpiar()
+        messages.success(request, 'Métricas reiniciadas.')
+        return redirect('metricas')
+    
+    resumen = metricas.resumen()
+    if request.GET.get('formato') == 'json':
+        return JsonResponse({'activas': settings.METRICAS_ACTIVAS, 'rutas': resumen})
+    
+    return render(request, 'core/metricas.html', {
+        'resumen': resumen,
+        'metricas_activas': settings.METRICAS_ACTIVAS,
+    })
+
+
+@login_required
+def tareas_view(request):
+    """Vista del estado de las tareas en segundo plano (cola de core.tareas, ejecutada por run_worker)"""
+    if not (request.user._es_administrador or request.user.is_superuser):
+        messages.error(request, 'No tienes permisos para acceder a esta sección')
+        return redirect('panel')
+    
+    if request.method == 'POST':
+        reintentadas = Tarea.objects.filter(estado='fallida').update(
+            estado='pendiente', intentos=0, disponible_desde=timezone.now(), fecha_fin=None
+        )
+        messages.success(request, f'{reintentadas} tarea(s) fallida(s) devuelta(s) a la cola.')
+        return redirect('tareas')
+    
+    conteos = dict(Tarea.objects.values('estado').annotate(total=Count('id')).values_list('estado', 'total'))
+    resumen = [{'valor': valor, 'nombre': nombre, 'total': conteos.get(valor, 0)} for valor, nombre in Tarea.ESTADO_CHOICES]
+    
+    estado = request.GET.get('estado', '')
+    tareas = Tarea.objects.all()
+    if estado in dict(Tarea.ESTADO_CHOICES):
+        tareas = tareas.filter(estado=estado)
+    
+    return render(request, 'core/tareas.html', {
+        'resumen': resumen,
+        'tareas': tareas[:TAREAS_PAGE_SIZE],
+        'estado': estado,
+    })
+
+
 # ==================== GESTIÓN DE CARRUSEL ====================
 
 @login_required